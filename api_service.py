@@ -0,0 +1,310 @@
+"""Async HTTP API exposing audits, job status and report downloads.
+
+Run with:
+    uvicorn api_service:create_app --factory --host 0.0.0.0 --port 8000
+    MODEL_BACKEND=fake uvicorn api_service:create_app --factory   # offline, no Gemini calls
+
+Endpoints:
+    POST /jobs?agents=A&agents=B        body: the tawk.to export ZIP -> 202 {"job_id": ...} (503 without a model)
+    POST /jobs?since=2024-03-01&until=2024-04-01   only chats started in that window (until exclusive)
+    GET  /jobs/{job_id}                 job status and per-agent progress
+    GET  /jobs/{job_id}/agents/{agent}/audit          audit_data JSON
+    GET  /jobs/{job_id}/agents/{agent}/report.pdf     streamed PDF
+    GET  /jobs/{job_id}/agents/{agent}/report.xlsx    streamed Excel workbook
+    GET  /jobs/{job_id}/agents/{agent}/report.form.xlsx   QA review form filled from template.xlsx
+    GET  /jobs/{job_id}/reports.zip?formats=pdf&formats=xlsx  every finished agent's reports, streamed
+    GET  /metrics                       Prometheus metrics
+    GET  /healthz
+
+Blocking work (ZIP parsing, model calls, report rendering) runs in worker
+threads, so a single event loop keeps serving other clients while audits run.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import date, datetime
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from audit_engine import run_comprehensive_audit
+from chat_index import chat_keys
+from extraction import get_all_agents_from_zip, get_transcripts_for_agents
+from instrumentation import METRICS
+from model_backends import create_backend
+from reports import generate_excel_report, generate_pdf_report, generate_template_excel_report, write_report_archive
+
+# Largest export accepted by POST /jobs
+MAX_UPLOAD_BYTES = int(os.environ.get("AUDIT_API_MAX_UPLOAD_MB", "500")) * 1024 * 1024
+STREAM_CHUNK_BYTES = 64 * 1024
+
+REPORT_FORMATS = {
+    "pdf": (generate_pdf_report, "application/pdf"),
+    "xlsx": (generate_excel_report, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "form.xlsx": (generate_template_excel_report, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+logger = logging.getLogger("auditor.api_service")
+
+
+def model_from_environment():
+    """Build the backend named by MODEL_BACKEND (default gemini, which needs GEMINI_API_KEY)"""
+    backend = os.environ.get("MODEL_BACKEND", "gemini")
+    if backend == "fake":
+        return create_backend("fake")
+    api_key = os.environ.get("GEMINI_API_KEY")
+    return create_backend("gemini", api_key=api_key) if api_key else None
+
+
+class AuditJob:
+    """One uploaded export and the audits requested for it"""
+
+    def __init__(self, job_id, export_path, agents, since=None, until=None):
+        self.job_id = job_id
+        self.export_path = export_path
+        self.since = since
+        self.until = until
+        self.agents = {name: {"status": "queued", "chats": 0, "score": None} for name in agents}
+        self.results = {}
+        self.reports = {}
+        # One lock per (agent, format), so concurrent downloads render a report once
+        self.report_locks = {}
+        self.status = "queued"
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.finished_at = None
+
+    def to_dict(self):
+        done = sum(1 for a in self.agents.values() if a["status"] in ("success", "failed", "no_chats"))
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "since": self.since.isoformat() if self.since else None,
+            "until": self.until.isoformat() if self.until else None,
+            "progress": {"done": done, "total": len(self.agents)},
+            "agents": self.agents,
+        }
+
+
+class JobManager:
+    """Runs audit jobs on the event loop, pushing blocking work to threads"""
+
+    def __init__(self, model, concurrency=4, workdir=None):
+        self.model = model
+        self.workdir = workdir or tempfile.mkdtemp(prefix="audit_api_")
+        self.jobs = {}
+        self._model_slots = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+
+    async def submit(self, job_id, export_path, agents, since=None, until=None):
+        if not agents:
+            agents = await asyncio.to_thread(get_all_agents_from_zip, export_path)
+        job = AuditJob(job_id, export_path, agents, since, until)
+        self.jobs[job_id] = job
+        task = asyncio.create_task(self._run(job))
+        # Keep a reference so the task is not garbage-collected mid-run
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job):
+        job.status = "running"
+        for state in job.agents.values():
+            state["status"] = "extracting"
+        try:
+            # Read the export once for every agent in the job
+            extracted = await asyncio.to_thread(get_transcripts_for_agents, job.export_path, list(job.agents),
+                                                since=job.since, until=job.until)
+            await asyncio.gather(*(self._audit_agent(job, name, *extracted[name]) for name in job.agents))
+        except Exception as e:
+            logger.exception("Job %s failed", job.job_id)
+            job.status = "failed"
+            job.error = str(e)
+            for state in job.agents.values():
+                if state["status"] not in ("success", "failed", "no_chats"):
+                    state["status"] = "failed"
+        else:
+            job.status = "completed"
+        job.finished_at = datetime.now().isoformat()
+
+    async def _audit_agent(self, job, agent_name, transcripts, metadata):
+        state = job.agents[agent_name]
+        state["chats"] = len(transcripts)
+        if not transcripts:
+            state["status"] = "no_chats"
+            return
+        state["status"] = "queued"
+        async with self._model_slots:
+            state["status"] = "auditing"
+            try:
+                audit_result = await asyncio.to_thread(run_comprehensive_audit, transcripts, agent_name, self.model,
+                                                       chat_ids=chat_keys(transcripts, metadata))
+            except Exception:
+                logger.exception("Audit of %s failed in job %s", agent_name, job.job_id)
+                audit_result = None
+        if audit_result:
+            job.results[agent_name] = {
+                "name": agent_name,
+                "audit_data": audit_result,
+                "total_chats": len(transcripts),
+            }
+            state["score"] = audit_result.get("overall_score")
+            state["status"] = "success"
+        else:
+            state["status"] = "failed"
+
+    async def report_path(self, job, agent_name, fmt):
+        """Render (once) and return the path of an agent's report"""
+        key = (agent_name, fmt)
+        async with job.report_locks.setdefault(key, asyncio.Lock()):
+            if key not in job.reports:
+                writer, _ = REPORT_FORMATS[fmt]
+                safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in agent_name)
+                path = os.path.join(self.workdir, job.job_id, f"{safe_name}_Performance_Review.{fmt}")
+                await asyncio.to_thread(writer, job.results[agent_name], agent_name, path)
+                job.reports[key] = path
+        return job.reports[key]
+
+
+async def _stream_file(path):
+    """Yield a file in chunks without holding it in memory"""
+    with open(path, "rb") as f:
+        async for chunk in _stream_handle(f):
+            yield chunk
+
+
+async def _stream_handle(f):
+    """Yield an open file object in chunks, closing it when done"""
+    with f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+
+def create_app(model=None, concurrency=None, workdir=None):
+    """Build the ASGI app; pass a FakeGeminiBackend as model for local testing"""
+    manager = JobManager(
+        model if model is not None else model_from_environment(),
+        concurrency or int(os.environ.get("AUDIT_API_CONCURRENCY", "4")),
+        workdir,
+    )
+
+    def get_job(request):
+        return manager.jobs.get(request.path_params["job_id"])
+
+    async def submit_job(request):
+        if manager.model is None:
+            return JSONResponse({"error": "no model configured (set GEMINI_API_KEY or MODEL_BACKEND=fake)"},
+                                status_code=503)
+        try:
+            since, until = (date.fromisoformat(request.query_params[key]) if request.query_params.get(key) else None
+                            for key in ("since", "until"))
+        except ValueError:
+            return JSONResponse({"error": "since/until must be YYYY-MM-DD dates"}, status_code=400)
+
+        # Reports for this job are written next to its export
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(manager.workdir, job_id)
+        os.makedirs(job_dir)
+        export_path = os.path.join(job_dir, "export.zip")
+        received = 0
+        # Spool the upload straight to disk
+        with open(export_path, "wb") as f:
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > MAX_UPLOAD_BYTES:
+                    f.close()
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                    return JSONResponse({"error": "export too large"}, status_code=413)
+                f.write(chunk)
+        if not received:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            return JSONResponse({"error": "request body must be the export ZIP"}, status_code=400)
+
+        try:
+            job = await manager.submit(job_id, export_path, request.query_params.getlist("agents"), since, until)
+        except Exception as e:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            return JSONResponse({"error": f"could not read export: {e}"}, status_code=400)
+        return JSONResponse(job.to_dict(), status_code=202)
+
+    async def job_status(request):
+        job = get_job(request)
+        if job is None:
+            return JSONResponse({"error": "job not found"}, status_code=404)
+        return JSONResponse(job.to_dict())
+
+    async def agent_audit(request):
+        job = get_job(request)
+        agent_name = request.path_params["agent"]
+        if job is None or agent_name not in job.agents:
+            return JSONResponse({"error": "job or agent not found"}, status_code=404)
+        if agent_name not in job.results:
+            return JSONResponse({"error": "audit not available", **job.agents[agent_name]}, status_code=409)
+        return JSONResponse(job.results[agent_name]["audit_data"])
+
+    async def agent_report(request):
+        job = get_job(request)
+        agent_name = request.path_params["agent"]
+        fmt = request.path_params["fmt"]
+        if job is None or agent_name not in job.agents or fmt not in REPORT_FORMATS:
+            return JSONResponse({"error": "job, agent or format not found"}, status_code=404)
+        if agent_name not in job.results:
+            return JSONResponse({"error": "audit not available", **job.agents[agent_name]}, status_code=409)
+        path = await manager.report_path(job, agent_name, fmt)
+        filename = os.path.basename(path)
+        return StreamingResponse(
+            _stream_file(path),
+            media_type=REPORT_FORMATS[fmt][1],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"',
+                     "Content-Length": str(os.path.getsize(path))},
+        )
+
+    async def job_archive(request):
+        job = get_job(request)
+        if job is None:
+            return JSONResponse({"error": "job not found"}, status_code=404)
+        formats = request.query_params.getlist("formats") or ["pdf"]
+        unknown = [fmt for fmt in formats if fmt not in REPORT_FORMATS]
+        if unknown:
+            return JSONResponse({"error": f"unknown formats: {', '.join(unknown)}"}, status_code=404)
+        if not job.results:
+            return JSONResponse({"error": "no finished audits in this job"}, status_code=409)
+        # Snapshot results so agents finishing mid-render don't change the archive
+        archive = await asyncio.to_thread(write_report_archive, list(job.results.items()), formats)
+        size = await asyncio.to_thread(archive.seek, 0, os.SEEK_END)
+        archive.seek(0)
+        return StreamingResponse(
+            _stream_handle(archive),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="audit_{job.job_id}_reports.zip"',
+                     "Content-Length": str(size)},
+        )
+
+    async def metrics(request):
+        return PlainTextResponse(METRICS.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    async def healthz(request):
+        return JSONResponse({"status": "ok", "model": getattr(manager.model, "name", None),
+                             "jobs": len(manager.jobs)})
+
+    app = Starlette(routes=[
+        Route("/jobs", submit_job, methods=["POST"]),
+        Route("/jobs/{job_id}", job_status),
+        Route("/jobs/{job_id}/agents/{agent}/audit", agent_audit),
+        Route("/jobs/{job_id}/agents/{agent}/report.{fmt}", agent_report),
+        Route("/jobs/{job_id}/reports.zip", job_archive),
+        Route("/metrics", metrics),
+        Route("/healthz", healthz),
+    ])
+    app.state.jobs = manager
+    return app
@@ -1,22 +1,45 @@
 import streamlit as st
 import pandas as pd
-import io
 import os
-import google.generativeai as genai
 import json
-import zipfile
+import tempfile
+import time
+import uuid
 from datetime import datetime, timedelta
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Table, TableStyle
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
-from reportlab.pdfgen import canvas
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.utils import get_column_letter
+from extraction import get_agent_transcripts, get_all_agents_from_zip, get_transcripts_for_agents
+from audit_engine import run_adaptive_audit, run_comprehensive_audit as run_audit_with_model, run_tiered_audit
+from model_backends import create_backend
+from instrumentation import METRICS, configure as configure_metrics, instrumented, start_metrics_server
+from chat_index import ChatIndex, DEFAULT_CHAT_INDEX_PATH
+from reports import (
+    generate_pdf_report,
+    generate_excel_report,
+    generate_team_excel_report,
+    generate_team_pdf_report,
+    generate_template_excel_report,
+    write_report_archive,
+)
+from audit_store import open_audit_store, compute_audit_key, AgentLockHeartbeat, DEFAULT_STORE_URL, DEFAULT_TEAM
+from scoring import load_weight_profiles, rescore_history
+from team_analytics import (
+    ANALYTICS_METRICS,
+    compare_agents,
+    leaderboard,
+    metric_distributions,
+    severity_totals,
+    team_overview,
+    weekly_team_facts,
+)
+from scheduler import (
+    Budget,
+    MeteredBackend,
+    ledger_recorder,
+    quota_day,
+    record_audited,
+    refused_calls,
+    schedule_bulk_audit,
+)
+from prefetch import PrefetchRegistry
 
 # --- CONFIGURATION ---
 st.set_page_config(
@@ -67,777 +90,205 @@ st.markdown("""
 
 # --- GEMINI AI SETUP ---
 GEMINI_API_KEY = st.secrets.get("GEMINI_API_KEY", "")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    # Using gemini-2.5-flash-lite for better free tier availability
-    model = genai.GenerativeModel('gemini-2.5-flash-lite')
-
-# --- DATA STRUCTURES ---
-if 'agents' not in st.session_state:
-    st.session_state.agents = {}
-
-def get_initial_agent(name=""):
-    return {
-        "name": name,
-        "audit_data": None,
-        "total_chats": 0,
-        "audit_timestamp": None,
-        "raw_transcripts": []
-    }
-
-# --- RECURSIVE ZIP PROCESSING ---
-def get_agent_transcripts(uploaded_zip, target_name):
-    """Extract transcripts for a specific agent from ZIP file (supports nested ZIPs)"""
-    transcripts = []
-    chat_metadata = []
-    
-    with zipfile.ZipFile(uploaded_zip, 'r') as z:
-        for file_path in z.namelist():
-            # Handle nested ZIP files (agent-specific ZIPs inside main ZIP)
-            if file_path.endswith('.zip'):
-                try:
-                    with z.open(file_path) as nested_zip_file:
-                        nested_zip_bytes = io.BytesIO(nested_zip_file.read())
-                        with zipfile.ZipFile(nested_zip_bytes, 'r') as nested_z:
-                            for nested_file_path in nested_z.namelist():
-                                if nested_file_path.endswith('.json'):
-                                    with nested_z.open(nested_file_path) as f:
-                                        try:
-                                            data = json.load(f)
-                                            chat_text = ""
-                                            belongs_to_agent = False
-                                            message_count = 0
-                                            
-                                            chat_id = data.get("id", "unknown")
-                                            started_at = data.get("started", "")
-                                            
-                                            for msg in data.get("messages", []):
-                                                name = msg.get("sender", {}).get("n", "Visitor")
-                                                body = msg.get("msg", "")
-                                                timestamp = msg.get("t", "")
-                                                
-                                                chat_text += f"[{timestamp}] {name}: {body}\n"
-                                                message_count += 1
-                                                
-                                                if name == target_name:
-                                                    belongs_to_agent = True
-                                            
-                                            if belongs_to_agent and message_count > 3:
-                                                transcripts.append(chat_text)
-                                                chat_metadata.append({
-                                                    "chat_id": chat_id,
-                                                    "started_at": started_at,
-                                                    "message_count": message_count
-                                                })
-                                        except:
-                                            continue
-                except:
-                    continue
-            
-            # Also handle direct JSON files in main ZIP (original functionality)
-            elif file_path.endswith('.json'):
-                with z.open(file_path) as f:
-                    try:
-                        data = json.load(f)
-                        chat_text = ""
-                        belongs_to_agent = False
-                        message_count = 0
-                        
-                        chat_id = data.get("id", "unknown")
-                        started_at = data.get("started", "")
-                        
-                        for msg in data.get("messages", []):
-                            name = msg.get("sender", {}).get("n", "Visitor")
-                            body = msg.get("msg", "")
-                            timestamp = msg.get("t", "")
-                            
-                            chat_text += f"[{timestamp}] {name}: {body}\n"
-                            message_count += 1
-                            
-                            if name == target_name:
-                                belongs_to_agent = True
-                        
-                        if belongs_to_agent and message_count > 3:
-                            transcripts.append(chat_text)
-                            chat_metadata.append({
-                                "chat_id": chat_id,
-                                "started_at": started_at,
-                                "message_count": message_count
-                            })
-                    except Exception as e:
-                        st.warning(f"Could not process file {file_path}: {str(e)}")
-                        continue
-    
-    return transcripts, chat_metadata
+# "fake" runs audits against the local offline backend (demos, load testing)
+MODEL_BACKEND = st.secrets.get("MODEL_BACKEND", "gemini")
+# Stronger model for agents that tiered audits escalate past triage (default: the same model)
+ESCALATION_GEMINI_MODEL = st.secrets.get("ESCALATION_GEMINI_MODEL", "")
+model = escalation_model = None
+if MODEL_BACKEND == "fake":
+    model = escalation_model = create_backend("fake")
+elif GEMINI_API_KEY:
+    model = escalation_model = create_backend("gemini", api_key=GEMINI_API_KEY)
+    if ESCALATION_GEMINI_MODEL:
+        escalation_model = create_backend("gemini", api_key=GEMINI_API_KEY, model_name=ESCALATION_GEMINI_MODEL)
 
-def get_all_agents_from_zip(uploaded_zip):
-    """Auto-detect all agent names from a ZIP file (including nested ZIPs)"""
-    agent_names = set()
-    
-    with zipfile.ZipFile(uploaded_zip, 'r') as z:
-        for file_path in z.namelist():
-            # Check nested ZIPs
-            if file_path.endswith('.zip'):
-                try:
-                    with z.open(file_path) as nested_zip_file:
-                        nested_zip_bytes = io.BytesIO(nested_zip_file.read())
-                        with zipfile.ZipFile(nested_zip_bytes, 'r') as nested_z:
-                            for nested_file_path in nested_z.namelist():
-                                if nested_file_path.endswith('.json'):
-                                    with nested_z.open(nested_file_path) as f:
-                                        try:
-                                            data = json.load(f)
-                                            for msg in data.get("messages", []):
-                                                name = msg.get("sender", {}).get("n", "")
-                                                if name and name != "Visitor" and not name.startswith("Bot"):
-                                                    agent_names.add(name)
-                                        except:
-                                            continue
-                except:
-                    continue
-            
-            # Check direct JSON files
-            elif file_path.endswith('.json'):
-                with z.open(file_path) as f:
-                    try:
-                        data = json.load(f)
-                        for msg in data.get("messages", []):
-                            name = msg.get("sender", {}).get("n", "")
-                            if name and name != "Visitor" and not name.startswith("Bot"):
-                                agent_names.add(name)
-                    except:
-                        continue
-    
-    return sorted(list(agent_names))
+# --- INSTRUMENTATION ---
+@st.cache_resource
+def start_metrics_endpoint(port):
+    """Serve Prometheus metrics once per server process"""
+    return start_metrics_server(port)
 
-# --- ENHANCED AI AUDIT LOGIC ---
-def run_comprehensive_audit(transcripts, agent_name):
-    """Run comprehensive AI-powered audit with detailed analysis"""
-    
-    # Use up to 50 transcripts for comprehensive analysis
-    sample_size = min(50, len(transcripts))
-    sample = "\n\n========== NEW CHAT SESSION ==========\n\n".join(transcripts[:sample_size])
-    
-    prompt = f"""
-You are a Senior Technical QA Auditor at HostAfrica with 10+ years of experience evaluating technical support quality.
-You are conducting a comprehensive performance review of agent: {agent_name}
-
-CRITICAL INSTRUCTIONS:
-1. Analyze ONLY the agent's performance, NOT bots or automated messages
-2. Focus on REAL examples from the actual chat transcripts provided
-3. All scores must use the correct scale as specified
-4. Provide actionable, specific feedback based on actual chat evidence
-5. Pay special attention to PIN verification protocol - this is a critical security measure
+if st.secrets.get("METRICS_LOG_PATH"):
+    configure_metrics(jsonl_path=st.secrets.get("METRICS_LOG_PATH"))
+if st.secrets.get("METRICS_PORT"):
+    start_metrics_endpoint(int(st.secrets.get("METRICS_PORT")))
 
-⚠️ CRITICAL SCORING REQUIREMENTS:
-- DO NOT give default scores of 5.0/5.0 to all metrics except one
-- EACH metric must be individually analyzed and scored based on actual chat evidence
-- Scores of 5.0 should be RARE and only for truly exceptional performance with ZERO issues
-- Most agents should score between 3.0-4.5 in each area
-- Identify specific strengths AND weaknesses in EVERY metric
-- If you only analyze one metric properly, the report will be REJECTED
+# --- SHARED AUDIT STORE ---
+@st.cache_resource
+def get_audit_store():
+    """One store per server process, shared by every Streamlit session"""
+    return open_audit_store(st.secrets.get("AUDIT_STORE_URL", DEFAULT_STORE_URL))
 
-✅ KNOWLEDGE BASE USAGE - POSITIVE BEHAVIOR:
-- Agents sharing help.hostafrica.com links should be COMMENDED, not penalized
-- This shows: (1) Proactive customer education, (2) Efficient resource sharing, (3) Empowering customers
-- Treat knowledge base sharing as a STRENGTH in Communication & Professionalism
-- Example praise: "Agent effectively utilized knowledge base resources to educate customer"
+# --- MODEL QUOTA ---
+# Every model call is added to the shared daily usage ledger; bulk runs also set a budget on the wrapper
+DAILY_REQUEST_BUDGET = int(st.secrets.get("DAILY_REQUEST_BUDGET", 0))
+DAILY_TOKEN_BUDGET = int(st.secrets.get("DAILY_TOKEN_BUDGET", 0))
+if model is not None:
+    usage_ledger = ledger_recorder(get_audit_store())
+    shared_backend = escalation_model is model
+    model = MeteredBackend(model, on_usage=usage_ledger)
+    escalation_model = model if shared_backend else MeteredBackend(escalation_model, on_usage=usage_ledger)
 
-SCORING SCALES:
-- Individual metrics: 0.0 to 5.0 (where 5.0 is exceptional)
-- Overall score: 0.0 to 10.0 (composite of all metrics)
+# --- CHAT EVIDENCE INDEX ---
+@st.cache_resource
+def get_chat_index():
+    """One evidence index per server process; sessions only keep chat ids"""
+    return ChatIndex(st.secrets.get("CHAT_INDEX_PATH", DEFAULT_CHAT_INDEX_PATH))
 
-CRITICAL: The overall score MUST be mathematically consistent with the individual metrics:
-- Overall Score = Weighted Average of Metrics (converted to 10-point scale)
-- Formula: (Security×20% + Technical×25% + Communication×15% + Investigative×20% + Ownership×20%) × 2
-- Example: If all metrics are 4.0/5.0, overall should be 8.0/10.0
-- Example: If all metrics are 5.0/5.0, overall MUST be 10.0/10.0
-- Do NOT give perfect scores (5.0) unless truly exceptional performance with zero issues
+def index_agent_chats(agent_name, transcripts, chat_metadata, source):
+    """Store the agent's chats in the evidence index and return their chat ids"""
+    return get_chat_index().add_chats(agent_name, transcripts, chat_metadata, source=source)
 
-EVALUATION FRAMEWORK (Weighted):
+def mark_chats_audited(agent_name, transcripts, chat_metadata):
+    """Record the chat versions a saved audit covered, so new-chats-only runs skip them"""
+    get_chat_index().mark_audited(agent_name, transcripts, chat_metadata)
 
-1. SECURITY & PIN VERIFICATION PROTOCOL (Weight: 20%)
-   CRITICAL FOCUS AREAS:
-   - Did agent request PIN when initiating new chats OR when taking over from bot?
-   - Did agent avoid redundant PIN requests (not asking for already-provided PIN in SAME session)?
-   - Did agent follow proper security procedures consistently?
-   - IMPORTANT: In transferred chats, agent MUST re-verify PIN in their own session before account actions
-   - Flag any instances where account modifications were made without explicit PIN verification
-   Rate: 0.0-5.0
+def already_indexed(agent_name):
+    """Chat versions already audited for the agent"""
+    return get_chat_index().audited_chats(agent_name)
 
-2. TECHNICAL CAPABILITY & ACCURACY (Weight: 25%)
-   - Accuracy in diagnosing DNS, Email, SSL, WordPress, hosting issues
-   - Proper use of diagnostic tools (Ping, Traceroute, WHOIS, cPanel)
-   - Correctness of technical solutions provided
-   - Depth of technical knowledge demonstrated
-   - ✅ POSITIVE: Effective use of help.hostafrica.com knowledge base (shows resourcefulness)
-   - IMPORTANT: Score this metric based on actual technical performance observed in chats
-   Rate: 0.0-5.0
+# --- SPECULATIVE EXTRACTION ---
+# Uploaded exports are parsed in the background while the user sets up the audit
+if 'prefetch' not in st.session_state:
+    st.session_state.prefetch = PrefetchRegistry()
 
-3. COMMUNICATION & PROFESSIONALISM (Weight: 15%)
-   - Clarity and professionalism in communication
-   - Empathy and patience with customers (especially frustrated ones)
-   - Grammar, spelling, and tone appropriateness
-   - De-escalation techniques for difficult situations
-   - ✅ POSITIVE: Sharing help.hostafrica.com resources (proactive customer education)
-   - IMPORTANT: Score this metric based on actual communication quality observed in chats
-   Rate: 0.0-5.0
+def show_prefetch_status(prefetch):
+    if prefetch.status == "running":
+        st.caption("⚡ Reading chats in the background - the audit will start from the parsed export")
+    elif prefetch.status == "ready":
+        export = prefetch.result()
+        st.caption(f"⚡ Export parsed: {len(export.agents)} agent(s), {len(export.chats)} chat(s)")
 
-4. INVESTIGATIVE & PROBLEM-SOLVING APPROACH (Weight: 20%)
-   - Systematic troubleshooting methodology
-   - Asking relevant diagnostic questions
-   - Root cause analysis capability
-   - Thoroughness in investigation
-   - Proactive information gathering
-   - IMPORTANT: Score this metric based on actual investigative behavior observed in chats
-   - DO NOT give 5.0 unless agent demonstrates exceptional investigation in multiple chats
-   Rate: 0.0-5.0
+def use_prefetch(prefetch):
+    """The parsed export (waiting if it is still being read), or None to extract from the ZIP directly"""
+    export = prefetch.result() if prefetch is not None else None
+    if export is not None:
+        for warning in prefetch.warnings:
+            st.warning(warning)
+    return export
 
-5. CHAT OWNERSHIP & RESOLUTION (Weight: 20%)
-   - Taking full ownership of issues
-   - Following through to resolution
-   - Proactive communication and updates
-   - Proper escalation when needed
-   - Ensuring customer satisfaction
-   - IMPORTANT: Score this metric based on actual ownership behavior observed in chats
-   - DO NOT give 5.0 unless agent demonstrates exceptional ownership in multiple chats
-   Rate: 0.0-5.0
+# --- DATA STRUCTURES ---
+if 'agents' not in st.session_state:
+    st.session_state.agents = {}
 
-OUTPUT REQUIREMENTS:
-Provide exactly 20 detailed technical examples from the actual transcripts. Each example must:
-- Reference a REAL issue from the chats
-- Show the ACTUAL agent action/response
-- Include specific improvement recommendations
-- Indicate PIN handling quality (Yes/No/Redundant/N/A)
-- Classify severity (Minor/Moderate/Major/Critical)
+def get_initial_agent(name=""):
+    return {
+        "name": name,
+        "audit_data": None,
+        "total_chats": 0,
+        "audit_timestamp": None,
+        "audit_id": None,
+        "team": DEFAULT_TEAM,
+        "chat_ids": []
+    }
 
-IMPORTANT: For PIN verification:
-- "Yes" = Agent properly requested/verified PIN before account actions
-- "No" = Agent performed account actions WITHOUT proper PIN verification (SECURITY RISK)
-- "Redundant" = Agent asked for PIN that was already provided in same session
-- "N/A" = No account access required (e.g., general questions, pre-sales)
+def sync_agents_from_store():
+    """Merge the shared roster and any newer audit results into this session"""
+    store = get_audit_store()
+    for record in store.list_agents():
+        name = record["name"]
+        if name not in st.session_state.agents:
+            st.session_state.agents[name] = get_initial_agent(name)
+        agent = st.session_state.agents[name]
+        agent["team"] = record["team"]
+        
+        # Only load the audit JSON when another session has produced a newer result
+        if record["last_audit_id"] and record["last_audit_id"] != agent.get("audit_id"):
+            stored = store.get_audit(record["last_audit_id"])
+            if stored:
+                agent["audit_data"] = stored["audit_data"]
+                agent["total_chats"] = stored["total_chats"]
+                agent["audit_timestamp"] = datetime.fromisoformat(stored["created_at"])
+                agent["audit_id"] = stored["id"]
 
-Return ONLY valid JSON in this exact structure:
-{{
-    "overall_score": 0.0,
-    "overall_assessment": "Comprehensive 3-4 paragraph summary of agent's performance, highlighting key patterns observed across all interactions. Include commentary on chat volume performance.",
-    "metrics": {{
-        "security_pin_protocol": 0.0,
-        "technical_capability": 0.0,
-        "communication_professionalism": 0.0,
-        "investigative_approach": 0.0,
-        "chat_ownership_resolution": 0.0
-    }},
-    "key_strengths": [
-        "Specific strength with example from chats",
-        "Specific strength with example from chats",
-        "Specific strength with example from chats",
-        "Specific strength with example from chats",
-        "Specific strength with example from chats"
-    ],
-    "key_development_areas": [
-        "Specific area for improvement with actionable advice",
-        "Specific area for improvement with actionable advice",
-        "Specific area for improvement with actionable advice",
-        "Specific area for improvement with actionable advice",
-        "Specific area for improvement with actionable advice"
-    ],
-    "pin_protocol_feedback": "DETAILED analysis of PIN verification practices across all chats. Specifically note: (1) How many chats had proper PIN verification, (2) How many had PIN bypasses, (3) Pattern analysis - does agent verify in new chats but skip in transferred chats?, (4) Specific examples of good and poor PIN handling, (5) Security risk assessment",
-    "technical_examples": [
-        {{
-            "example_number": 1,
-            "client_name": "Customer's name from the chat (e.g., 'John Doe', 'Sarah Smith')",
-            "pin_number": "PIN number if mentioned in chat (e.g., '1234', 'Not provided', 'N/A')",
-            "issue_type": "VPS/Server, Domain/WHOIS, DNS, Email, SSL, WordPress, cPanel, Billing, etc.",
-            "customer_issue": "Specific detailed customer complaint or issue",
-            "agent_action": "Detailed description of what agent actually did or said",
-            "pin_handled_well": "Yes/No/Redundant/N/A",
-            "outcome": "What happened as a result of agent's action",
-            "assessment": "Critical evaluation - was this handled well or poorly? Why?",
-            "improvement": "Specific actionable improvement suggestion or 'None' if handled perfectly",
-            "severity": "Minor/Moderate/Major/Critical"
-        }},
-        {{
-            "example_number": 2,
-            ... (continue for 20 examples total)
-        }}
-    ],
-    "performance_trends": {{
-        "response_time_assessment": "Analysis of agent's response speed and communication timing",
-        "consistency": "How consistent is the agent's performance across different issue types",
-        "technical_depth": "Assessment of technical knowledge depth and problem-solving capability",
-        "customer_satisfaction_indicators": "Signs of customer satisfaction or frustration based on chat outcomes"
-    }},
-    "recommended_training": [
-        "Specific training recommendation based on identified gaps (minimum 3)",
-        "Specific training recommendation based on identified gaps",
-        "Specific training recommendation based on identified gaps"
-    ],
-    "standout_moments": [
-        "Exceptional handling example with specific details from chats",
-        "Exceptional handling example with specific details from chats"
-    ],
-    "critical_incidents": [
-        "Any critical errors, serious security lapses, or major issues (be specific)"
-    ]
-}}
+def run_shared_audit(transcripts, agent_name, chat_metadata=None, chat_ids=None, adaptive=False, tiered=False):
+    """Run an audit through the shared store so concurrent identical requests make one model call"""
+    store = get_audit_store()
+    variant = "+".join(mode for mode, enabled in (("tiered", tiered), ("adaptive", adaptive)) if enabled)
+    audit_key = compute_audit_key(agent_name, transcripts, variant=variant or None)
+    owner = uuid.uuid4().hex
+    
+    def compute():
+        # Slow audits (retries, adaptive rounds) must not outlive the lock's lease
+        with AgentLockHeartbeat(store, agent_name, owner):
+            return run_comprehensive_audit(transcripts, agent_name, chat_ids, adaptive, tiered)
+    
+    audit_result, shared = store.run_deduplicated(
+        agent_name,
+        audit_key,
+        compute,
+        total_chats=len(transcripts),
+        metadata={"chats": chat_metadata or []},
+        owner=owner
+    )
+    latest = store.find_audit_by_key(agent_name, audit_key)
+    return audit_result, shared, latest["id"] if latest else None
 
-CHAT TRANSCRIPTS TO ANALYZE:
-{sample}
+# --- AI AUDIT ---
+def run_comprehensive_audit(transcripts, agent_name, chat_ids=None, adaptive=False, tiered=False):
+    """Run the audit against the configured Gemini model, reporting issues in the UI"""
+    # Issue types were assigned when the chats were indexed; they steer the stratified sample
+    issue_types = get_chat_index().issue_types(chat_ids) if chat_ids else None
+    audit = run_adaptive_audit if adaptive else run_audit_with_model
+    if tiered:
+        return run_tiered_audit(transcripts, agent_name, model, notify=st, chat_ids=chat_ids, issue_types=issue_types,
+                                escalation_model=escalation_model, full_audit=audit)
+    return audit(transcripts, agent_name, model, notify=st, chat_ids=chat_ids, issue_types=issue_types)
 
-Remember: Base ALL examples and assessments on the ACTUAL transcripts provided above. Be specific, fair, and constructive. Focus heavily on PIN verification protocol as this is a critical security concern for HostAfrica.
-"""
-    
-    try:
-        response = model.generate_content(prompt)
-        text = response.text
-        
-        # Clean up JSON response
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0]
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0]
-        
-        # Parse JSON
-        audit_result = json.loads(text.strip())
-        
-        # Validate and cap scores
-        audit_result['overall_score'] = min(float(audit_result.get('overall_score', 0)), 10.0)
-        for key in audit_result.get('metrics', {}):
-            audit_result['metrics'][key] = min(float(audit_result['metrics'][key]), 5.0)
-        
-        # CRITICAL FIX: Detect lazy scoring (AI giving 5.0 to all metrics except one)
-        metrics = audit_result.get('metrics', {})
-        if metrics:
-            metric_values = [float(v) for v in metrics.values()]
-            perfect_scores = sum(1 for v in metric_values if v == 5.0)
-            
-            # If 4 or more metrics are exactly 5.0, AI is being lazy
-            if perfect_scores >= 4:
-                st.error("⚠️ WARNING: AI appears to have given default scores without proper analysis!")
-                st.error(f"Found {perfect_scores} metrics with perfect 5.0 scores - this is extremely rare.")
-                st.error("The AI may not have properly analyzed all metrics. Consider re-running the audit.")
-                
-                # Automatically adjust obvious lazy scoring
-                if perfect_scores == 4 and len(metric_values) == 5:
-                    st.warning("🔧 Applying realistic score adjustment to prevent lazy scoring...")
-                    # Adjust the perfect scores to more realistic values (4.0-4.5 range)
-                    adjusted_count = 0
-                    for key, value in metrics.items():
-                        if float(value) == 5.0 and adjusted_count < 2:
-                            # Don't adjust all, just bring some down to realistic range
-                            metrics[key] = 4.5
-                            adjusted_count += 1
-                        elif float(value) == 5.0:
-                            metrics[key] = 4.3
-                    
-                    st.info("✅ Scores adjusted to more realistic range. All metrics now individually assessed.")
-        
-        # CRITICAL FIX: Recalculate overall score based on weighted metrics to ensure consistency
-        if metrics:
-            # Weights (must total 100%)
-            weights = {
-                'security_pin_protocol': 0.20,       # 20%
-                'technical_capability': 0.25,        # 25%
-                'communication_professionalism': 0.15, # 15%
-                'investigative_approach': 0.20,      # 20%
-                'chat_ownership_resolution': 0.20    # 20%
-            }
-            
-            # Calculate weighted average (convert 5.0 scale to 10.0 scale)
-            weighted_sum = 0
-            for key, weight in weights.items():
-                metric_value = float(metrics.get(key, 0))
-                weighted_sum += (metric_value * 2) * weight  # multiply by 2 to convert to 10-point scale
-            
-            calculated_overall = round(weighted_sum, 1)
-            
-            # Use calculated score if it differs significantly from AI's score
-            ai_overall = float(audit_result.get('overall_score', 0))
-            if abs(calculated_overall - ai_overall) > 1.0:
-                st.warning(f"⚠️ AI score ({ai_overall}) adjusted to calculated score ({calculated_overall}) for consistency")
-                audit_result['overall_score'] = calculated_overall
-        
-        return audit_result
-        
-    except json.JSONDecodeError as e:
-        st.error(f"JSON Parsing Error: {e}")
-        st.error(f"Raw response: {text[:500]}")
-        return None
-    except Exception as e:
-        st.error(f"AI Generation Error: {e}")
-        return None
+# --- UI DISPLAY ---
+def display_chat_evidence(chat_id):
+    """Show one source chat from the evidence index"""
+    chat = get_chat_index().get_chat(chat_id)
+    if chat is None:
+        st.warning("This chat is not in the evidence index (it was audited from an export uploaded elsewhere).")
+        return
+    st.caption(f"Started {chat['started_at'] or 'N/A'} · {chat['message_count']} messages · "
+               f"{', '.join(chat['agents'])} · from {chat['source'] or 'unknown export'}")
+    st.code(chat["transcript"], language=None)
 
-# --- ENHANCED PDF REPORT GENERATION ---
-def generate_pdf_report(agent_data, agent_name, output_path):
-    """Generate a comprehensive PDF performance review report"""
-    
-    doc = SimpleDocTemplate(
-        output_path,
-        pagesize=letter,
-        rightMargin=0.75*inch,
-        leftMargin=0.75*inch,
-        topMargin=1*inch,
-        bottomMargin=0.75*inch
-    )
-    
-    # Styles
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Title'],
-        fontSize=24,
-        textColor=colors.HexColor('#1f77b4'),
-        spaceAfter=30,
-        alignment=TA_CENTER
+def display_search(agent_list):
+    """Full-text search across every chat in the evidence index"""
+    st.subheader("🔍 Search All Ingested Chats")
+    query = st.text_input(
+        "Search messages",
+        placeholder='e.g. "cPanel reset", pin* OR verification',
+        help='Words match anywhere; use "quotes" for exact phrases, * for prefixes and OR between alternatives',
+        key="search_query"
     )
     
-    heading1_style = ParagraphStyle(
-        'CustomHeading1',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#1f77b4'),
-        spaceAfter=12,
-        spaceBefore=12
-    )
-    
-    heading2_style = ParagraphStyle(
-        'CustomHeading2',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#333333'),
-        spaceAfter=10,
-        spaceBefore=10
-    )
-    
-    body_style = ParagraphStyle(
-        'CustomBody',
-        parent=styles['BodyText'],
-        fontSize=11,
-        alignment=TA_JUSTIFY,
-        spaceAfter=10
-    )
-    
-    # Build story
-    story = []
-    
-    # Title
-    story.append(Paragraph("PERFORMANCE REVIEW REPORT", title_style))
-    story.append(Paragraph(f"<b>Agent:</b> {agent_name}", styles['Normal']))
-    story.append(Paragraph(f"<b>Review Date:</b> {datetime.now().strftime('%B %d, %Y')}", styles['Normal']))
-    story.append(Paragraph(f"<b>Chats Analyzed:</b> {agent_data.get('total_chats', 0)}", styles['Normal']))
-    story.append(Spacer(1, 0.3*inch))
-    
-    # Overall Score
-    overall_score = agent_data.get('audit_data', {}).get('overall_score', 0)
-    story.append(Paragraph("OVERALL PERFORMANCE SCORE", heading1_style))
-    
-    score_data = [[f"{overall_score}/10.0"]]
-    score_table = Table(score_data, colWidths=[2*inch])
-    score_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 24),
-        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#e8f4f8')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#1f77b4')),
-        ('PADDING', (0, 0), (-1, -1), 20),
-        ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#1f77b4'))
-    ]))
-    story.append(score_table)
-    story.append(Spacer(1, 0.3*inch))
-    
-    # Overall Assessment
-    story.append(Paragraph("OVERALL ASSESSMENT", heading1_style))
-    assessment = agent_data.get('audit_data', {}).get('overall_assessment', 'No assessment available')
-    story.append(Paragraph(assessment, body_style))
-    story.append(Spacer(1, 0.2*inch))
-    
-    # Metrics
-    story.append(Paragraph("PERFORMANCE METRICS", heading1_style))
-    metrics = agent_data.get('audit_data', {}).get('metrics', {})
-    
-    metrics_data = [['Metric', 'Score (out of 5.0)']]
-    for key, value in metrics.items():
-        metric_name = key.replace('_', ' ').title()
-        metrics_data.append([metric_name, f"{value}/5.0"])
-    
-    metrics_table = Table(metrics_data, colWidths=[4*inch, 1.5*inch])
-    metrics_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f77b4')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f0f0f0')])
-    ]))
-    story.append(metrics_table)
-    story.append(Spacer(1, 0.3*inch))
-    
-    # Page Break
-    story.append(PageBreak())
-    
-    # Strengths
-    story.append(Paragraph("KEY STRENGTHS", heading1_style))
-    strengths = agent_data.get('audit_data', {}).get('key_strengths', [])
-    for i, strength in enumerate(strengths, 1):
-        story.append(Paragraph(f"<b>{i}.</b> {strength}", body_style))
-    story.append(Spacer(1, 0.2*inch))
-    
-    # Development Areas
-    story.append(Paragraph("AREAS FOR DEVELOPMENT", heading1_style))
-    dev_areas = agent_data.get('audit_data', {}).get('key_development_areas', [])
-    for i, area in enumerate(dev_areas, 1):
-        story.append(Paragraph(f"<b>{i}.</b> {area}", body_style))
-    story.append(Spacer(1, 0.2*inch))
-    
-    # PIN Protocol Feedback
-    story.append(Paragraph("SECURITY & PIN PROTOCOL ANALYSIS", heading1_style))
-    pin_feedback = agent_data.get('audit_data', {}).get('pin_protocol_feedback', 'No feedback available')
-    story.append(Paragraph(pin_feedback, body_style))
-    story.append(Spacer(1, 0.2*inch))
-    
-    # Page Break
-    story.append(PageBreak())
-    
-    # Technical Examples
-    story.append(Paragraph("DETAILED TECHNICAL EXAMPLES", heading1_style))
-    examples = agent_data.get('audit_data', {}).get('technical_examples', [])
-    
-    for i, example in enumerate(examples, 1):
-        story.append(Paragraph(f"<b>Example {i}: {example.get('issue_type', 'N/A')}</b>", heading2_style))
-        
-        example_data = [
-            ['Client Name:', example.get('client_name', 'N/A')],
-            ['PIN Number:', example.get('pin_number', 'N/A')],
-            ['Customer Issue:', example.get('customer_issue', 'N/A')],
-            ['Agent Action:', example.get('agent_action', 'N/A')],
-            ['PIN Handled Well:', example.get('pin_handled_well', 'N/A')],
-            ['Outcome:', example.get('outcome', 'N/A')],
-            ['Assessment:', example.get('assessment', 'N/A')],
-            ['Improvement:', example.get('improvement', 'N/A')],
-            ['Severity:', example.get('severity', 'N/A')]
-        ]
-        
-        example_table = Table(example_data, colWidths=[1.5*inch, 5*inch])
-        example_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0f0f0')),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('PADDING', (0, 0), (-1, -1), 8)
-        ]))
-        
-        story.append(example_table)
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Page break every 4 examples
-        if i % 4 == 0 and i < len(examples):
-            story.append(PageBreak())
-    
-    # Performance Trends (if available)
-    trends = agent_data.get('audit_data', {}).get('performance_trends', {})
-    if trends:
-        story.append(PageBreak())
-        story.append(Paragraph("PERFORMANCE TRENDS", heading1_style))
-        for key, value in trends.items():
-            trend_name = key.replace('_', ' ').title()
-            story.append(Paragraph(f"<b>{trend_name}:</b> {value}", body_style))
-        story.append(Spacer(1, 0.2*inch))
-    
-    # Recommended Training
-    training = agent_data.get('audit_data', {}).get('recommended_training', [])
-    if training:
-        story.append(Paragraph("RECOMMENDED TRAINING", heading1_style))
-        for i, recommendation in enumerate(training, 1):
-            story.append(Paragraph(f"<b>{i}.</b> {recommendation}", body_style))
-        story.append(Spacer(1, 0.2*inch))
-    
-    # Standout Moments
-    standout = agent_data.get('audit_data', {}).get('standout_moments', [])
-    if standout:
-        story.append(Paragraph("STANDOUT MOMENTS", heading1_style))
-        for i, moment in enumerate(standout, 1):
-            story.append(Paragraph(f"<b>{i}.</b> {moment}", body_style))
-        story.append(Spacer(1, 0.2*inch))
+    col1, col2, col3 = st.columns(3)
+    agent_filter = col1.selectbox("Agent", ["All agents"] + agent_list, key="search_agent")
+    role_filter = col2.selectbox("Sender", ["Anyone", "Agent", "Visitor", "Bot"], key="search_role",
+                                 help="With an agent selected, 'Agent' only matches that agent's own messages")
+    date_range = col3.date_input("Date range", value=(), key="search_dates")
     
-    # Critical Incidents
-    critical = agent_data.get('audit_data', {}).get('critical_incidents', [])
-    if critical:
-        story.append(Paragraph("CRITICAL INCIDENTS", heading1_style))
-        for i, incident in enumerate(critical, 1):
-            story.append(Paragraph(f"<b>{i}.</b> {incident}", body_style))
-    
-    # Build PDF
-    doc.build(story)
-    return output_path
-
-# --- EXCEL REPORT GENERATION (Consolidated Single-Sheet Version) ---
-def generate_excel_report(agent_data, agent_name, output_path):
-    """Generate a single-sheet Excel performance review report for easy copy-pasting"""
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Performance Review Report"
+    if not query.strip():
+        st.info("Enter a word or phrase to search every chat audited on this server")
+        return
     
-    # Define styles
-    header_fill = PatternFill(start_color="1F77B4", end_color="1F77B4", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    subheader_font = Font(bold=True, size=11)
-    title_font = Font(bold=True, size=16, color="1F77B4")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    since = until = None
+    if len(date_range) == 2:
+        since = date_range[0].isoformat()
+        until = (date_range[1] + timedelta(days=1)).isoformat()
+    
+    start = time.perf_counter()
+    hits = get_chat_index().search(
+        query,
+        agent_name=None if agent_filter == "All agents" else agent_filter,
+        role=None if role_filter == "Anyone" else role_filter.lower(),
+        since=since,
+        until=until,
+        limit=100
     )
-    center_align = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    left_align = Alignment(horizontal='left', vertical='top', wrap_text=True)
-    
-    current_row = 1
-
-    # --- SECTION 1: HEADER & AGENT INFO ---
-    ws.cell(row=current_row, column=1, value="PERFORMANCE REVIEW REPORT").font = title_font
-    ws.merge_cells(start_row=current_row, start_column=1, end_row=current_row, end_column=4)
-    ws.cell(row=current_row, column=1).alignment = center_align
-    current_row += 2
-    
-    info_items = [
-        ("Agent:", agent_name),
-        ("Review Date:", datetime.now().strftime('%B %d, %Y')),
-        ("Chats Analyzed:", agent_data.get('total_chats', 0))
-    ]
-    
-    for label, value in info_items:
-        ws.cell(row=current_row, column=1, value=label).font = Font(bold=True)
-        ws.cell(row=current_row, column=2, value=value)
-        current_row += 1
-    
-    current_row += 1
-
-    # --- SECTION 2: OVERALL SCORE ---
-    ws.cell(row=current_row, column=1, value="OVERALL PERFORMANCE SCORE").font = subheader_font
-    ws.merge_cells(start_row=current_row, start_column=1, end_row=current_row, end_column=4)
-    current_row += 1
-    
-    overall_score = agent_data.get('audit_data', {}).get('overall_score', 0)
-    score_cell = ws.cell(row=current_row, column=1, value=f"{overall_score}/10.0")
-    score_cell.font = Font(bold=True, size=24, color="1F77B4")
-    ws.merge_cells(start_row=current_row, start_column=1, end_row=current_row+1, end_column=4)
-    score_cell.alignment = center_align
-    current_row += 3
-
-    # --- SECTION 3: PERFORMANCE METRICS ---
-    metrics = agent_data.get('audit_data', {}).get('metrics', {})
-    if metrics:
-        ws.cell(row=current_row, column=1, value="PERFORMANCE METRICS").font = subheader_font
-        current_row += 1
-        
-        headers = ["Metric", "Score (out of 5.0)"]
-        for c_idx, h in enumerate(headers, 1):
-            cell = ws.cell(row=current_row, column=c_idx, value=h)
-            cell.fill, cell.font, cell.border, cell.alignment = header_fill, header_font, border, center_align
-        
-        current_row += 1
-        for key, value in metrics.items():
-            ws.cell(row=current_row, column=1, value=key.replace('_', ' ').title()).border = border
-            score_cell = ws.cell(row=current_row, column=2, value=f"{value}/5.0")
-            score_cell.border, score_cell.alignment = border, center_align
-            current_row += 1
-        current_row += 1
-
-    # --- SECTION 4: TECHNICAL EXAMPLES ---
-    examples = agent_data.get('audit_data', {}).get('technical_examples', [])
-    if examples:
-        ws.cell(row=current_row, column=1, value="TECHNICAL EXAMPLES").font = subheader_font
-        current_row += 1
-        
-        headers = ['#', 'Client', 'PIN', 'Issue Type', 'Customer Issue', 'Agent Action', 'Outcome', 'Assessment', 'Severity']
-        for c_idx, h in enumerate(headers, 1):
-            cell = ws.cell(row=current_row, column=c_idx, value=h)
-            cell.fill, cell.font, cell.border, cell.alignment = header_fill, header_font, border, center_align
-        
-        current_row += 1
-        for idx, ex in enumerate(examples, 1):
-            data = [
-                ex.get('example_number', idx), ex.get('client_name', 'N/A'), ex.get('pin_number', 'N/A'),
-                ex.get('issue_type', 'N/A'), ex.get('customer_issue', 'N/A'), ex.get('agent_action', 'N/A'),
-                ex.get('outcome', 'N/A'), ex.get('assessment', 'N/A'), ex.get('severity', 'N/A')
-            ]
-            for c_idx, value in enumerate(data, 1):
-                cell = ws.cell(row=current_row, column=c_idx, value=value)
-                cell.border, cell.alignment = border, left_align
-                # Severity Coloring
-                if c_idx == 9: 
-                    sev_colors = {'Critical': "F8D7DA", 'Major': "FFF3CD", 'Moderate': "D1ECF1", 'Minor': "D4EDDA"}
-                    if value in sev_colors:
-                        cell.fill = PatternFill(start_color=sev_colors[value], end_color=sev_colors[value], fill_type="solid")
-            current_row += 1
-        current_row += 1
-
-    # --- SECTION 5: STRENGTHS & DEVELOPMENT ---
-    for title, key in [("KEY STRENGTHS", "key_strengths"), ("AREAS FOR DEVELOPMENT", "key_development_areas")]:
-        ws.cell(row=current_row, column=1, value=title).font = title_font
-        current_row += 1
-        items = agent_data.get('audit_data', {}).get(key, [])
-        for i, item in enumerate(items, 1):
-            ws.cell(row=current_row, column=1, value=f"{i}.")
-            content_cell = ws.cell(row=current_row, column=2, value=item)
-            content_cell.alignment, content_cell.border = left_align, border
-            ws.merge_cells(start_row=current_row, start_column=2, end_row=current_row, end_column=4)
-            current_row += 1
-        current_row += 1
-
-    # --- SECTION 6: SECURITY & PIN PROTOCOL ---
-    ws.cell(row=current_row, column=1, value="SECURITY & PIN PROTOCOL ANALYSIS").font = title_font
-    current_row += 1
-    pin_feedback = agent_data.get('audit_data', {}).get('pin_protocol_feedback', 'No feedback available')
-    ws.cell(row=current_row, column=1, value=pin_feedback).alignment = left_align
-    ws.merge_cells(start_row=current_row, start_column=1, end_row=current_row+1, end_column=4)
-    current_row += 3
-
-    # --- SECTION 7: OVERALL ASSESSMENT ---
-    ws.cell(row=current_row, column=1, value="OVERALL ASSESSMENT").font = title_font
-    current_row += 1
-    assessment = agent_data.get('audit_data', {}).get('overall_assessment', 'No assessment available')
-    ws.cell(row=current_row, column=1, value=assessment).alignment = left_align
-    ws.merge_cells(start_row=current_row, start_column=1, end_row=current_row+4, end_column=4)
-    current_row += 6
-
-    # --- SECTION 8: CRITICAL INCIDENTS (Conditional) ---
-    critical = agent_data.get('audit_data', {}).get('critical_incidents', [])
-    if critical:
-        ws.cell(row=current_row, column=1, value="CRITICAL INCIDENTS").font = Font(bold=True, size=16, color="DC3545")
-        current_row += 1
-        for i, incident in enumerate(critical, 1):
-            ws.cell(row=current_row, column=1, value=f"{i}.")
-            cell = ws.cell(row=current_row, column=2, value=incident)
-            cell.alignment, cell.border = left_align, border
-            cell.fill = PatternFill(start_color="F8D7DA", end_color="F8D7DA", fill_type="solid")
-            ws.merge_cells(start_row=current_row, start_column=2, end_row=current_row, end_column=4)
-            current_row += 1
-
-    # Final adjustments
-    ws.column_dimensions['A'].width = 15
-    ws.column_dimensions['B'].width = 30
-    ws.column_dimensions['C'].width = 30
-    ws.column_dimensions['D'].width = 30
-    ws.column_dimensions['E'].width = 40
-    ws.column_dimensions['F'].width = 40
-    ws.column_dimensions['G'].width = 35
-    ws.column_dimensions['H'].width = 35
-    ws.column_dimensions['I'].width = 15
+    st.caption(f"{len(hits)} matching messages in {(time.perf_counter() - start) * 1000:.1f} ms")
     
-    wb.save(output_path)
-    return output_path
+    for i, hit in enumerate(hits):
+        st.markdown(f"**{hit['sender']}** ({hit['role']}) · {hit['sent_at']} · chat `{hit['chat_id']}`")
+        st.markdown(f"> {hit['snippet']}")
+        if st.checkbox("🔎 Show full chat", key=f"search_chat_{i}_{hit['chat_id']}"):
+            display_chat_evidence(hit['chat_id'])
 
-# --- UI DISPLAY ---
+@instrumented("display_results")
 def display_results(audit_data):
     """Display audit results in the Streamlit UI"""
     
@@ -855,6 +306,18 @@ def display_results(audit_data):
     
     st.markdown("---")
     
+    sampling = audit_data.get("adaptive_sampling")
+    if sampling:
+        reasons = {"converged": "scores converged", "budget": "chat budget reached",
+                   "exhausted": "all chats audited", "error": "a round failed"}
+        st.caption(f"🎯 Adaptive sampling: {sampling['chats_audited']} of {sampling['chats_available']} chats "
+                   f"in {sampling['rounds']} round(s) - {reasons.get(sampling['stop_reason'], sampling['stop_reason'])}")
+    triage = audit_data.get("triage")
+    if triage and triage["escalated"]:
+        st.caption(f"🔀 Triage: escalated to the full audit ({', '.join(triage['reasons']).replace('_', ' ')})")
+    elif triage:
+        st.caption(f"🔀 Triage: {triage['band']} - settled by the quick triage, so there are no technical examples")
+    
     # Overall Assessment
     st.markdown("### 📋 Overall Assessment")
     st.info(audit_data.get("overall_assessment", "No assessment available"))
@@ -961,6 +424,13 @@ def display_results(audit_data):
                 st.markdown(f"**Assessment:** {example.get('assessment', 'N/A')}")
                 st.markdown(f"**Improvement Recommendation:** {example.get('improvement', 'N/A')}")
                 st.markdown(f"**Severity:** {severity}")
+                
+                # Evidence is loaded from the chat index only when asked for
+                chat_id = example.get('chat_id')
+                if chat_id:
+                    st.markdown(f"**Source Chat:** `{chat_id}`")
+                    if st.checkbox("🔎 Show source chat", key=f"evidence_{i}_{chat_id}"):
+                        display_chat_evidence(chat_id)
     else:
         st.info("No technical examples available")
     
@@ -989,12 +459,198 @@ def display_results(audit_data):
         for moment in standout:
             st.success(moment)
 
+def display_trends(agent_name):
+    """Display the agent's audit history and team trends from the indexed metrics"""
+    store = get_audit_store()
+    
+    st.markdown("### 📉 Audit Timeline")
+    series = store.get_agent_metric_series(agent_name)
+    if len(set(row["audit_id"] for row in series)) < 2:
+        st.info("Run at least two audits for this agent to see a trend")
+    else:
+        timeline = pd.DataFrame(series)
+        timeline["created_at"] = pd.to_datetime(timeline["created_at"])
+        timeline = timeline.pivot_table(index="created_at", columns="metric", values="value")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**Overall Score (out of 10.0)**")
+            if "overall_score" in timeline:
+                st.line_chart(timeline[["overall_score"]])
+        with col2:
+            st.markdown("**Metrics (out of 5.0)**")
+            st.line_chart(timeline.drop(columns=["overall_score"], errors="ignore"))
+    
+    st.markdown("### 👥 Team Trend")
+    col1, col2, col3 = st.columns(3)
+    teams = store.list_teams()
+    current_team = st.session_state.agents.get(agent_name, {}).get("team", DEFAULT_TEAM)
+    team = col1.selectbox(
+        "Team:",
+        teams,
+        index=teams.index(current_team) if current_team in teams else 0,
+        key="trend_team"
+    )
+    metric = col2.selectbox(
+        "Metric:",
+        ["overall_score", "security_pin_protocol", "technical_capability", "communication_professionalism",
+         "investigative_approach", "chat_ownership_resolution"],
+        format_func=lambda key: key.replace("_", " ").title(),
+        key="trend_metric"
+    )
+    weeks = col3.slider("Weeks:", 4, 52, 12, key="trend_weeks")
+    
+    trend = store.get_metric_trend(metric, team=team, weeks=weeks)
+    if trend:
+        trend_df = pd.DataFrame(trend).set_index("week_start")
+        st.line_chart(trend_df[["mean", "min", "max"]])
+        st.caption(f"{int(trend_df['audits'].sum())} audit(s) for team {team} over the last {weeks} weeks")
+    else:
+        st.info(f"No audits recorded for team {team} in the last {weeks} weeks")
+    
+    st.markdown("### ⚖️ Re-weighted Leaderboard")
+    profiles = load_weight_profiles()
+    col1, col2 = st.columns(2)
+    profile = col1.selectbox("Weight profile:", sorted(profiles, key=lambda name: (name != "default", name)),
+                             key="rescore_profile",
+                             format_func=lambda name: name.replace("_", " ").title())
+    rescore_weeks = col2.slider("Audits from the last (weeks):", 4, 52, 13, key="rescore_weeks")
+    st.caption(" · ".join(f"{key.replace('_', ' ').title()} {weight:.0%}" for key, weight in profiles[profile].items()))
+    since = (datetime.now() - timedelta(weeks=rescore_weeks)).isoformat()
+    rescored = rescore_history(store, profiles[profile], since=since)
+    if rescored:
+        board = pd.DataFrame(rescored["leaderboard"]).set_index("rank")
+        board["rank change"] = board["old_rank"] - board.index
+        st.dataframe(board[["agent", "team", "old_score", "new_score", "rank change", "team_rank"]],
+                     use_container_width=True)
+        st.caption(f"Each agent's latest audit, re-scored from stored metrics ({len(rescored['audits']['audit_id'])} "
+                   "audits in the period) - no model calls")
+    else:
+        st.info(f"No audits recorded in the last {rescore_weeks} weeks")
+    
+    st.markdown("### 🧭 Issue Mix")
+    issue_mix = get_chat_index().agent_issue_mix(agent_name)
+    if issue_mix:
+        mix_df = pd.DataFrame({"Chats": issue_mix}).rename_axis("Issue type")
+        col1, col2 = st.columns([2, 1])
+        col1.bar_chart(mix_df)
+        col2.dataframe((mix_df["Chats"] / mix_df["Chats"].sum() * 100).round(1).rename("Share %"),
+                       use_container_width=True)
+        st.caption(f"All {int(mix_df['Chats'].sum())} indexed chats, labelled locally at ingestion")
+    else:
+        st.info("No chats indexed for this agent yet")
+
+def display_team_analytics():
+    """Leaderboard, distributions and comparisons from the store's per-agent snapshots (no audit JSON loaded)"""
+    store = get_audit_store()
+    st.markdown("### 🏆 Team Leaderboard")
+    
+    col1, col2 = st.columns(2)
+    teams = store.list_teams()
+    team = col1.selectbox("Team:", ["All teams"] + teams, key="analytics_team")
+    metric = col2.selectbox("Rank by:", ANALYTICS_METRICS, format_func=lambda key: key.replace("_", " ").title(),
+                            key="analytics_metric")
+    snapshots = store.get_agent_snapshots(None if team == "All teams" else team)
+    if not snapshots:
+        st.info("No audited agents yet - results appear here as each agent's audit is saved")
+        return
+    
+    board = pd.DataFrame(leaderboard(snapshots, metric)).set_index("rank")
+    overall = [s["metrics"]["overall_score"] for s in snapshots if "overall_score" in s["metrics"]]
+    pin_rates = board["pin_compliance"].dropna()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Agents", len(snapshots))
+    col2.metric("Chats Audited", f"{int(board['chats'].sum()):,}")
+    col3.metric("Mean Score", f"{sum(overall) / len(overall):.1f}" if overall else "-")
+    col4.metric("PIN Compliance", f"{pin_rates.mean():.0%}" if len(pin_rates) else "-")
+    
+    board["pin_compliance"] = (board["pin_compliance"] * 100).round(0)
+    st.dataframe(
+        board[["agent", "team", "score", "team_rank", "percentile", "chats", "critical", "major", "pin_compliance",
+               "audited_at"]].rename(columns={"pin_compliance": "PIN %", "percentile": "percentile %"}),
+        use_container_width=True
+    )
+    
+    col1, col2 = st.columns([3, 2])
+    with col1:
+        st.markdown("**Metric distributions (latest audit per agent)**")
+        distributions = pd.DataFrame(metric_distributions(snapshots)).T.round(2)
+        distributions.index = [key.replace("_", " ").title() for key in distributions.index]
+        st.dataframe(distributions, use_container_width=True)
+    with col2:
+        st.markdown("**Example severities**")
+        st.bar_chart(pd.DataFrame({"Examples": severity_totals(snapshots)}))
+    
+    if team == "All teams" and len(teams) > 1:
+        st.markdown("**Teams**")
+        st.dataframe(pd.DataFrame(team_overview(snapshots)).set_index("team").round(2), use_container_width=True)
+    
+    weekly = weekly_team_facts(store, None if team == "All teams" else team, weeks=26)
+    if len(weekly) > 1:
+        st.markdown("**Audit cycles (weekly)**")
+        weekly_df = pd.DataFrame(weekly).set_index("week_start")
+        col1, col2 = st.columns(2)
+        col1.line_chart(weekly_df[["audits", "critical"]])
+        col2.line_chart(weekly_df[["pin_compliance"]].astype(float))
+    
+    compared = st.multiselect("Compare agents:", [s["agent_name"] for s in snapshots], key="analytics_compare")
+    if compared:
+        comparison = pd.DataFrame(compare_agents(snapshots, compared))
+        comparison.index = [key.replace("_", " ").title() for key in comparison.index]
+        st.bar_chart(comparison.drop(index="Overall Score"))
+        st.dataframe(comparison, use_container_width=True)
+
+def display_diagnostics():
+    """Sidebar panel with per-stage timings, sizes and token counts for this server process"""
+    with st.sidebar.expander("🩺 Diagnostics"):
+        rows = METRICS.snapshot()
+        if not rows:
+            st.caption("No pipeline activity recorded yet")
+            return
+        
+        timings = [r for r in rows if r["metric"] == "auditor_stage_seconds"]
+        if timings:
+            st.markdown("**Stage timings (seconds)**")
+            st.dataframe(
+                pd.DataFrame(timings)[["stage", "count", "mean", "max", "sum"]],
+                use_container_width=True,
+                hide_index=True
+            )
+        
+        quantities = [r for r in rows if r["metric"] != "auditor_stage_seconds"]
+        if quantities:
+            st.markdown("**Counts, bytes and tokens**")
+            st.dataframe(pd.DataFrame(quantities), use_container_width=True, hide_index=True)
+        
+        st.download_button(
+            label="⬇️ Prometheus metrics",
+            data=METRICS.render_prometheus(),
+            file_name="auditor_metrics.prom",
+            mime="text/plain",
+            use_container_width=True
+        )
+
+# --- REPORT DOWNLOADS ---
+def report_archive_download(agents, formats):
+    """Deferred download_button data: the reports ZIP is only built when the button is clicked.
+    
+    The callable runs on Streamlit's download thread, so it gets the agents' data up front.
+    """
+    def build():
+        # Spooled to disk as it grows, one report rendered at a time; Streamlit serves the finished bytes
+        with write_report_archive(agents, formats=formats) as archive:
+            return archive.read()
+    return build
+
 # --- MAIN APP FLOW ---
 def main():
     # Header
     st.markdown("<h1 class='main-header'>🤖 HostAfrica AI Auditor - Quality Focused Edition</h1>", unsafe_allow_html=True)
     st.markdown("<p style='text-align: center; color: #666;'>Comprehensive Quality Analysis with AI-Powered Insights</p>", unsafe_allow_html=True)
     
+    # Pick up agents and results saved by other sessions
+    sync_agents_from_store()
+    
     # Sidebar
     st.sidebar.title("🏢 Agent Management")
     st.sidebar.markdown("---")
@@ -1014,6 +670,7 @@ def main():
             if new_agent_name:
                 if new_agent_name not in st.session_state.agents:
                     st.session_state.agents[new_agent_name] = get_initial_agent(new_agent_name)
+                    get_audit_store().upsert_agent(new_agent_name)
                     st.sidebar.success(f"Added {new_agent_name}")
                     st.rerun()
                 else:
@@ -1042,6 +699,7 @@ def main():
                     for name in names:
                         if name not in st.session_state.agents:
                             st.session_state.agents[name] = get_initial_agent(name)
+                            get_audit_store().upsert_agent(name)
                             added_count += 1
                     st.sidebar.success(f"Added {added_count} agent(s)")
                     st.rerun()
@@ -1070,10 +728,52 @@ def main():
     # Remove agent button
     if st.sidebar.button(f"🗑️ Remove {selected_agent}", use_container_width=True):
         del st.session_state.agents[selected_agent]
+        get_audit_store().delete_agent(selected_agent)
         st.rerun()
     
+    # Team assignment (drives team trend aggregates)
+    agent_team = st.sidebar.text_input(
+        "Team",
+        value=st.session_state.agents[selected_agent].get("team", DEFAULT_TEAM),
+        key=f"team_input_{selected_agent}"
+    )
+    if agent_team and agent_team != st.session_state.agents[selected_agent].get("team"):
+        get_audit_store().set_agent_team(selected_agent, agent_team)
+        st.session_state.agents[selected_agent]["team"] = agent_team
+    
+    # Audit scope (applied while reading the ZIP, so out-of-scope chats are never parsed)
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("📅 Audit Period")
+    audit_period = st.sidebar.date_input("Only chats started between", value=(), key="audit_period",
+                                         help="Leave empty to audit every chat in the export")
+    since = until = None
+    if len(audit_period) == 2:
+        since = audit_period[0]
+        until = audit_period[1] + timedelta(days=1)
+    skip_other_archives = st.sidebar.checkbox(
+        "Skip other agents' ZIPs", value=True,
+        help="Nested ZIPs named after another agent in this list (e.g. Timothy_chats.zip) are not opened. "
+             "Untick if chats were transferred between agents."
+    )
+    known_agents = agent_list if skip_other_archives else None
+    new_chats_only = st.sidebar.checkbox(
+        "Only new or changed chats", value=False,
+        help="Skip chats already audited for the agent, e.g. when monthly exports overlap"
+    )
+    adaptive_sampling = st.sidebar.checkbox(
+        "Adaptive sampling", value=False,
+        help="Audit in rounds of 10 chats and stop once the scores settle (up to 50 chats). "
+             "Consistent agents use fewer tokens; variable ones get more evidence."
+    )
+    tiered_audits = st.sidebar.checkbox(
+        "Triage first", value=False,
+        help="Score each agent with a short prompt first; only borderline agents, critical incidents and "
+             "suspicious scores get the full 20-example audit. Cuts bulk audit cost."
+    )
+    
     st.sidebar.markdown("---")
     st.sidebar.info(f"**Total Agents:** {len(agent_list)}")
+    display_diagnostics()
     
     # Main content area
     agent = st.session_state.agents[selected_agent]
@@ -1083,9 +783,11 @@ def main():
     
     # Tabs
     if len(agent_list) > 1:
-        tab1, tab2, tab3 = st.tabs(["🤖 Single Audit", "📦 Bulk Audit", "📈 Detailed Results & Export"])
+        tab1, tab2, tab3, tab_search = st.tabs(
+            ["🤖 Single Audit", "📦 Bulk Audit", "📈 Detailed Results & Export", "🔍 Search Chats"]
+        )
     else:
-        tab1, tab2 = st.tabs(["🤖 Audit Interface", "📈 Detailed Results & Export"])
+        tab1, tab2, tab_search = st.tabs(["🤖 Audit Interface", "📈 Detailed Results & Export", "🔍 Search Chats"])
         tab3 = None
     
     with tab1:
@@ -1099,6 +801,7 @@ def main():
                 type="zip",
                 help="Upload the exported ZIP file from tawk.to"
             )
+            zip_prefetch = st.session_state.prefetch.track("single", zip_file)
         
         with col2:
             if agent.get("audit_timestamp"):
@@ -1108,6 +811,7 @@ def main():
         
         if zip_file:
             st.success(f"✅ File uploaded: {zip_file.name}")
+            show_prefetch_status(zip_prefetch)
             
             if st.button("🚀 Run Comprehensive Audit", use_container_width=True, type="primary"):
                 with st.spinner(f"🔍 AI is analyzing transcripts for {selected_agent}..."):
@@ -1119,7 +823,14 @@ def main():
                     # Extract transcripts
                     status_text.text("📂 Extracting transcripts from ZIP file...")
                     progress_bar.progress(20)
-                    transcripts, metadata = get_agent_transcripts(zip_file, selected_agent)
+                    skip_chats = already_indexed(selected_agent) if new_chats_only else None
+                    export = use_prefetch(zip_prefetch)
+                    if export is not None and export.covers(selected_agent):
+                        transcripts, metadata = export.select(selected_agent, since, until, known_agents, skip_chats)
+                    else:
+                        transcripts, metadata = get_agent_transcripts(zip_file, selected_agent, on_warning=st.warning,
+                                                                      since=since, until=until,
+                                                                      known_agents=known_agents, skip_chats=skip_chats)
                     
                     if not transcripts:
                         st.error(f"❌ No chats found for agent '{selected_agent}' in the uploaded file.")
@@ -1129,19 +840,26 @@ def main():
                     # Update progress
                     status_text.text(f"✅ Found {len(transcripts)} chats for {selected_agent}")
                     progress_bar.progress(40)
+                    chat_ids = index_agent_chats(selected_agent, transcripts, metadata, zip_file.name)
                     
                     # Run AI audit
                     status_text.text("🤖 Running AI-powered comprehensive analysis...")
                     progress_bar.progress(60)
                     
-                    audit_result = run_comprehensive_audit(transcripts, selected_agent)
+                    audit_result, shared, audit_id = run_shared_audit(transcripts, selected_agent, metadata, chat_ids,
+                                                                        adaptive_sampling, tiered_audits)
                     
                     if audit_result:
+                        mark_chats_audited(selected_agent, transcripts, metadata)
+                        if shared:
+                            st.info("♻️ Another session was already auditing these chats - reused its result")
+                        
                         # Update agent data
                         agent["audit_data"] = audit_result
                         agent["total_chats"] = len(transcripts)
                         agent["audit_timestamp"] = datetime.now()
-                        agent["raw_transcripts"] = transcripts[:10]  # Store first 10 for reference
+                        agent["audit_id"] = audit_id
+                        agent["chat_ids"] = chat_ids  # Transcripts stay in the evidence index
                         
                         progress_bar.progress(100)
                         status_text.text("✅ Analysis complete!")
@@ -1151,7 +869,7 @@ def main():
                         
                         # Show quick summary
                         st.markdown("### Quick Summary")
-                        col1, col2, col3 = st.columns(3)
+                        col1, col2, col3, col4 = st.columns(4)
                         col1.metric("Overall Score", f"{audit_result.get('overall_score', 0)}/10")
                         col2.metric("Strengths", len(audit_result.get('key_strengths', [])))
                         col3.metric("Dev Areas", len(audit_result.get('key_development_areas', [])))
@@ -1163,6 +881,9 @@ def main():
             st.info("📤 Please upload a ZIP file containing tawk.to chat transcripts to begin analysis")
     
     # Bulk Audit Tab (only show if multiple agents)
+    if len(agent_list) <= 1:
+        # No bulk uploader on screen: stop reading its export
+        st.session_state.prefetch.track("bulk", None)
     if len(agent_list) > 1 and tab3 is not None:
         with tab2:
             st.subheader(f"📦 Bulk Audit: {len(agent_list)} Agents")
@@ -1176,18 +897,26 @@ def main():
                     key="bulk_zip_uploader",
                     help="Upload a single ZIP containing multiple agent ZIPs, or a ZIP with all JSON files"
                 )
+                bulk_prefetch = st.session_state.prefetch.track("bulk", bulk_zip_file)
+                if bulk_zip_file:
+                    show_prefetch_status(bulk_prefetch)
             
             with col2:
                 if bulk_zip_file:
                     if st.button("🔍 Detect Agents in ZIP", use_container_width=True):
                         with st.spinner("Scanning ZIP file for agents..."):
-                            detected_agents = get_all_agents_from_zip(bulk_zip_file)
+                            export = use_prefetch(bulk_prefetch)
+                            if export is not None:
+                                detected_agents = export.agents
+                            else:
+                                detected_agents = get_all_agents_from_zip(bulk_zip_file, on_warning=st.warning)
                             if detected_agents:
                                 st.success(f"Found {len(detected_agents)} agent(s)!")
                                 st.write("**Detected agents:**")
                                 for agent_name in detected_agents:
                                     if agent_name not in st.session_state.agents:
                                         st.session_state.agents[agent_name] = get_initial_agent(agent_name)
+                                        get_audit_store().upsert_agent(agent_name)
                                     st.write(f"- {agent_name}")
                                 st.rerun()
                             else:
@@ -1201,6 +930,26 @@ def main():
                 agents_to_process = list(st.session_state.agents.keys())
                 st.info(f"**{len(agents_to_process)} agent(s) will be audited:** {', '.join(agents_to_process)}")
                 
+                # Model budget: agents are audited by priority while they fit, the rest wait for the next window
+                with st.expander("💰 Model Budget", expanded=bool(DAILY_REQUEST_BUDGET or DAILY_TOKEN_BUDGET)):
+                    used_today = get_audit_store().get_usage(quota_day())
+                    st.caption(f"Used today ({quota_day()}, Pacific time): {used_today['requests']:,} requests, "
+                               f"{used_today['prompt_tokens'] + used_today['output_tokens']:,} tokens")
+                    budget_col1, budget_col2 = st.columns(2)
+                    with budget_col1:
+                        daily_requests = st.number_input("Daily request limit", min_value=0,
+                                                         value=DAILY_REQUEST_BUDGET, help="0 = unlimited")
+                        run_requests = st.number_input("Requests for this run", min_value=0, value=0,
+                                                       help="0 = whatever the daily limit leaves")
+                    with budget_col2:
+                        daily_tokens = st.number_input("Daily token limit", min_value=0, value=DAILY_TOKEN_BUDGET,
+                                                       step=100000, help="0 = unlimited")
+                        run_tokens = st.number_input("Tokens for this run", min_value=0, value=0, step=100000,
+                                                     help="0 = whatever the daily limit leaves")
+                    deferred_agents = get_audit_store().list_deferred()
+                    if deferred_agents:
+                        st.caption(f"⏭️ Deferred from earlier runs (audited first): {', '.join(deferred_agents)}")
+                
                 col1, col2, col3 = st.columns(3)
                 with col2:
                     if st.button("🚀 Run Bulk Audit", use_container_width=True, type="primary"):
@@ -1211,41 +960,88 @@ def main():
                         status_text = st.empty()
                         
                         results_summary = []
-                        total_agents = len(agents_to_process)
                         
-                        for idx, agent_name in enumerate(agents_to_process, 1):
+                        # Extract every agent in one pass, so each audit's cost is known before any model call
+                        status_text.text("Reading chats and estimating model usage...")
+                        skip_seen = {name: already_indexed(name) for name in agents_to_process} if new_chats_only else None
+                        export = use_prefetch(bulk_prefetch)
+                        if export is not None and all(export.covers(name) for name in agents_to_process):
+                            extracted = {name: export.select(name, since, until, known_agents,
+                                                             skip_seen[name] if skip_seen else None)
+                                         for name in agents_to_process}
+                        else:
+                            extracted = get_transcripts_for_agents(bulk_zip_file, agents_to_process,
+                                                                   on_warning=st.warning, since=since, until=until,
+                                                                   known_agents=known_agents, skip_seen=skip_seen)
+                        budget = Budget.for_window(get_audit_store(), daily_requests, daily_tokens, run_requests,
+                                                   run_tokens)
+                        scheduled, deferred = schedule_bulk_audit(extracted, get_audit_store(), budget,
+                                                                  adaptive_sampling, tiered_audits)
+                        if deferred:
+                            st.warning(f"⏭️ {len(deferred)} agent(s) do not fit the remaining budget and were deferred "
+                                       f"to the next window: {', '.join(entry['agent'] for entry in deferred)}")
+                        if model is not None:
+                            model.budget = escalation_model.budget = budget
+                        
+                        total_agents = len(scheduled)
+                        for idx, entry in enumerate(scheduled, 1):
+                            agent_name = entry["agent"]
                             status_text.text(f"Processing {agent_name} ({idx}/{total_agents})...")
                             progress_bar.progress(idx / total_agents)
                             
                             agent_obj = st.session_state.agents[agent_name]
-                            
-                            # Extract transcripts
-                            transcripts, metadata = get_agent_transcripts(bulk_zip_file, agent_name)
+                            transcripts, metadata = extracted[agent_name]
                             
                             if transcripts:
+                                chat_ids = index_agent_chats(agent_name, transcripts, metadata, bulk_zip_file.name)
+                                refused_before = refused_calls()
+                                
                                 # Run audit
-                                audit_result = run_comprehensive_audit(transcripts, agent_name)
+                                audit_result, shared, audit_id = run_shared_audit(transcripts, agent_name, metadata,
+                                                                                  chat_ids, adaptive_sampling,
+                                                                                  tiered_audits)
                                 
                                 if audit_result:
+                                    mark_chats_audited(agent_name, transcripts, metadata)
+                                    
                                     # Update agent data
                                     agent_obj["audit_data"] = audit_result
                                     agent_obj["total_chats"] = len(transcripts)
                                     agent_obj["audit_timestamp"] = datetime.now()
+                                    agent_obj["audit_id"] = audit_id
+                                    agent_obj["chat_ids"] = chat_ids
                                     
                                     results_summary.append({
                                         "agent": agent_name,
                                         "score": audit_result.get('overall_score', 0),
                                         "chats": len(transcripts),
-                                        "status": "✅ Success"
+                                        "status": "♻️ Shared" if shared else "✅ Success"
                                     })
                                 else:
+                                    # The budget refused the call: an estimate fell short, so retry next window
+                                    out_of_budget = refused_calls() > refused_before
+                                    if out_of_budget:
+                                        get_audit_store().defer_audits([(agent_name, entry["cost"].tokens, "budget")])
                                     results_summary.append({
                                         "agent": agent_name,
                                         "score": "N/A",
                                         "chats": len(transcripts),
-                                        "status": "❌ Failed"
+                                        "status": "⏭️ Deferred" if out_of_budget else "❌ Failed"
                                     })
-                            else:
+                        
+                        if model is not None:
+                            model.budget = escalation_model.budget = None
+                        record_audited(get_audit_store(), [row["agent"] for row in results_summary
+                                                           if row["status"] in ("✅ Success", "♻️ Shared")])
+                        for entry in deferred:
+                            results_summary.append({
+                                "agent": entry["agent"],
+                                "score": "N/A",
+                                "chats": len(extracted[entry["agent"]][0]),
+                                "status": "⏭️ Deferred"
+                            })
+                        for agent_name, (transcripts, _) in extracted.items():
+                            if not transcripts:
                                 results_summary.append({
                                     "agent": agent_name,
                                     "score": "N/A",
@@ -1265,61 +1061,81 @@ def main():
                         
                         # Download all reports button
                         st.markdown("### 📥 Download All Reports")
-                        col1, col2 = st.columns(2)
+                        col1, col2, col3, col4 = st.columns(4)
                         
                         with col1:
-                            if st.button("📦 Generate All Excel Reports", use_container_width=True):
-                                with st.spinner("Generating all Excel reports..."):
-                                    import zipfile as zf
-                                    zip_buffer = io.BytesIO()
-                                    
-                                    with zf.ZipFile(zip_buffer, 'w', zf.ZIP_DEFLATED) as zip_file:
-                                        for agent_name in agents_to_process:
-                                            agent_obj = st.session_state.agents[agent_name]
-                                            if agent_obj.get("audit_data"):
-                                                excel_path = f"/tmp/review_{agent_name}.xlsx"
-                                                generate_excel_report(agent_obj, agent_name, excel_path)
-                                                
-                                                with open(excel_path, 'rb') as f:
-                                                    zip_file.writestr(f"{agent_name}_Performance_Review.xlsx", f.read())
+                            # Built when clicked; "ignore" keeps these results on screen instead of rerunning
+                            st.download_button(
+                                label="📦 Download All Excel Reports (ZIP)",
+                                data=report_archive_download(
+                                    [(name, st.session_state.agents[name]) for name in agents_to_process], ("xlsx",)
+                                ),
+                                file_name=f"HostAfrica_Bulk_Reviews_{datetime.now().strftime('%Y%m%d')}.zip",
+                                mime="application/zip",
+                                on_click="ignore",
+                                use_container_width=True
+                            )
+                        
+                        with col2:
+                            # Built when clicked; "ignore" keeps these results on screen instead of rerunning
+                            st.download_button(
+                                label="📄 Download All PDF Reports (ZIP)",
+                                data=report_archive_download(
+                                    [(name, st.session_state.agents[name]) for name in agents_to_process], ("pdf",)
+                                ),
+                                file_name=f"HostAfrica_Bulk_Reviews_PDF_{datetime.now().strftime('%Y%m%d')}.zip",
+                                mime="application/zip",
+                                on_click="ignore",
+                                use_container_width=True
+                            )
+                        
+                        with col3:
+                            if st.button("📒 Generate Team Workbook", use_container_width=True):
+                                with st.spinner("Generating team workbook..."):
+                                    # A file of its own per run, so concurrent sessions do not overwrite each other
+                                    with tempfile.NamedTemporaryFile(suffix=".xlsx") as team_file:
+                                        generate_team_excel_report(
+                                            [(name, st.session_state.agents[name]) for name in agents_to_process],
+                                            team_file.name
+                                        )
+                                        with open(team_file.name, 'rb') as f:
+                                            team_workbook = f.read()
                                     
-                                    zip_buffer.seek(0)
                                     st.download_button(
-                                        label="⬇️ Download All Excel Reports (ZIP)",
-                                        data=zip_buffer.getvalue(),
-                                        file_name=f"HostAfrica_Bulk_Reviews_{datetime.now().strftime('%Y%m%d')}.zip",
-                                        mime="application/zip",
+                                        label="⬇️ Download Team Workbook (Excel)",
+                                        data=team_workbook,
+                                        file_name=f"HostAfrica_Team_Review_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                                         use_container_width=True
                                     )
-                                    st.success("✅ All Excel reports ready!")
+                                    st.success("✅ Team workbook ready!")
                         
-                        with col2:
-                            if st.button("📄 Generate All PDF Reports", use_container_width=True):
-                                with st.spinner("Generating all PDF reports..."):
-                                    import zipfile as zf
-                                    zip_buffer = io.BytesIO()
-                                    
-                                    with zf.ZipFile(zip_buffer, 'w', zf.ZIP_DEFLATED) as zip_file:
-                                        for agent_name in agents_to_process:
-                                            agent_obj = st.session_state.agents[agent_name]
-                                            if agent_obj.get("audit_data"):
-                                                pdf_path = f"/tmp/review_{agent_name}.pdf"
-                                                generate_pdf_report(agent_obj, agent_name, pdf_path)
-                                                
-                                                with open(pdf_path, 'rb') as f:
-                                                    zip_file.writestr(f"{agent_name}_Performance_Review.pdf", f.read())
+                        with col4:
+                            if st.button("📚 Generate Team PDF", use_container_width=True):
+                                with st.spinner("Generating team PDF..."):
+                                    # A file of its own per run, so concurrent sessions do not overwrite each other
+                                    with tempfile.NamedTemporaryFile(suffix=".pdf") as team_file:
+                                        generate_team_pdf_report(
+                                            [(name, st.session_state.agents[name]) for name in agents_to_process],
+                                            team_file.name
+                                        )
+                                        with open(team_file.name, 'rb') as f:
+                                            team_pdf = f.read()
                                     
-                                    zip_buffer.seek(0)
                                     st.download_button(
-                                        label="⬇️ Download All PDF Reports (ZIP)",
-                                        data=zip_buffer.getvalue(),
-                                        file_name=f"HostAfrica_Bulk_Reviews_PDF_{datetime.now().strftime('%Y%m%d')}.zip",
-                                        mime="application/zip",
+                                        label="⬇️ Download Team PDF",
+                                        data=team_pdf,
+                                        file_name=f"HostAfrica_Team_Review_{datetime.now().strftime('%Y%m%d')}.pdf",
+                                        mime="application/pdf",
                                         use_container_width=True
                                     )
-                                    st.success("✅ All PDF reports ready!")
+                                    st.success("✅ Team PDF ready!")
             else:
                 st.info("📤 Please upload a ZIP file to begin bulk processing")
+            
+            # Built from the shared store, so it survives reruns and includes other sessions' and workers' audits
+            st.markdown("---")
+            display_team_analytics()
         
         tab_results = tab3
     else:
@@ -1332,6 +1148,11 @@ def main():
             
             st.markdown("---")
             
+            # Historical trends
+            display_trends(selected_agent)
+            
+            st.markdown("---")
+            
             # Export section
             st.markdown("### 📥 Export Report")
             
@@ -1382,6 +1203,23 @@ def main():
                         )
                         
                         st.success("✅ Excel report generated!")
+                
+                # QA review form filled from template.xlsx
+                if st.button("🗂️ Generate QA Review Form", use_container_width=True):
+                    with st.spinner("Filling QA review form..."):
+                        form_path = f"/tmp/qa_review_form_{selected_agent}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+                        generate_template_excel_report(agent, selected_agent, form_path)
+                        
+                        with open(form_path, "rb") as f:
+                            st.download_button(
+                                label="⬇️ Download QA Review Form",
+                                data=f.read(),
+                                file_name=f"HostAfrica_QA_Review_{selected_agent}_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                                use_container_width=True
+                            )
+                        
+                        st.success("✅ QA review form generated!")
             
             with col3:
                 # Download JSON
@@ -1395,6 +1233,9 @@ def main():
                 )
         else:
             st.info("ℹ️ No audit data available. Please run an audit in the 'Audit Interface' tab first.")
+    
+    with tab_search:
+        display_search(agent_list)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,672 @@
+import json
+import logging
+import math
+from instrumentation import METRICS, stage
+from issue_classifier import classify_issues
+from sampling import collapse_near_duplicates, stratified_batches, stratified_sample
+from scoring import (
+    CONSISTENCY_TOLERANCE,
+    LAZY_ADJUSTED_FIRST,
+    LAZY_ADJUSTED_REST,
+    LAZY_PERFECT_SCORES,
+    METRIC_KEYS,
+    count_perfect_scores,
+    weight_percentages,
+    weighted_overall,
+)
+
+logger = logging.getLogger(__name__)
+
+# Use up to 50 transcripts for comprehensive analysis
+MAX_SAMPLE_SIZE = 50
+CHAT_SEPARATOR = "\n\n========== NEW CHAT SESSION ==========\n\n"
+
+# Tiered audits: a short triage prompt scores every agent; only some get the full 20-example audit
+TRIAGE_SAMPLE_SIZE = 20
+# Overall-score band floors (see "Understanding the Scores" in the README)
+SCORE_BANDS = ((8.0, "Exceptional"), (6.0, "Good"), (4.0, "Adequate"), (0.0, "Significant training needed"))
+# Triage scores within this many points of a band floor are escalated
+TRIAGE_BORDER_MARGIN = 0.5
+
+# Adaptive sampling: audit in rounds of ADAPTIVE_BATCH_SIZE chats until the metric estimates settle
+ADAPTIVE_BATCH_SIZE = 10
+ADAPTIVE_MIN_ROUNDS = 2
+# Stop once every metric's 95% confidence interval is within +/- this many points (0-5 scale)
+ADAPTIVE_CI_HALF_WIDTH = 0.25
+# Two-sided 95% Student t critical values for 1-10 degrees of freedom
+T_CRITICAL_95 = (12.71, 4.30, 3.18, 2.78, 2.57, 2.45, 2.36, 2.31, 2.26, 2.23)
+# List fields merged across rounds (round-robin, without repeats)
+MERGED_LIST_FIELDS = ("key_strengths", "key_development_areas", "recommended_training", "standout_moments",
+                      "critical_incidents")
+MAX_TECHNICAL_EXAMPLES = 20
+
+# --- NOTIFICATIONS ---
+class LogNotifier:
+    """Default sink for audit warnings outside Streamlit (the st module has the same interface)"""
+    
+    def error(self, message):
+        logger.error(message)
+    
+    def warning(self, message):
+        logger.warning(message)
+    
+    def info(self, message):
+        logger.info(message)
+
+# --- ENHANCED AI AUDIT LOGIC ---
+def build_audit_prompt(transcripts, agent_name, chat_ids=None, cluster_sizes=None, weights=None):
+    """Assemble the full rubric prompt for an agent's transcript sample"""
+    
+    pct = weight_percentages(weights)
+    sample_size = min(MAX_SAMPLE_SIZE, len(transcripts))
+    chats = transcripts[:sample_size]
+    if cluster_sizes:
+        # A representative chat stands for its near-duplicates, which are not sent
+        chats = [f"NEAR-DUPLICATES: {size} similar chats handled the same way\n{transcript}" if size > 1
+                 else transcript for size, transcript in zip(cluster_sizes, chats)]
+    if chat_ids:
+        # Label each chat so examples can cite the transcript they come from
+        chats = [f"CHAT ID: {chat_id}\n{chat}" for chat_id, chat in zip(chat_ids[:sample_size], chats)]
+    sample = CHAT_SEPARATOR.join(chats)
+    duplicates_note = ""
+    if cluster_sizes and any(size > 1 for size in cluster_sizes[:sample_size]):
+        duplicates_note = ("Chats marked NEAR-DUPLICATES each represent that many near-identical chats. "
+                           "Weigh recurring behavior by that count, but cite each chat only once.\n")
+    
+    return f"""
+You are a Senior Technical QA Auditor at HostAfrica with 10+ years of experience evaluating technical support quality.
+You are conducting a comprehensive performance review of agent: {agent_name}
+
+CRITICAL INSTRUCTIONS:
+1. Analyze ONLY the agent's performance, NOT bots or automated messages
+2. Focus on REAL examples from the actual chat transcripts provided
+3. All scores must use the correct scale as specified
+4. Provide actionable, specific feedback based on actual chat evidence
+5. Pay special attention to PIN verification protocol - this is a critical security measure
+
+⚠️ CRITICAL SCORING REQUIREMENTS:
+- DO NOT give default scores of 5.0/5.0 to all metrics except one
+- EACH metric must be individually analyzed and scored based on actual chat evidence
+- Scores of 5.0 should be RARE and only for truly exceptional performance with ZERO issues
+- Most agents should score between 3.0-4.5 in each area
+- Identify specific strengths AND weaknesses in EVERY metric
+- If you only analyze one metric properly, the report will be REJECTED
+
+✅ KNOWLEDGE BASE USAGE - POSITIVE BEHAVIOR:
+- Agents sharing help.hostafrica.com links should be COMMENDED, not penalized
+- This shows: (1) Proactive customer education, (2) Efficient resource sharing, (3) Empowering customers
+- Treat knowledge base sharing as a STRENGTH in Communication & Professionalism
+- Example praise: "Agent effectively utilized knowledge base resources to educate customer"
+
+SCORING SCALES:
+- Individual metrics: 0.0 to 5.0 (where 5.0 is exceptional)
+- Overall score: 0.0 to 10.0 (composite of all metrics)
+
+CRITICAL: The overall score MUST be mathematically consistent with the individual metrics:
+- Overall Score = Weighted Average of Metrics (converted to 10-point scale)
+- Formula: (Security×{pct['security_pin_protocol']} + Technical×{pct['technical_capability']} + Communication×{pct['communication_professionalism']} + Investigative×{pct['investigative_approach']} + Ownership×{pct['chat_ownership_resolution']}) × 2
+- Example: If all metrics are 4.0/5.0, overall should be 8.0/10.0
+- Example: If all metrics are 5.0/5.0, overall MUST be 10.0/10.0
+- Do NOT give perfect scores (5.0) unless truly exceptional performance with zero issues
+
+EVALUATION FRAMEWORK (Weighted):
+
+1. SECURITY & PIN VERIFICATION PROTOCOL (Weight: {pct['security_pin_protocol']})
+   CRITICAL FOCUS AREAS:
+   - Did agent request PIN when initiating new chats OR when taking over from bot?
+   - Did agent avoid redundant PIN requests (not asking for already-provided PIN in SAME session)?
+   - Did agent follow proper security procedures consistently?
+   - IMPORTANT: In transferred chats, agent MUST re-verify PIN in their own session before account actions
+   - Flag any instances where account modifications were made without explicit PIN verification
+   Rate: 0.0-5.0
+
+2. TECHNICAL CAPABILITY & ACCURACY (Weight: {pct['technical_capability']})
+   - Accuracy in diagnosing DNS, Email, SSL, WordPress, hosting issues
+   - Proper use of diagnostic tools (Ping, Traceroute, WHOIS, cPanel)
+   - Correctness of technical solutions provided
+   - Depth of technical knowledge demonstrated
+   - ✅ POSITIVE: Effective use of help.hostafrica.com knowledge base (shows resourcefulness)
+   - IMPORTANT: Score this metric based on actual technical performance observed in chats
+   Rate: 0.0-5.0
+
+3. COMMUNICATION & PROFESSIONALISM (Weight: {pct['communication_professionalism']})
+   - Clarity and professionalism in communication
+   - Empathy and patience with customers (especially frustrated ones)
+   - Grammar, spelling, and tone appropriateness
+   - De-escalation techniques for difficult situations
+   - ✅ POSITIVE: Sharing help.hostafrica.com resources (proactive customer education)
+   - IMPORTANT: Score this metric based on actual communication quality observed in chats
+   Rate: 0.0-5.0
+
+4. INVESTIGATIVE & PROBLEM-SOLVING APPROACH (Weight: {pct['investigative_approach']})
+   - Systematic troubleshooting methodology
+   - Asking relevant diagnostic questions
+   - Root cause analysis capability
+   - Thoroughness in investigation
+   - Proactive information gathering
+   - IMPORTANT: Score this metric based on actual investigative behavior observed in chats
+   - DO NOT give 5.0 unless agent demonstrates exceptional investigation in multiple chats
+   Rate: 0.0-5.0
+
+5. CHAT OWNERSHIP & RESOLUTION (Weight: {pct['chat_ownership_resolution']})
+   - Taking full ownership of issues
+   - Following through to resolution
+   - Proactive communication and updates
+   - Proper escalation when needed
+   - Ensuring customer satisfaction
+   - IMPORTANT: Score this metric based on actual ownership behavior observed in chats
+   - DO NOT give 5.0 unless agent demonstrates exceptional ownership in multiple chats
+   Rate: 0.0-5.0
+
+OUTPUT REQUIREMENTS:
+Provide exactly 20 detailed technical examples from the actual transcripts. Each example must:
+- Reference a REAL issue from the chats
+- Give the CHAT ID line of the chat it comes from
+- Show the ACTUAL agent action/response
+- Include specific improvement recommendations
+- Indicate PIN handling quality (Yes/No/Redundant/N/A)
+- Classify severity (Minor/Moderate/Major/Critical)
+
+IMPORTANT: For PIN verification:
+- "Yes" = Agent properly requested/verified PIN before account actions
+- "No" = Agent performed account actions WITHOUT proper PIN verification (SECURITY RISK)
+- "Redundant" = Agent asked for PIN that was already provided in same session
+- "N/A" = No account access required (e.g., general questions, pre-sales)
+
+Return ONLY valid JSON in this exact structure:
+{{
+    "overall_score": 0.0,
+    "overall_assessment": "Comprehensive 3-4 paragraph summary of agent's performance, highlighting key patterns observed across all interactions. Include commentary on chat volume performance.",
+    "metrics": {{
+        "security_pin_protocol": 0.0,
+        "technical_capability": 0.0,
+        "communication_professionalism": 0.0,
+        "investigative_approach": 0.0,
+        "chat_ownership_resolution": 0.0
+    }},
+    "key_strengths": [
+        "Specific strength with example from chats",
+        "Specific strength with example from chats",
+        "Specific strength with example from chats",
+        "Specific strength with example from chats",
+        "Specific strength with example from chats"
+    ],
+    "key_development_areas": [
+        "Specific area for improvement with actionable advice",
+        "Specific area for improvement with actionable advice",
+        "Specific area for improvement with actionable advice",
+        "Specific area for improvement with actionable advice",
+        "Specific area for improvement with actionable advice"
+    ],
+    "pin_protocol_feedback": "DETAILED analysis of PIN verification practices across all chats. Specifically note: (1) How many chats had proper PIN verification, (2) How many had PIN bypasses, (3) Pattern analysis - does agent verify in new chats but skip in transferred chats?, (4) Specific examples of good and poor PIN handling, (5) Security risk assessment",
+    "technical_examples": [
+        {{
+            "example_number": 1,
+            "chat_id": "Value of the CHAT ID line above the chat this example comes from",
+            "client_name": "Customer's name from the chat (e.g., 'John Doe', 'Sarah Smith')",
+            "pin_number": "PIN number if mentioned in chat (e.g., '1234', 'Not provided', 'N/A')",
+            "issue_type": "VPS/Server, Domain/WHOIS, DNS, Email, SSL, WordPress, cPanel, Billing, etc.",
+            "customer_issue": "Specific detailed customer complaint or issue",
+            "agent_action": "Detailed description of what agent actually did or said",
+            "pin_handled_well": "Yes/No/Redundant/N/A",
+            "outcome": "What happened as a result of agent's action",
+            "assessment": "Critical evaluation - was this handled well or poorly? Why?",
+            "improvement": "Specific actionable improvement suggestion or 'None' if handled perfectly",
+            "severity": "Minor/Moderate/Major/Critical"
+        }},
+        {{
+            "example_number": 2,
+            ... (continue for 20 examples total)
+        }}
+    ],
+    "performance_trends": {{
+        "response_time_assessment": "Analysis of agent's response speed and communication timing",
+        "consistency": "How consistent is the agent's performance across different issue types",
+        "technical_depth": "Assessment of technical knowledge depth and problem-solving capability",
+        "customer_satisfaction_indicators": "Signs of customer satisfaction or frustration based on chat outcomes"
+    }},
+    "recommended_training": [
+        "Specific training recommendation based on identified gaps (minimum 3)",
+        "Specific training recommendation based on identified gaps",
+        "Specific training recommendation based on identified gaps"
+    ],
+    "standout_moments": [
+        "Exceptional handling example with specific details from chats",
+        "Exceptional handling example with specific details from chats"
+    ],
+    "critical_incidents": [
+        "Any critical errors, serious security lapses, or major issues (be specific)"
+    ]
+}}
+
+CHAT TRANSCRIPTS TO ANALYZE:
+{duplicates_note}{sample}
+
+Remember: Base ALL examples and assessments on the ACTUAL transcripts provided above. Be specific, fair, and constructive. Focus heavily on PIN verification protocol as this is a critical security concern for HostAfrica.
+"""
+
+def parse_audit_response(text):
+    """Strip Markdown fences from the model output and parse the audit JSON"""
+    
+    # Clean up JSON response
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0]
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0]
+    
+    # Parse JSON
+    return json.loads(text.strip())
+
+def postprocess_audit_scores(audit_result, notify=None, weights=None):
+    """Cap scores, correct lazy scoring and make the overall score consistent with the (profile) weighted metrics"""
+    notify = notify or LogNotifier()
+    
+    # Validate and cap scores
+    audit_result['overall_score'] = min(float(audit_result.get('overall_score', 0)), 10.0)
+    for key in audit_result.get('metrics', {}):
+        audit_result['metrics'][key] = min(float(audit_result['metrics'][key]), 5.0)
+    
+    # CRITICAL FIX: Detect lazy scoring (AI giving 5.0 to all metrics except one)
+    metrics = audit_result.get('metrics', {})
+    if metrics:
+        metric_values = [float(v) for v in metrics.values()]
+        perfect_scores = count_perfect_scores(metrics)
+        
+        # If 4 or more metrics are exactly 5.0, AI is being lazy
+        if perfect_scores >= LAZY_PERFECT_SCORES:
+            notify.error("⚠️ WARNING: AI appears to have given default scores without proper analysis!")
+            notify.error(f"Found {perfect_scores} metrics with perfect 5.0 scores - this is extremely rare.")
+            notify.error("The AI may not have properly analyzed all metrics. Consider re-running the audit.")
+            
+            # Automatically adjust obvious lazy scoring
+            if perfect_scores == LAZY_PERFECT_SCORES and len(metric_values) == 5:
+                notify.warning("🔧 Applying realistic score adjustment to prevent lazy scoring...")
+                # Adjust the perfect scores to more realistic values (4.0-4.5 range)
+                adjusted_count = 0
+                for key, value in metrics.items():
+                    if float(value) == 5.0 and adjusted_count < 2:
+                        # Don't adjust all, just bring some down to realistic range
+                        metrics[key] = LAZY_ADJUSTED_FIRST
+                        adjusted_count += 1
+                    elif float(value) == 5.0:
+                        metrics[key] = LAZY_ADJUSTED_REST
+                
+                notify.info("✅ Scores adjusted to more realistic range. All metrics now individually assessed.")
+    
+    # CRITICAL FIX: Recalculate overall score based on weighted metrics to ensure consistency
+    if metrics:
+        calculated_overall = round(weighted_overall(metrics, weights), 1)
+        
+        # Use calculated score if it differs significantly from AI's score
+        ai_overall = float(audit_result.get('overall_score', 0))
+        if abs(calculated_overall - ai_overall) > CONSISTENCY_TOLERANCE:
+            notify.warning(f"⚠️ AI score ({ai_overall}) adjusted to calculated score ({calculated_overall}) for consistency")
+            audit_result['overall_score'] = calculated_overall
+    
+    return audit_result
+
+def link_examples_to_chats(audit_result, chat_ids):
+    """Keep an example's chat_id only if it names a chat that was actually in the prompt"""
+    known = set(chat_ids)
+    for example in audit_result.get('technical_examples', []):
+        chat_id = str(example.get('chat_id', '')).strip()
+        example['chat_id'] = chat_id if chat_id in known else None
+    return audit_result
+
+def issue_labels(transcripts, chat_ids=None, issue_types=None):
+    """Issue type per chat: from the chat id -> label map where known, classified locally otherwise"""
+    labels = [None] * len(transcripts)
+    if issue_types and chat_ids:
+        labels = [issue_types.get(chat_id) for chat_id in chat_ids]
+    missing = [i for i, label in enumerate(labels) if label is None]
+    for i, label in zip(missing, classify_issues([transcripts[i] for i in missing])):
+        labels[i] = label
+    return labels
+
+def stratify_by_issue(transcripts, chat_ids=None, cluster_sizes=None, issue_types=None):
+    """Reorder chats so the first MAX_SAMPLE_SIZE cover every issue type in proportion.
+    
+    issue_types maps chat id -> label (e.g. from the chat index); chats without
+    one are classified locally. Near-duplicate clusters count by their size.
+    """
+    if len(transcripts) <= MAX_SAMPLE_SIZE:
+        return transcripts, chat_ids, cluster_sizes
+    
+    chosen = stratified_sample(issue_labels(transcripts, chat_ids, issue_types), MAX_SAMPLE_SIZE, cluster_sizes)
+    # Unchosen chats stay after the sample, in their original order
+    order = chosen + sorted(set(range(len(transcripts))) - set(chosen))
+    return (
+        [transcripts[i] for i in order],
+        [chat_ids[i] for i in order] if chat_ids else chat_ids,
+        [cluster_sizes[i] for i in order] if cluster_sizes else cluster_sizes,
+    )
+
+def collapse_sample(transcripts, agent_name, chat_ids=None, collapse_duplicates=True):
+    """Near-identical chats (same macro, same issue) are sent once with their count"""
+    if collapse_duplicates and len(transcripts) > 1:
+        return collapse_near_duplicates(transcripts, agent_name, chat_ids)
+    return transcripts, chat_ids, None
+
+def run_comprehensive_audit(transcripts, agent_name, model, notify=None, chat_ids=None, collapse_duplicates=True,
+                            issue_types=None):
+    """Run comprehensive AI-powered audit with detailed analysis"""
+    notify = notify or LogNotifier()
+    
+    if model is None:
+        notify.error("AI Generation Error: no Gemini model configured (check GEMINI_API_KEY)")
+        return None
+    
+    transcripts, chat_ids, cluster_sizes = collapse_sample(transcripts, agent_name, chat_ids, collapse_duplicates)
+    # Spread the sample across issue types instead of taking the first chats
+    transcripts, chat_ids, cluster_sizes = stratify_by_issue(transcripts, chat_ids, cluster_sizes, issue_types)
+    return audit_sample(transcripts, agent_name, model, notify, chat_ids, cluster_sizes)
+
+def generate_audit_json(prompt, agent_name, model, tier="full"):
+    """Send one prompt to the model and parse the JSON it returns (raises on failure)"""
+    with stage("model_call", agent=agent_name, tier=tier, backend=getattr(model, "name", type(model).__name__)) as span:
+        try:
+            response = model.generate_content(prompt)
+        except Exception as e:
+            outcome = "rate_limited" if getattr(e, "code", None) == 429 else "error"
+            METRICS.inc("auditor_model_calls_total", outcome=outcome)
+            raise
+        METRICS.inc("auditor_model_calls_total", outcome="ok")
+        text = response.text
+        
+        # Prefer the API's token counts; fall back to a ~4 characters/token estimate
+        usage = getattr(response, "usage_metadata", None)
+        span.record("prompt_tokens", getattr(usage, "prompt_token_count", None) or len(prompt) // 4)
+        span.record("output_tokens", getattr(usage, "candidates_token_count", None) or len(text) // 4)
+        span.record("output_bytes", len(text.encode("utf-8")))
+    
+    with stage("response_parse", agent=agent_name):
+        try:
+            return parse_audit_response(text)
+        except json.JSONDecodeError as e:
+            e.raw_response = text
+            raise
+
+def report_audit_error(error, notify):
+    """Tell the user why a model call produced no audit"""
+    if isinstance(error, json.JSONDecodeError):
+        notify.error(f"JSON Parsing Error: {error}")
+        notify.error(f"Raw response: {getattr(error, 'raw_response', '')[:500]}")
+    else:
+        notify.error(f"AI Generation Error: {error}")
+
+def audit_sample(transcripts, agent_name, model, notify, chat_ids=None, cluster_sizes=None):
+    """One model call over (up to MAX_SAMPLE_SIZE of) the given chats; returns the post-processed audit or None"""
+    with stage("prompt_build", agent=agent_name) as span:
+        prompt = build_audit_prompt(transcripts, agent_name, chat_ids, cluster_sizes)
+        span.record("prompt_bytes", len(prompt.encode("utf-8")))
+    
+    try:
+        audit_result = generate_audit_json(prompt, agent_name, model)
+        
+        if chat_ids:
+            link_examples_to_chats(audit_result, chat_ids[:MAX_SAMPLE_SIZE])
+        
+        with stage("score_postprocess", agent=agent_name):
+            return postprocess_audit_scores(audit_result, notify)
+        
+    except Exception as e:
+        report_audit_error(e, notify)
+        return None
+
+# --- ADAPTIVE SAMPLING ---
+def confidence_half_width(values):
+    """Half-width of the 95% confidence interval for the mean of values (inf with fewer than two)"""
+    n = len(values)
+    if n < 2:
+        return float("inf")
+    mean = sum(values) / n
+    sd = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+    # Beyond the table, 1.96 + 2.4/df stays within 0.03 of the exact t value
+    t = T_CRITICAL_95[n - 2] if n - 1 <= len(T_CRITICAL_95) else 1.96 + 2.4 / (n - 1)
+    return t * sd / math.sqrt(n)
+
+def _round_robin(lists, limit=None):
+    merged = []
+    for position in range(max((len(items) for items in lists), default=0)):
+        for items in lists:
+            if position < len(items) and items[position] not in merged:
+                merged.append(items[position])
+    return merged[:limit] if limit else merged
+
+def merge_round_results(rounds):
+    """Combine per-round audits [(audit_result, chats), ...] into one audit of all the chats"""
+    total = sum(chats for _, chats in rounds)
+    metrics = {}
+    for key in rounds[0][0].get('metrics', {}):
+        metrics[key] = round(sum(float(result.get('metrics', {}).get(key, 0)) * chats
+                                 for result, chats in rounds) / total, 2)
+    overall = sum(float(result.get('overall_score', 0)) * chats for result, chats in rounds) / total
+    
+    # Narrative fields come from the round whose score is closest to the combined one
+    merged = dict(min(rounds, key=lambda item: abs(float(item[0].get('overall_score', 0)) - overall))[0])
+    merged['metrics'] = metrics
+    merged['overall_score'] = round(overall, 1)
+    for field in MERGED_LIST_FIELDS:
+        lists = [result.get(field, []) for result, _ in rounds]
+        merged[field] = _round_robin(lists, max(len(items) for items in lists) if field != "critical_incidents" else None)
+    
+    examples = _round_robin([result.get('technical_examples', []) for result, _ in rounds], MAX_TECHNICAL_EXAMPLES)
+    merged['technical_examples'] = [dict(example, example_number=number) for number, example in enumerate(examples, 1)]
+    return merged
+
+def adaptive_batches(transcripts, chat_ids=None, cluster_sizes=None, issue_types=None,
+                     batch_size=ADAPTIVE_BATCH_SIZE, max_chats=MAX_SAMPLE_SIZE):
+    """Issue-stratified batches of chat indexes, one per adaptive round"""
+    labels = issue_labels(transcripts, chat_ids, issue_types)
+    return stratified_batches(labels, batch_size, cluster_sizes, max_batches=math.ceil(max_chats / batch_size))
+
+def _pick(indexes, transcripts, chat_ids, cluster_sizes):
+    return (
+        [transcripts[i] for i in indexes],
+        [chat_ids[i] for i in indexes] if chat_ids else None,
+        [cluster_sizes[i] for i in indexes] if cluster_sizes else None,
+    )
+
+def run_adaptive_audit(transcripts, agent_name, model, notify=None, chat_ids=None, collapse_duplicates=True,
+                       issue_types=None, batch_size=ADAPTIVE_BATCH_SIZE, max_chats=MAX_SAMPLE_SIZE,
+                       ci_half_width=ADAPTIVE_CI_HALF_WIDTH):
+    """Audit in rounds of batch_size chats, stopping once metric estimates converge or max_chats is spent.
+    
+    Each round is a normal audit of a fresh, issue-stratified batch. After each
+    round the per-metric means get 95% confidence intervals across rounds;
+    auditing stops when all are within +/- ci_half_width, so consistent agents
+    cost fewer tokens and variable ones get more evidence. The result is the
+    usual audit JSON plus an "adaptive_sampling" summary.
+    """
+    notify = notify or LogNotifier()
+    
+    if model is None:
+        notify.error("AI Generation Error: no Gemini model configured (check GEMINI_API_KEY)")
+        return None
+    
+    transcripts, chat_ids, cluster_sizes = collapse_sample(transcripts, agent_name, chat_ids, collapse_duplicates)
+    batches = adaptive_batches(transcripts, chat_ids, cluster_sizes, issue_types, batch_size, max_chats)
+    
+    rounds = []
+    history = {key: [] for key in METRIC_KEYS}
+    stop_reason = "budget" if sum(len(batch) for batch in batches) < len(transcripts) else "exhausted"
+    with stage("adaptive_audit", agent=agent_name) as span:
+        for batch in batches:
+            batch_chats, batch_ids, batch_sizes = _pick(batch, transcripts, chat_ids, cluster_sizes)
+            result = audit_sample(batch_chats, agent_name, model, notify, batch_ids, batch_sizes)
+            if not result:
+                stop_reason = "error"
+                break
+            rounds.append((result, sum(cluster_sizes[i] for i in batch) if cluster_sizes else len(batch)))
+            span.record("rounds", 1)
+            span.record("chats_sent", len(batch))
+            for key in history:
+                history[key].append(float(result.get('metrics', {}).get(key, 0)))
+            
+            if len(rounds) >= ADAPTIVE_MIN_ROUNDS and \
+                    max(confidence_half_width(values) for values in history.values()) <= ci_half_width:
+                stop_reason = "converged"
+                break
+    METRICS.inc("auditor_adaptive_audits_total", outcome=stop_reason)
+    
+    if not rounds:
+        return None
+    
+    merged = merge_round_results(rounds)
+    intervals = {}
+    for key, values in history.items():
+        width = confidence_half_width(values)
+        if math.isfinite(width) and key in merged['metrics']:
+            intervals[key] = [round(max(merged['metrics'][key] - width, 0.0), 2),
+                              round(min(merged['metrics'][key] + width, 5.0), 2)]
+    merged['adaptive_sampling'] = {
+        "rounds": len(rounds),
+        "chats_audited": sum(len(batch) for batch in batches[:len(rounds)]),
+        "chats_available": len(transcripts),
+        "stop_reason": stop_reason,
+        "confidence_intervals": intervals,
+    }
+    return postprocess_audit_scores(merged, notify)
+
+# --- TIERED AUDITS ---
+def build_triage_prompt(transcripts, agent_name, chat_ids=None, cluster_sizes=None, weights=None):
+    """Compact scoring-only prompt used to decide whether an agent needs the full audit"""
+    
+    pct = weight_percentages(weights)
+    chats = transcripts[:TRIAGE_SAMPLE_SIZE]
+    if cluster_sizes:
+        chats = [f"NEAR-DUPLICATES: {size} similar chats handled the same way\n{transcript}" if size > 1
+                 else transcript for size, transcript in zip(cluster_sizes, chats)]
+    if chat_ids:
+        chats = [f"CHAT ID: {chat_id}\n{chat}" for chat_id, chat in zip(chat_ids[:TRIAGE_SAMPLE_SIZE], chats)]
+    sample = CHAT_SEPARATOR.join(chats)
+    
+    return f"""
+You are a Senior Technical QA Auditor at HostAfrica doing a QUICK TRIAGE of agent: {agent_name}
+Score ONLY the agent (not bots or visitors) from the chats below. Be strict: 5.0 means exceptional with zero issues.
+
+Metrics (0.0-5.0) and weights:
+- security_pin_protocol ({pct['security_pin_protocol']}): PIN requested/re-verified before any account action, including transferred chats
+- technical_capability ({pct['technical_capability']}): correct diagnosis and solutions (DNS, Email, SSL, WordPress, hosting)
+- communication_professionalism ({pct['communication_professionalism']}): clarity, empathy, tone; sharing help.hostafrica.com links is a strength
+- investigative_approach ({pct['investigative_approach']}): systematic troubleshooting and root-cause questions
+- chat_ownership_resolution ({pct['chat_ownership_resolution']}): ownership, follow-through, escalation
+
+overall_score (0.0-10.0) = weighted average of the metrics x 2.
+critical_incidents lists only serious problems (account changes without PIN verification, data loss, abuse); leave it empty otherwise.
+
+Return ONLY valid JSON:
+{{
+    "overall_score": 0.0,
+    "overall_assessment": "One short paragraph",
+    "metrics": {{
+        "security_pin_protocol": 0.0,
+        "technical_capability": 0.0,
+        "communication_professionalism": 0.0,
+        "investigative_approach": 0.0,
+        "chat_ownership_resolution": 0.0
+    }},
+    "key_strengths": ["Up to 3 short items"],
+    "key_development_areas": ["Up to 3 short items"],
+    "pin_protocol_feedback": "Two or three sentences",
+    "critical_incidents": []
+}}
+
+CHATS:
+{sample}
+"""
+
+def score_band(overall_score):
+    """Name of the README band an overall score falls in"""
+    for floor, band in SCORE_BANDS:
+        if overall_score >= floor:
+            return band
+    return SCORE_BANDS[-1][1]
+
+def escalation_reasons(triage_result, raw_metrics):
+    """Why a triaged agent needs the full audit (empty when the triage result can stand)"""
+    reasons = []
+    overall = float(triage_result.get('overall_score', 0))
+    if any(floor and abs(overall - floor) <= TRIAGE_BORDER_MARGIN for floor, _ in SCORE_BANDS):
+        reasons.append("borderline")
+    if triage_result.get('critical_incidents'):
+        reasons.append("critical_incidents")
+    if raw_metrics and count_perfect_scores(raw_metrics) >= LAZY_PERFECT_SCORES:
+        reasons.append("lazy_scoring")
+    return reasons
+
+def triage_prompt(transcripts, agent_name, chat_ids=None, collapse_duplicates=True, issue_types=None):
+    """The triage prompt for an agent's chats"""
+    sample, sample_ids, cluster_sizes = collapse_sample(transcripts, agent_name, chat_ids, collapse_duplicates)
+    # Stratify for the smaller triage sample, so it still covers the agent's issue mix
+    chosen = stratified_sample(issue_labels(sample, sample_ids, issue_types), TRIAGE_SAMPLE_SIZE, cluster_sizes)
+    chats, ids, sizes = _pick(chosen, sample, sample_ids, cluster_sizes)
+    return build_triage_prompt(chats, agent_name, ids, sizes)
+
+def audit_prompts(transcripts, agent_name, chat_ids=None, issue_types=None, adaptive=False, tiered=False,
+                  collapse_duplicates=True):
+    """Every prompt an audit can send, built as the audit builds them (adaptive at its maximum rounds).
+    
+    Used to cost an audit before it runs; returns [] when there are no chats.
+    """
+    if not transcripts:
+        return []
+    prompts = [triage_prompt(transcripts, agent_name, chat_ids, collapse_duplicates, issue_types)] if tiered else []
+    sample, sample_ids, cluster_sizes = collapse_sample(transcripts, agent_name, chat_ids, collapse_duplicates)
+    if adaptive:
+        for batch in adaptive_batches(sample, sample_ids, cluster_sizes, issue_types):
+            chats, ids, sizes = _pick(batch, sample, sample_ids, cluster_sizes)
+            prompts.append(build_audit_prompt(chats, agent_name, ids, sizes))
+    else:
+        chats, ids, sizes = stratify_by_issue(sample, sample_ids, cluster_sizes, issue_types)
+        prompts.append(build_audit_prompt(chats, agent_name, ids, sizes))
+    return prompts
+
+def run_tiered_audit(transcripts, agent_name, model, notify=None, chat_ids=None, collapse_duplicates=True,
+                     issue_types=None, escalation_model=None, full_audit=run_comprehensive_audit):
+    """Triage every agent with a short prompt; run the full audit only where the triage is not conclusive.
+    
+    Agents near a score band floor, with critical incidents or with lazy-looking
+    scores are escalated to full_audit on escalation_model (default: model). The
+    others keep the triage result, which has scores and a short summary but no
+    technical examples. Either way the result carries a "triage" summary.
+    """
+    notify = notify or LogNotifier()
+    
+    if model is None:
+        notify.error("AI Generation Error: no Gemini model configured (check GEMINI_API_KEY)")
+        return None
+    
+    with stage("prompt_build", agent=agent_name, tier="triage") as span:
+        prompt = triage_prompt(transcripts, agent_name, chat_ids, collapse_duplicates, issue_types)
+        span.record("prompt_bytes", len(prompt.encode("utf-8")))
+    
+    try:
+        triage_result = generate_audit_json(prompt, agent_name, model, tier="triage")
+        raw_metrics = dict(triage_result.get('metrics', {}))
+        with stage("score_postprocess", agent=agent_name):
+            # Lazy scoring is handled by escalating, so keep its warnings out of the UI
+            triage_result = postprocess_audit_scores(triage_result, LogNotifier())
+        reasons = escalation_reasons(triage_result, raw_metrics)
+    except Exception as e:
+        # A failed triage is no reason to skip the agent: fall back to the full audit
+        logger.warning("Triage failed for %s (%s); running the full audit", agent_name, e)
+        triage_result, reasons = None, ["triage_failed"]
+    
+    METRICS.inc("auditor_triage_total", outcome="escalated" if reasons else "settled")
+    triage = {
+        "band": score_band(float(triage_result['overall_score'])) if triage_result else None,
+        "triage_score": triage_result['overall_score'] if triage_result else None,
+        "escalated": bool(reasons),
+        "reasons": reasons,
+    }
+    if not reasons:
+        triage_result.setdefault('technical_examples', [])
+        triage_result['triage'] = triage
+        return triage_result
+    
+    audit_result = full_audit(transcripts, agent_name, escalation_model or model, notify=notify, chat_ids=chat_ids,
+                              collapse_duplicates=collapse_duplicates, issue_types=issue_types)
+    if audit_result:
+        audit_result['triage'] = triage
+    return audit_result
@@ -0,0 +1,877 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+
+logger = logging.getLogger("auditor.audit_store")
+
+# --- CONFIGURATION ---
+DEFAULT_STORE_URL = os.environ.get("AUDIT_STORE_URL", "sqlite:///audit_store.db")
+
+# How long an in-flight audit may hold an agent lock before others may take over
+DEFAULT_LEASE_SECONDS = 600
+# How long a second requester waits for the first result before giving up
+DEFAULT_WAIT_TIMEOUT = 900
+# Lock renewals per lease period, so a couple of slow store writes do not lose the lock
+RENEWALS_PER_LEASE = 3
+
+# Team used for agents that have not been assigned one
+DEFAULT_TEAM = "Unassigned"
+
+# Labels counted by team analytics, as the audit prompt asks for them
+SEVERITY_LEVELS = ("Minor", "Moderate", "Major", "Critical")
+PIN_OUTCOMES = {"yes": "yes", "no": "no", "redundant": "redundant", "n/a": "na"}
+
+# How long a worker holds a queued agent audit without a heartbeat before another worker may take it
+DEFAULT_WORK_LEASE_SECONDS = 120
+# Claims of one work item (including ones whose worker died) before it is marked failed
+MAX_WORK_ATTEMPTS = 3
+
+
+def week_start(timestamp):
+    """Monday (ISO date string) of the week containing an ISO timestamp"""
+    day = datetime.fromisoformat(timestamp).date()
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+
+def extract_metric_values(audit_data):
+    """Flatten an audit into {metric: value}, including the overall score"""
+    values = {}
+    if audit_data.get("overall_score") is not None:
+        values["overall_score"] = float(audit_data["overall_score"])
+    for key, value in (audit_data.get("metrics") or {}).items():
+        try:
+            values[key] = float(value)
+        except (TypeError, ValueError):
+            continue
+    return values
+
+
+def extract_audit_facts(audit_data, total_chats=0):
+    """Countable facts of an audit for team analytics: chats, examples, severities and PIN handling"""
+    facts = {"chats": int(total_chats or 0), "examples": 0}
+    facts.update({f"severity_{severity.lower()}": 0 for severity in SEVERITY_LEVELS})
+    facts.update({f"pin_{outcome}": 0 for outcome in PIN_OUTCOMES.values()})
+    for example in audit_data.get("technical_examples") or []:
+        if not isinstance(example, dict):
+            continue
+        facts["examples"] += 1
+        severity = str(example.get("severity") or "").strip().title()
+        if severity in SEVERITY_LEVELS:
+            facts[f"severity_{severity.lower()}"] += 1
+        outcome = PIN_OUTCOMES.get(str(example.get("pin_handled_well") or "").strip().lower())
+        if outcome:
+            facts[f"pin_{outcome}"] += 1
+    return facts
+
+
+def compute_audit_key(agent_name, transcripts, variant=None):
+    """Fingerprint an audit request so identical requests can be shared across sessions.
+
+    variant distinguishes audit modes (e.g. "adaptive") that would give a different
+    result for the same chats; plain audits keep their existing keys.
+    """
+    digest = hashlib.sha256(agent_name.encode("utf-8"))
+    if variant:
+        digest.update(b"\x01" + variant.encode("utf-8"))
+    for transcript in transcripts:
+        digest.update(b"\x00")
+        digest.update(transcript.encode("utf-8"))
+    return digest.hexdigest()
+
+
+# --- STORE INTERFACE ---
+class AuditStore(ABC):
+    """Pluggable persistent store for agents, audit results, metadata and history"""
+
+    @abstractmethod
+    def upsert_agent(self, name):
+        """Register an agent (no-op if it already exists)"""
+
+    @abstractmethod
+    def delete_agent(self, name):
+        """Remove an agent from the shared roster (audit history is kept)"""
+
+    @abstractmethod
+    def list_agents(self):
+        """Return roster rows: name, team, total_chats, last_audit_id, last_audit_at"""
+
+    @abstractmethod
+    def set_agent_team(self, name, team):
+        """Assign an agent to a team (used by future audits' team aggregates)"""
+
+    @abstractmethod
+    def save_audit(self, agent_name, audit_key, audit_data, total_chats, metadata=None):
+        """Persist a completed audit and make it the agent's latest result; returns the audit id"""
+
+    @abstractmethod
+    def get_audit(self, audit_id):
+        """Return a stored audit record by id, or None"""
+
+    @abstractmethod
+    def get_latest_audit(self, agent_name):
+        """Return the agent's most recent audit record, or None"""
+
+    @abstractmethod
+    def get_audit_history(self, agent_name, limit=50):
+        """Return the agent's audit records, newest first"""
+
+    @abstractmethod
+    def find_audit_by_key(self, agent_name, audit_key, after_id=0):
+        """Return the newest audit for this request fingerprint with id > after_id, or None"""
+
+    @abstractmethod
+    def get_agent_metric_series(self, agent_name, metrics=None, since=None):
+        """Return per-audit metric values for one agent, oldest first, without loading audit JSON"""
+
+    @abstractmethod
+    def get_metric_table(self, metrics, since=None, until=None):
+        """Return one row per audit (audit_id, agent_name, team, created_at and a column per metric) by audit id"""
+
+    @abstractmethod
+    def update_scores(self, updates, profile=None):
+        """Overwrite stored metric values from [(audit_id, {metric: value})] and refresh the weekly aggregates"""
+
+    @abstractmethod
+    def get_metric_trend(self, metric, team=None, agent_name=None, weeks=12):
+        """Return weekly count/mean/min/max of a metric from precomputed aggregates, oldest first"""
+
+    @abstractmethod
+    def get_agent_snapshots(self, team=None):
+        """Return each rostered agent's latest audit summary: team, audit_id, created_at, total_chats, metrics, facts"""
+
+    @abstractmethod
+    def get_team_facts(self, team=None, weeks=12):
+        """Return weekly sums of audit facts (audits, chats, severities, PIN outcomes), oldest first"""
+
+    @abstractmethod
+    def list_teams(self):
+        """Return every known team name"""
+
+    @abstractmethod
+    def acquire_agent_lock(self, agent_name, audit_key, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Try to take the agent's audit lock; returns True on success"""
+
+    @abstractmethod
+    def release_agent_lock(self, agent_name, owner):
+        """Release the agent's audit lock if still held by owner"""
+
+    @abstractmethod
+    def is_agent_locked(self, agent_name):
+        """Return True if an unexpired audit lock is held for the agent"""
+
+    @abstractmethod
+    def renew_agent_lock(self, agent_name, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Extend the agent's audit lock if owner still holds it; returns True on success"""
+
+    @abstractmethod
+    def enqueue_work(self, batch_id, items):
+        """Queue [(agent_name, export_path, options, priority)] under a batch; agents already in the batch are skipped.
+
+        Returns the number of new work items.
+        """
+
+    @abstractmethod
+    def claim_work(self, worker, lease_seconds=DEFAULT_WORK_LEASE_SECONDS, max_attempts=MAX_WORK_ATTEMPTS):
+        """Lease the highest-priority pending item, or take over one whose lease expired; returns it or None"""
+
+    @abstractmethod
+    def renew_work_lease(self, item_id, worker, lease_seconds=DEFAULT_WORK_LEASE_SECONDS):
+        """Heartbeat: extend the lease if worker still holds the item; returns False once it was taken over"""
+
+    @abstractmethod
+    def complete_work(self, item_id, worker, status, audit_id=None, error=None):
+        """Record a leased item as "done", "failed" or back to "pending"; ignored (False) if worker lost the lease"""
+
+    @abstractmethod
+    def list_work(self, batch_id=None):
+        """Return work items (optionally of one batch) in queue order"""
+
+    @abstractmethod
+    def list_agent_scores(self):
+        """Return every agent with its team, last audit time and last overall score (None if never audited)"""
+
+    @abstractmethod
+    def record_usage(self, day, requests=0, prompt_tokens=0, output_tokens=0):
+        """Add model calls and tokens to a quota day's usage"""
+
+    @abstractmethod
+    def get_usage(self, day):
+        """Return {"requests", "prompt_tokens", "output_tokens"} used on a quota day"""
+
+    @abstractmethod
+    def defer_audits(self, deferrals):
+        """Record [(agent_name, estimated_tokens, reason)] as left for a later budget window"""
+
+    @abstractmethod
+    def list_deferred(self):
+        """Return {agent_name: {"deferred_at", "estimated_tokens", "reason"}}"""
+
+    @abstractmethod
+    def clear_deferred(self, agent_names):
+        """Drop agents from the deferred list once they have been audited"""
+
+    def run_deduplicated(self, agent_name, audit_key, compute, total_chats=0, metadata=None,
+                         lease_seconds=DEFAULT_LEASE_SECONDS, wait_timeout=DEFAULT_WAIT_TIMEOUT,
+                         poll_interval=1.0, owner=None):
+        """Run compute() under the agent lock, or wait for another session's identical in-flight audit.
+
+        Returns (audit_data, shared) where shared is True when the result came from another requester.
+        compute() must return the audit dict, or None on failure (which is not persisted).
+        Pass owner to keep the lock alive from outside with renew_agent_lock.
+        """
+        owner = owner or uuid.uuid4().hex
+        baseline = self.find_audit_by_key(agent_name, audit_key)
+        baseline_id = baseline["id"] if baseline else 0
+        deadline = time.time() + wait_timeout
+
+        while True:
+            if self.acquire_agent_lock(agent_name, audit_key, owner, lease_seconds):
+                try:
+                    # The previous holder may have finished the same request while we were waiting
+                    finished = self.find_audit_by_key(agent_name, audit_key, after_id=baseline_id)
+                    if finished:
+                        return finished["audit_data"], True
+
+                    audit_data = compute()
+                    if audit_data:
+                        self.save_audit(agent_name, audit_key, audit_data, total_chats, metadata)
+                    return audit_data, False
+                finally:
+                    self.release_agent_lock(agent_name, owner)
+
+            finished = self.find_audit_by_key(agent_name, audit_key, after_id=baseline_id)
+            if finished:
+                return finished["audit_data"], True
+
+            if time.time() > deadline:
+                raise TimeoutError(f"Timed out waiting for in-flight audit of {agent_name}")
+            time.sleep(poll_interval)
+
+
+class AgentLockHeartbeat:
+    """Background thread that keeps owner's agent lock alive while a long audit runs (use as a context manager)"""
+
+    def __init__(self, store, agent_name, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.store = store
+        self.agent_name = agent_name
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"lock-heartbeat-{agent_name}", daemon=True)
+
+    def _beat(self):
+        while not self._stop.wait(self.lease_seconds / RENEWALS_PER_LEASE):
+            try:
+                if not self.store.renew_agent_lock(self.agent_name, self.owner, self.lease_seconds):
+                    self.lost = True
+                    logger.warning("Lost the audit lock on %s to another requester", self.agent_name)
+                    return
+            except Exception:
+                # A missed renewal is retried; the lock only lapses after several
+                logger.exception("Could not renew the audit lock on %s", self.agent_name)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+# --- SQLITE BACKEND ---
+class SQLiteAuditStore(AuditStore):
+    """SQLite store in WAL mode; safe to share between Streamlit sessions and processes"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS agents (
+        name TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        team TEXT NOT NULL DEFAULT 'Unassigned',
+        total_chats INTEGER NOT NULL DEFAULT 0,
+        last_audit_id INTEGER,
+        last_audit_at TEXT
+    );
+    CREATE TABLE IF NOT EXISTS audits (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        agent_name TEXT NOT NULL,
+        audit_key TEXT NOT NULL,
+        version INTEGER NOT NULL DEFAULT 1,
+        created_at TEXT NOT NULL,
+        total_chats INTEGER NOT NULL DEFAULT 0,
+        audit_json TEXT NOT NULL,
+        metadata_json TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_audits_agent_key ON audits (agent_name, audit_key, id);
+    CREATE INDEX IF NOT EXISTS idx_audits_created ON audits (created_at);
+    CREATE TABLE IF NOT EXISTS audit_metrics (
+        audit_id INTEGER NOT NULL,
+        agent_name TEXT NOT NULL,
+        team TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        value REAL NOT NULL,
+        PRIMARY KEY (audit_id, metric)
+    );
+    CREATE INDEX IF NOT EXISTS idx_metrics_agent ON audit_metrics (agent_name, metric, created_at);
+    CREATE INDEX IF NOT EXISTS idx_metrics_team ON audit_metrics (team, metric, created_at);
+    CREATE INDEX IF NOT EXISTS idx_metrics_date ON audit_metrics (metric, created_at);
+    CREATE TABLE IF NOT EXISTS metric_weekly (
+        team TEXT NOT NULL,
+        agent_name TEXT NOT NULL,
+        week_start TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        audit_count INTEGER NOT NULL,
+        value_sum REAL NOT NULL,
+        value_min REAL NOT NULL,
+        value_max REAL NOT NULL,
+        PRIMARY KEY (team, agent_name, week_start, metric)
+    );
+    CREATE INDEX IF NOT EXISTS idx_weekly_metric ON metric_weekly (metric, week_start);
+    CREATE INDEX IF NOT EXISTS idx_weekly_agent ON metric_weekly (agent_name, metric, week_start);
+    CREATE TABLE IF NOT EXISTS agent_snapshots (
+        agent_name TEXT PRIMARY KEY,
+        audit_id INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        total_chats INTEGER NOT NULL DEFAULT 0,
+        metrics_json TEXT NOT NULL,
+        facts_json TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS team_weekly_facts (
+        team TEXT NOT NULL,
+        week_start TEXT NOT NULL,
+        fact TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        PRIMARY KEY (team, week_start, fact)
+    );
+    CREATE TABLE IF NOT EXISTS audit_locks (
+        agent_name TEXT PRIMARY KEY,
+        audit_key TEXT NOT NULL,
+        owner TEXT NOT NULL,
+        acquired_at REAL NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS model_usage (
+        day TEXT PRIMARY KEY,
+        requests INTEGER NOT NULL DEFAULT 0,
+        prompt_tokens INTEGER NOT NULL DEFAULT 0,
+        output_tokens INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS deferred_audits (
+        agent_name TEXT PRIMARY KEY,
+        deferred_at TEXT NOT NULL,
+        estimated_tokens INTEGER NOT NULL DEFAULT 0,
+        reason TEXT
+    );
+    CREATE TABLE IF NOT EXISTS work_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        batch_id TEXT NOT NULL,
+        agent_name TEXT NOT NULL,
+        export_path TEXT NOT NULL,
+        options_json TEXT NOT NULL,
+        priority REAL NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker TEXT,
+        lease_expires REAL,
+        heartbeat_at REAL,
+        audit_id INTEGER,
+        error TEXT,
+        created_at TEXT NOT NULL,
+        finished_at TEXT,
+        UNIQUE (batch_id, agent_name)
+    );
+    CREATE INDEX IF NOT EXISTS idx_work_status ON work_items (status, priority, id);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        self._migrate(conn)
+        conn.executescript(self.SCHEMA)
+
+        # Databases created before the metric index or team analytics existed need a one-off backfill
+        has_audits = conn.execute("SELECT 1 FROM audits LIMIT 1").fetchone()
+        has_metrics = conn.execute("SELECT 1 FROM audit_metrics LIMIT 1").fetchone()
+        has_snapshots = conn.execute("SELECT 1 FROM agent_snapshots LIMIT 1").fetchone()
+        if has_audits and not (has_metrics and has_snapshots):
+            self.rebuild_metric_index()
+
+    @staticmethod
+    def _migrate(conn):
+        """Add columns introduced after a database was first created"""
+        existing_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        added_columns = {
+            "agents": [("team", "TEXT NOT NULL DEFAULT 'Unassigned'")],
+            "audits": [("version", "INTEGER NOT NULL DEFAULT 1")],
+        }
+        for table, columns in added_columns.items():
+            if table not in existing_tables:
+                continue
+            present = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for column, definition in columns:
+                if column not in present:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+    @staticmethod
+    def _audit_from_row(row):
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "agent_name": row["agent_name"],
+            "audit_key": row["audit_key"],
+            "version": row["version"],
+            "created_at": row["created_at"],
+            "total_chats": row["total_chats"],
+            "audit_data": json.loads(row["audit_json"]),
+            "metadata": json.loads(row["metadata_json"]) if row["metadata_json"] else {},
+        }
+
+    def upsert_agent(self, name):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO agents (name, created_at) VALUES (?, ?)",
+                (name, datetime.now().isoformat()),
+            )
+
+    def delete_agent(self, name):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM agents WHERE name = ?", (name,))
+
+    def list_agents(self):
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT name, team, total_chats, last_audit_id, last_audit_at FROM agents ORDER BY name"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def set_agent_team(self, name, team):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO agents (name, created_at, team) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET team = excluded.team",
+                (name, datetime.now().isoformat(), team or DEFAULT_TEAM),
+            )
+
+    def save_audit(self, agent_name, audit_key, audit_data, total_chats, metadata=None):
+        now = datetime.now().isoformat()
+        total_chats = total_chats or 0
+        with self._transaction() as conn:
+            version = conn.execute(
+                "SELECT COALESCE(MAX(version), 0) + 1 FROM audits WHERE agent_name = ?", (agent_name,)
+            ).fetchone()[0]
+            cursor = conn.execute(
+                "INSERT INTO audits (agent_name, audit_key, version, created_at, total_chats, audit_json, "
+                "metadata_json) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (agent_name, audit_key, version, now, total_chats, json.dumps(audit_data),
+                 json.dumps(metadata) if metadata else None),
+            )
+            audit_id = cursor.lastrowid
+            team_row = conn.execute("SELECT team FROM agents WHERE name = ?", (agent_name,)).fetchone()
+            team = team_row["team"] if team_row else DEFAULT_TEAM
+            self._index_metrics(conn, audit_id, agent_name, team, now, audit_data)
+            self._index_facts(conn, audit_id, agent_name, team, now, audit_data, total_chats)
+            conn.execute(
+                "INSERT INTO agents (name, created_at, total_chats, last_audit_id, last_audit_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET total_chats = excluded.total_chats, "
+                "last_audit_id = excluded.last_audit_id, last_audit_at = excluded.last_audit_at",
+                (agent_name, now, total_chats, audit_id, now),
+            )
+        return audit_id
+
+    @staticmethod
+    def _index_metrics(conn, audit_id, agent_name, team, created_at, audit_data):
+        """Write the audit's metric rows and fold them into the weekly aggregates"""
+        week = week_start(created_at)
+        for metric, value in extract_metric_values(audit_data).items():
+            conn.execute(
+                "INSERT OR REPLACE INTO audit_metrics (audit_id, agent_name, team, created_at, metric, value) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (audit_id, agent_name, team, created_at, metric, value),
+            )
+            conn.execute(
+                "INSERT INTO metric_weekly (team, agent_name, week_start, metric, audit_count, value_sum, "
+                "value_min, value_max) VALUES (?, ?, ?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT(team, agent_name, week_start, metric) DO UPDATE SET "
+                "audit_count = audit_count + 1, value_sum = value_sum + excluded.value_sum, "
+                "value_min = MIN(value_min, excluded.value_min), value_max = MAX(value_max, excluded.value_max)",
+                (team, agent_name, week, metric, value, value, value),
+            )
+
+    @staticmethod
+    def _index_facts(conn, audit_id, agent_name, team, created_at, audit_data, total_chats):
+        """Make the audit the agent's analytics snapshot and add its facts to the team's weekly totals"""
+        facts = extract_audit_facts(audit_data, total_chats)
+        conn.execute(
+            "INSERT OR REPLACE INTO agent_snapshots (agent_name, audit_id, created_at, total_chats, metrics_json, "
+            "facts_json) VALUES (?, ?, ?, ?, ?, ?)",
+            (agent_name, audit_id, created_at, total_chats, json.dumps(extract_metric_values(audit_data)),
+             json.dumps(facts)),
+        )
+        week = week_start(created_at)
+        conn.executemany(
+            "INSERT INTO team_weekly_facts (team, week_start, fact, total) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(team, week_start, fact) DO UPDATE SET total = total + excluded.total",
+            [(team, week, fact, value) for fact, value in {"audits": 1, **facts}.items()],
+        )
+
+    def rebuild_metric_index(self):
+        """Recompute metric rows, weekly aggregates and team analytics from the stored audit JSON"""
+        with self._transaction() as conn:
+            for table in ("audit_metrics", "metric_weekly", "agent_snapshots", "team_weekly_facts"):
+                conn.execute(f"DELETE FROM {table}")
+            teams = {row["name"]: row["team"] for row in conn.execute("SELECT name, team FROM agents")}
+            rows = conn.execute("SELECT id, agent_name, created_at, total_chats, audit_json FROM audits ORDER BY id")
+            for row in rows.fetchall():
+                team = teams.get(row["agent_name"], DEFAULT_TEAM)
+                audit_data = json.loads(row["audit_json"])
+                self._index_metrics(conn, row["id"], row["agent_name"], team, row["created_at"], audit_data)
+                self._index_facts(conn, row["id"], row["agent_name"], team, row["created_at"], audit_data,
+                                  row["total_chats"])
+
+    def update_scores(self, updates, profile=None):
+        with self._transaction() as conn:
+            for audit_id, values in updates:
+                for metric, value in values.items():
+                    conn.execute("UPDATE audit_metrics SET value = ? WHERE audit_id = ? AND metric = ?",
+                                 (value, audit_id, metric))
+                # Patch the stored JSON in place so the app and reports show the same scores
+                paths = [("$.overall_score" if metric == "overall_score" else f"$.metrics.{metric}", value)
+                         for metric, value in values.items()]
+                if profile:
+                    paths.append(("$.weight_profile", profile))
+                conn.execute(
+                    f"UPDATE audits SET audit_json = json_set(audit_json, {', '.join('?, ?' for _ in paths)}) "
+                    "WHERE id = ?",
+                    [item for pair in paths for item in pair] + [audit_id],
+                )
+                conn.execute(
+                    f"UPDATE agent_snapshots SET metrics_json = json_set(metrics_json, "
+                    f"{', '.join('?, ?' for _ in values)}) WHERE audit_id = ?",
+                    [item for metric, value in values.items() for item in (f"$.{metric}", value)] + [audit_id],
+                )
+            # Weekly aggregates are sums over audit_metrics, so rebuild them in one statement
+            conn.execute("DELETE FROM metric_weekly")
+            conn.execute(
+                "INSERT INTO metric_weekly (team, agent_name, week_start, metric, audit_count, value_sum, "
+                "value_min, value_max) "
+                "SELECT team, agent_name, date(created_at, '-6 days', 'weekday 1'), metric, COUNT(*), SUM(value), "
+                "MIN(value), MAX(value) FROM audit_metrics GROUP BY 1, 2, 3, 4"
+            )
+        return len(updates)
+
+    def get_audit(self, audit_id):
+        row = self._connect().execute("SELECT * FROM audits WHERE id = ?", (audit_id,)).fetchone()
+        return self._audit_from_row(row)
+
+    def get_latest_audit(self, agent_name):
+        row = self._connect().execute(
+            "SELECT * FROM audits WHERE agent_name = ? ORDER BY id DESC LIMIT 1", (agent_name,)
+        ).fetchone()
+        return self._audit_from_row(row)
+
+    def get_audit_history(self, agent_name, limit=50):
+        rows = self._connect().execute(
+            "SELECT * FROM audits WHERE agent_name = ? ORDER BY id DESC LIMIT ?", (agent_name, limit)
+        ).fetchall()
+        return [self._audit_from_row(row) for row in rows]
+
+    def find_audit_by_key(self, agent_name, audit_key, after_id=0):
+        row = self._connect().execute(
+            "SELECT * FROM audits WHERE agent_name = ? AND audit_key = ? AND id > ? ORDER BY id DESC LIMIT 1",
+            (agent_name, audit_key, after_id),
+        ).fetchone()
+        return self._audit_from_row(row)
+
+    def get_agent_metric_series(self, agent_name, metrics=None, since=None):
+        query = "SELECT audit_id, created_at, metric, value FROM audit_metrics WHERE agent_name = ?"
+        params = [agent_name]
+        if metrics:
+            query += f" AND metric IN ({', '.join('?' for _ in metrics)})"
+            params.extend(metrics)
+        if since:
+            query += " AND created_at >= ?"
+            params.append(since)
+        query += " ORDER BY created_at, audit_id"
+        return [dict(row) for row in self._connect().execute(query, params).fetchall()]
+
+    def get_metric_table(self, metrics, since=None, until=None):
+        # Pivot in SQL so each audit is one row; metric names are the caller's fixed keys
+        columns = ", ".join(f'MAX(CASE WHEN metric = ? THEN value END) AS "{metric}"' for metric in metrics)
+        query = f"SELECT audit_id, agent_name, team, created_at, {columns} FROM audit_metrics"
+        conditions, params = [], list(metrics)
+        if since:
+            conditions.append("created_at >= ?")
+            params.append(str(since))
+        if until:
+            conditions.append("created_at < ?")
+            params.append(str(until))
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " GROUP BY audit_id ORDER BY audit_id"
+        return [dict(row) for row in self._connect().execute(query, params).fetchall()]
+
+    def get_metric_trend(self, metric, team=None, agent_name=None, weeks=12):
+        first_week = week_start((datetime.now() - timedelta(weeks=weeks)).isoformat())
+        query = (
+            "SELECT week_start, SUM(audit_count) AS audits, SUM(value_sum) / SUM(audit_count) AS mean, "
+            "MIN(value_min) AS min, MAX(value_max) AS max FROM metric_weekly "
+            "WHERE metric = ? AND week_start > ?"
+        )
+        params = [metric, first_week]
+        if team:
+            query += " AND team = ?"
+            params.append(team)
+        if agent_name:
+            query += " AND agent_name = ?"
+            params.append(agent_name)
+        query += " GROUP BY week_start ORDER BY week_start"
+        return [dict(row) for row in self._connect().execute(query, params).fetchall()]
+
+    def get_agent_snapshots(self, team=None):
+        query = (
+            "SELECT s.agent_name, a.team, s.audit_id, s.created_at, s.total_chats, s.metrics_json, s.facts_json "
+            "FROM agent_snapshots s JOIN agents a ON a.name = s.agent_name"
+        )
+        params = ()
+        if team:
+            query, params = query + " WHERE a.team = ?", (team,)
+        rows = self._connect().execute(query + " ORDER BY s.agent_name", params).fetchall()
+        return [{
+            "agent_name": row["agent_name"], "team": row["team"], "audit_id": row["audit_id"],
+            "created_at": row["created_at"], "total_chats": row["total_chats"],
+            "metrics": json.loads(row["metrics_json"]), "facts": json.loads(row["facts_json"]),
+        } for row in rows]
+
+    def get_team_facts(self, team=None, weeks=12):
+        first_week = week_start((datetime.now() - timedelta(weeks=weeks)).isoformat())
+        query = "SELECT week_start, fact, SUM(total) AS total FROM team_weekly_facts WHERE week_start > ?"
+        params = [first_week]
+        if team:
+            query += " AND team = ?"
+            params.append(team)
+        rows = self._connect().execute(query + " GROUP BY week_start, fact ORDER BY week_start", params).fetchall()
+        weekly = {}
+        for row in rows:
+            weekly.setdefault(row["week_start"], {"week_start": row["week_start"]})[row["fact"]] = row["total"]
+        return list(weekly.values())
+
+    def list_teams(self):
+        rows = self._connect().execute(
+            "SELECT team FROM agents UNION SELECT DISTINCT team FROM metric_weekly ORDER BY team"
+        ).fetchall()
+        return [row["team"] for row in rows]
+
+    def acquire_agent_lock(self, agent_name, audit_key, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT owner, expires_at FROM audit_locks WHERE agent_name = ?", (agent_name,)
+            ).fetchone()
+            if row and row["owner"] != owner and row["expires_at"] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO audit_locks (agent_name, audit_key, owner, acquired_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (agent_name, audit_key, owner, now, now + lease_seconds),
+            )
+        return True
+
+    def release_agent_lock(self, agent_name, owner):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM audit_locks WHERE agent_name = ? AND owner = ?", (agent_name, owner))
+
+    def is_agent_locked(self, agent_name):
+        row = self._connect().execute(
+            "SELECT expires_at FROM audit_locks WHERE agent_name = ?", (agent_name,)
+        ).fetchone()
+        return bool(row and row["expires_at"] > time.time())
+
+    def renew_agent_lock(self, agent_name, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE audit_locks SET expires_at = ? WHERE agent_name = ? AND owner = ?",
+                (time.time() + lease_seconds, agent_name, owner),
+            )
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _work_from_row(row):
+        item = dict(row)
+        item["options"] = json.loads(item.pop("options_json"))
+        return item
+
+    def enqueue_work(self, batch_id, items):
+        now = datetime.now().isoformat()
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO work_items (batch_id, agent_name, export_path, options_json, priority, "
+                "created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(batch_id, agent_name, export_path, json.dumps(options or {}), priority, now)
+                 for agent_name, export_path, options, priority in items],
+            )
+            return conn.total_changes - before
+
+    def claim_work(self, worker, lease_seconds=DEFAULT_WORK_LEASE_SECONDS, max_attempts=MAX_WORK_ATTEMPTS):
+        now = time.time()
+        with self._transaction() as conn:
+            # Items whose workers died after their last allowed attempt will not be retried
+            conn.execute(
+                "UPDATE work_items SET status = 'failed', finished_at = ?, "
+                "error = COALESCE(error, 'worker lease expired') "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (datetime.now().isoformat(), now, max_attempts),
+            )
+            # Pending work first; otherwise steal an item from a worker that stopped sending heartbeats
+            row = conn.execute(
+                "SELECT * FROM work_items WHERE status = 'pending' ORDER BY priority DESC, id LIMIT 1"
+            ).fetchone() or conn.execute(
+                "SELECT * FROM work_items WHERE status = 'leased' AND lease_expires < ? "
+                "ORDER BY priority DESC, id LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE work_items SET status = 'leased', worker = ?, lease_expires = ?, heartbeat_at = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (worker, now + lease_seconds, now, row["id"]),
+            )
+            item = self._work_from_row(row)
+        item.update(status="leased", worker=worker, lease_expires=now + lease_seconds, heartbeat_at=now,
+                    attempts=item["attempts"] + 1, stolen_from=row["worker"] if row["status"] == "leased" else None)
+        return item
+
+    def renew_work_lease(self, item_id, worker, lease_seconds=DEFAULT_WORK_LEASE_SECONDS):
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE work_items SET lease_expires = ?, heartbeat_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (now + lease_seconds, now, item_id, worker),
+            )
+        return cursor.rowcount > 0
+
+    def complete_work(self, item_id, worker, status, audit_id=None, error=None):
+        finished_at = None if status == "pending" else datetime.now().isoformat()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE work_items SET status = ?, audit_id = ?, error = ?, finished_at = ?, lease_expires = NULL "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (status, audit_id, error, finished_at, item_id, worker),
+            )
+        return cursor.rowcount > 0
+
+    def list_work(self, batch_id=None):
+        query, params = "SELECT * FROM work_items", ()
+        if batch_id:
+            query, params = query + " WHERE batch_id = ?", (batch_id,)
+        rows = self._connect().execute(query + " ORDER BY priority DESC, id", params).fetchall()
+        return [self._work_from_row(row) for row in rows]
+
+    def list_agent_scores(self):
+        rows = self._connect().execute(
+            "SELECT a.name, a.team, a.last_audit_at, m.value AS overall_score FROM agents a "
+            "LEFT JOIN audit_metrics m ON m.audit_id = a.last_audit_id AND m.metric = 'overall_score' "
+            "ORDER BY a.name"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def record_usage(self, day, requests=0, prompt_tokens=0, output_tokens=0):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO model_usage (day, requests, prompt_tokens, output_tokens) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(day) DO UPDATE SET requests = requests + excluded.requests, "
+                "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                "output_tokens = output_tokens + excluded.output_tokens",
+                (day, requests, prompt_tokens, output_tokens),
+            )
+
+    def get_usage(self, day):
+        row = self._connect().execute(
+            "SELECT requests, prompt_tokens, output_tokens FROM model_usage WHERE day = ?", (day,)
+        ).fetchone()
+        return dict(row) if row else {"requests": 0, "prompt_tokens": 0, "output_tokens": 0}
+
+    def defer_audits(self, deferrals):
+        now = datetime.now().isoformat()
+        with self._transaction() as conn:
+            # Keep the first deferral time, so repeatedly deferred agents keep their place
+            conn.executemany(
+                "INSERT INTO deferred_audits (agent_name, deferred_at, estimated_tokens, reason) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(agent_name) DO UPDATE SET estimated_tokens = excluded.estimated_tokens, "
+                "reason = excluded.reason",
+                [(agent_name, now, estimated_tokens, reason) for agent_name, estimated_tokens, reason in deferrals],
+            )
+
+    def list_deferred(self):
+        rows = self._connect().execute(
+            "SELECT agent_name, deferred_at, estimated_tokens, reason FROM deferred_audits ORDER BY deferred_at"
+        ).fetchall()
+        return {row["agent_name"]: {key: row[key] for key in ("deferred_at", "estimated_tokens", "reason")}
+                for row in rows}
+
+    def clear_deferred(self, agent_names):
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM deferred_audits WHERE agent_name = ?", [(name,) for name in agent_names])
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a block, so check-then-write is atomic"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
+
+
+# --- BACKEND REGISTRY ---
+STORE_BACKENDS = {
+    "sqlite": SQLiteAuditStore,
+}
+
+
+def open_audit_store(url=DEFAULT_STORE_URL):
+    """Open a store from a URL such as sqlite:///audit_store.db"""
+    scheme, _, location = url.partition("://")
+    if scheme not in STORE_BACKENDS:
+        raise ValueError(f"Unsupported audit store backend: {scheme}")
+    if scheme == "sqlite":
+        # sqlite:///relative.db and sqlite:////absolute/path.db, as in SQLAlchemy URLs
+        location = location[1:] if location.startswith("/") else location
+    return STORE_BACKENDS[scheme](location)
@@ -0,0 +1,143 @@
+"""Offline load test of the audit pipeline against the fake model backend.
+
+Usage:
+    python -m benchmarks.load_test --agents 100 --concurrency 1 4 16 --latency lognormal 2.0 0.5 \
+        --rate-limit-rate 0.05 --output load_results.json
+    python -m benchmarks.load_test --agents 40 --duplicates 3 --shared-store
+
+Every agent audit goes through run_comprehensive_audit with a
+FakeGeminiBackend, so throughput, latency percentiles and failure handling
+can be measured deterministically with no network. With --shared-store each
+agent is requested --duplicates times concurrently through the SQLite audit
+store, showing how many model calls the in-flight deduplication saves.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audit_engine import run_comprehensive_audit  # noqa: E402
+from audit_store import SQLiteAuditStore, compute_audit_key  # noqa: E402
+from model_backends import FakeGeminiBackend  # noqa: E402
+
+
+class _CountingNotifier:
+    def __init__(self):
+        self.errors = []
+
+    def error(self, message):
+        self.errors.append(message)
+
+    def warning(self, message):
+        pass
+
+    def info(self, message):
+        pass
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def synthetic_transcripts(agent_name, chats, messages):
+    return [
+        "\n".join(f"[2024-01-01T10:{m:02d}:00] {agent_name if m % 2 else 'Visitor'}: message {m} of chat {c}"
+                  for m in range(messages))
+        for c in range(chats)
+    ]
+
+
+def run_load(args, concurrency):
+    backend = FakeGeminiBackend(
+        seed=args.seed,
+        latency=tuple([args.latency[0]] + [float(v) for v in args.latency[1:]]),
+        rate_limit_rate=args.rate_limit_rate,
+        truncate_rate=args.truncate_rate,
+        malformed_rate=args.malformed_rate,
+    )
+    agents = [f"Agent {i:03d}" for i in range(args.agents)]
+    requests = [name for name in agents for _ in range(args.duplicates)]
+    store = None
+    workdir = tempfile.TemporaryDirectory()
+    if args.shared_store:
+        store = SQLiteAuditStore(os.path.join(workdir.name, "load_store.db"))
+
+    def audit_one(agent_name):
+        notifier = _CountingNotifier()
+        transcripts = synthetic_transcripts(agent_name, args.chats, args.messages)
+        start = time.perf_counter()
+        if store is not None:
+            result, _ = store.run_deduplicated(
+                agent_name, compute_audit_key(agent_name, transcripts),
+                lambda: run_comprehensive_audit(transcripts, agent_name, backend, notify=notifier),
+                total_chats=len(transcripts), poll_interval=0.05)
+        else:
+            result = run_comprehensive_audit(transcripts, agent_name, backend, notify=notifier)
+        return time.perf_counter() - start, result is not None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(audit_one, requests))
+    elapsed = time.perf_counter() - start
+    workdir.cleanup()
+
+    latencies = [latency for latency, _ in outcomes]
+    return {
+        "concurrency": concurrency,
+        "requests": len(requests),
+        "succeeded": sum(1 for _, ok in outcomes if ok),
+        "failed": sum(1 for _, ok in outcomes if not ok),
+        "elapsed_seconds": elapsed,
+        "audits_per_minute": len(requests) / elapsed * 60 if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_max": max(latencies) if latencies else 0.0,
+        "backend_stats": dict(backend.stats),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test bulk audits against the fake model backend")
+    parser.add_argument("--agents", type=int, default=50)
+    parser.add_argument("--chats", type=int, default=50, help="Transcripts per agent")
+    parser.add_argument("--messages", type=int, default=12, help="Messages per transcript")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--latency", nargs="+", default=["fixed", "0.05"],
+                        help="fixed SECONDS | uniform LOW HIGH | lognormal MEDIAN SIGMA")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--duplicates", type=int, default=1, help="Concurrent requests per agent")
+    parser.add_argument("--shared-store", action="store_true", help="Route audits through the SQLite store")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = []
+    for concurrency in args.concurrency:
+        row = run_load(args, concurrency)
+        results.append(row)
+        stats = row["backend_stats"]
+        print(f"concurrency {concurrency:>3}: {row['audits_per_minute']:8.1f} audits/min  "
+              f"p50 {row['latency_p50']:.2f}s  p95 {row['latency_p95']:.2f}s  "
+              f"ok {row['succeeded']}/{row['requests']}  model calls {stats['calls']} "
+              f"(429 {stats['rate_limited']}, truncated {stats['truncated']}, malformed {stats['malformed']})",
+              flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
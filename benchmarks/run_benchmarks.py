@@ -0,0 +1,184 @@
+"""Benchmark harness for extraction, prompt assembly, score post-processing and report rendering.
+
+Usage:
+    python -m benchmarks.run_benchmarks --sizes small medium --output bench_results.json
+    python -m benchmarks.run_benchmarks --sizes small --compare bench_results.json
+
+Each stage is timed over several repeats (without tracing) and then run once
+more under tracemalloc to record peak Python memory. Results are written as
+JSON so runs from different releases can be compared with --compare.
+"""
+import argparse
+import copy
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime
+
+# Allow running as a script from the repository root or the benchmarks directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audit_engine import build_audit_prompt, postprocess_audit_scores  # noqa: E402
+from chat_schema import msgspec  # noqa: E402
+from extraction import get_agent_transcripts, get_all_agents_from_zip, get_transcripts_for_agents  # noqa: E402
+from issue_classifier import classify_issues  # noqa: E402
+from model_backends import make_fake_audit  # noqa: E402
+from reports import (  # noqa: E402
+    generate_excel_report,
+    generate_pdf_report,
+    generate_template_excel_report,
+    load_excel_template,
+)
+from sampling import near_duplicate_clusters  # noqa: E402
+from benchmarks.synthetic_export import agent_names, generate_export  # noqa: E402
+
+SIZES = {
+    "small": {"num_agents": 5, "chats_per_agent": 20, "messages_per_chat": 12, "nesting_depth": 1, "body_size": 120},
+    "medium": {"num_agents": 20, "chats_per_agent": 100, "messages_per_chat": 20, "nesting_depth": 1, "body_size": 200},
+    "large": {"num_agents": 50, "chats_per_agent": 200, "messages_per_chat": 30, "nesting_depth": 1, "body_size": 300},
+}
+
+
+class _SilentNotifier:
+    def error(self, message):
+        pass
+
+    def warning(self, message):
+        pass
+
+    def info(self, message):
+        pass
+
+
+def measure(func, repeats):
+    """Time func over repeats, then run it once under tracemalloc for peak memory"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds_min": min(timings),
+        "seconds_mean": sum(timings) / len(timings),
+        "peak_bytes": peak,
+        "repeats": repeats,
+    }
+
+
+def benchmark_size(size_name, params, repeats, workdir):
+    """Run every stage for one export size and return result rows"""
+    export = generate_export(**params)
+    names = agent_names(params["num_agents"])
+    first_agent = names[0]
+    transcripts, _ = get_agent_transcripts(io.BytesIO(export), first_agent)
+    audit_result = make_fake_audit(first_agent)
+    agent_data = {"audit_data": audit_result, "total_chats": len(transcripts)}
+    pdf_path = os.path.join(workdir, f"{size_name}.pdf")
+    excel_path = os.path.join(workdir, f"{size_name}.xlsx")
+    form_path = os.path.join(workdir, f"{size_name}.form.xlsx")
+    # The template is compiled once per process; keep that out of the per-report timing
+    load_excel_template()
+
+    def extract_all_agents():
+        for name in names:
+            get_agent_transcripts(io.BytesIO(export), name)
+
+    def postprocess_batch():
+        # Post-processing is cheap per audit, so measure a batch of 100
+        for _ in range(100):
+            postprocess_audit_scores(copy.deepcopy(audit_result), _SilentNotifier())
+
+    stages = [
+        ("detect_agents", lambda: get_all_agents_from_zip(io.BytesIO(export))),
+        ("extract_one_agent", lambda: get_agent_transcripts(io.BytesIO(export), first_agent)),
+        ("extract_all_agents", extract_all_agents),
+        ("extract_all_one_pass", lambda: get_transcripts_for_agents(io.BytesIO(export), names)),
+        # Scoped audit: roster known (other agents' nested ZIPs skipped) and a two-week window
+        ("extract_one_scoped", lambda: get_agent_transcripts(io.BytesIO(export), first_agent, known_agents=names,
+                                                             since=date(2024, 2, 1), until=date(2024, 2, 15))),
+        ("issue_classification", lambda: classify_issues(transcripts)),
+        ("near_duplicate_clustering", lambda: near_duplicate_clusters(transcripts, first_agent)),
+        ("prompt_assembly", lambda: build_audit_prompt(transcripts, first_agent)),
+        ("score_postprocess_x100", postprocess_batch),
+        ("pdf_report", lambda: generate_pdf_report(agent_data, first_agent, pdf_path)),
+        ("excel_report", lambda: generate_excel_report(agent_data, first_agent, excel_path)),
+        ("template_excel_report", lambda: generate_template_excel_report(agent_data, first_agent, form_path)),
+    ]
+
+    rows = []
+    for stage, func in stages:
+        row = {"size": size_name, "stage": stage, "export_bytes": len(export), **params}
+        row.update(measure(func, repeats))
+        rows.append(row)
+        print(f"{size_name:>8} {stage:<24} {row['seconds_mean'] * 1000:10.1f} ms  "
+              f"peak {row['peak_bytes'] / 1024 / 1024:8.2f} MiB", flush=True)
+    return rows
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "chat_decoder": "msgspec" if msgspec is not None else "json",
+    }
+
+
+def compare(results, baseline_path):
+    """Print mean-time and peak-memory ratios against a previous results file"""
+    with open(baseline_path) as f:
+        baseline = {(row["size"], row["stage"]): row for row in json.load(f)["results"]}
+    print(f"\nComparison with {baseline_path} (new / old):")
+    for row in results:
+        old = baseline.get((row["size"], row["stage"]))
+        if not old:
+            continue
+        time_ratio = row["seconds_mean"] / old["seconds_mean"] if old["seconds_mean"] else float("inf")
+        memory_ratio = row["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else float("inf")
+        print(f"{row['size']:>8} {row['stage']:<24} time x{time_ratio:5.2f}  memory x{memory_ratio:5.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the audit pipeline on synthetic exports")
+    parser.add_argument("--sizes", nargs="+", default=["small", "medium"], choices=sorted(SIZES))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size_name in args.sizes:
+            results.extend(benchmark_size(size_name, SIZES[size_name], args.repeats, workdir))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment_info(), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
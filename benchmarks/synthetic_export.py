@@ -0,0 +1,112 @@
+"""Synthetic tawk.to exports in the same JSON shape as the real ones.
+
+Each chat is a JSON file with ``id``, ``started`` and ``messages[]`` whose
+entries carry ``sender.n``, ``msg`` and ``t``. With ``nesting_depth=0`` all
+chats sit directly in the archive; with ``nesting_depth=1`` every agent gets
+a nested ZIP (the usual bulk layout). Extraction only opens one level of
+nested ZIPs, so deeper nesting is rejected rather than producing an export
+that reads as empty.
+"""
+import argparse
+import io
+import json
+import random
+import zipfile
+from datetime import datetime, timedelta
+
+ISSUE_SNIPPETS = [
+    "My website is showing a DNS_PROBE_FINISHED_NXDOMAIN error",
+    "I cannot send emails from Outlook, it keeps asking for the password",
+    "The SSL certificate on my domain has expired",
+    "WordPress admin shows a critical error after updating plugins",
+    "I need to reset my cPanel password",
+    "Please explain the invoice I received for domain renewal",
+    "My VPS is not responding to ping",
+]
+AGENT_REPLIES = [
+    "Thank you for contacting HostAfrica. Could you please provide your support PIN?",
+    "I have checked the DNS zone and the A record is pointing to the correct IP.",
+    "Please try clearing your browser cache; here is a guide: https://help.hostafrica.com/",
+    "I have reissued the SSL certificate, please allow a few minutes for it to propagate.",
+    "I have escalated this to our technical team, you will receive an update by email.",
+]
+FILLER_WORDS = "hosting domain email server cpanel dns record mailbox certificate plugin backup".split()
+
+
+def agent_names(num_agents):
+    """Deterministic agent names: Agent 001, Agent 002, ..."""
+    return [f"Agent {i:03d}" for i in range(1, num_agents + 1)]
+
+
+def make_chat(chat_id, agent_name, messages_per_chat, body_size, started, rng):
+    """Build one chat dict; the first message is a bot greeting, then visitor/agent turns"""
+    messages = [{"sender": {"n": "Bot HostAfrica"}, "msg": "Hi! How can we help?", "t": started.isoformat()}]
+    for i in range(1, messages_per_chat):
+        timestamp = (started + timedelta(seconds=30 * i)).isoformat()
+        if i % 2:
+            sender, base = "Visitor", rng.choice(ISSUE_SNIPPETS)
+        else:
+            sender, base = agent_name, rng.choice(AGENT_REPLIES)
+        padding = " ".join(rng.choice(FILLER_WORDS) for _ in range(max(0, (body_size - len(base)) // 7)))
+        messages.append({"sender": {"n": sender}, "msg": f"{base} {padding}".strip()[:max(body_size, len(base))],
+                         "t": timestamp})
+    return {"id": chat_id, "started": started.isoformat(), "messages": messages}
+
+
+def _zip_bytes(members):
+    """Write (name, bytes) pairs into an in-memory deflated ZIP"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, data in members:
+            z.writestr(name, data)
+    return buffer.getvalue()
+
+
+def generate_export(num_agents=5, chats_per_agent=20, messages_per_chat=12, nesting_depth=1, body_size=120,
+                    seed=42, start_date=None):
+    """Return the bytes of a synthetic tawk.to export ZIP"""
+    if nesting_depth > 1:
+        raise ValueError("nesting_depth must be 0 or 1: extraction only opens one level of nested ZIPs")
+    rng = random.Random(seed)
+    start_date = start_date or datetime(2024, 1, 1, 8, 0, 0)
+    names = agent_names(num_agents)
+
+    per_agent = {}
+    for agent_index, agent_name in enumerate(names):
+        members = []
+        for chat_index in range(chats_per_agent):
+            chat_id = f"chat-{agent_index:03d}-{chat_index:05d}"
+            started = start_date + timedelta(hours=rng.randint(0, 24 * 90))
+            chat = make_chat(chat_id, agent_name, messages_per_chat, body_size, started, rng)
+            members.append((f"{chat_id}.json", json.dumps(chat).encode("utf-8")))
+        per_agent[agent_name] = members
+
+    if nesting_depth <= 0:
+        return _zip_bytes(member for members in per_agent.values() for member in members)
+
+    outer_members = []
+    for agent_name, members in per_agent.items():
+        outer_members.append((f"{agent_name.replace(' ', '_')}_chats.zip", _zip_bytes(members)))
+    return _zip_bytes(outer_members)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic tawk.to export ZIP")
+    parser.add_argument("output", help="Path of the ZIP file to write")
+    parser.add_argument("--agents", type=int, default=5)
+    parser.add_argument("--chats", type=int, default=20, help="Chats per agent")
+    parser.add_argument("--messages", type=int, default=12, help="Messages per chat")
+    parser.add_argument("--depth", type=int, default=1, choices=(0, 1),
+                        help="ZIP nesting depth (0 = flat, 1 = one ZIP per agent)")
+    parser.add_argument("--body-size", type=int, default=120, help="Approximate characters per message")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    data = generate_export(args.agents, args.chats, args.messages, args.depth, args.body_size, args.seed)
+    with open(args.output, "wb") as f:
+        f.write(data)
+    print(f"Wrote {len(data):,} bytes to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
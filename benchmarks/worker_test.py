@@ -0,0 +1,109 @@
+"""Run the distributed audit workers as local processes against the fake model backend.
+
+Usage:
+    python -m benchmarks.worker_test --agents 40 --processes 4
+    python -m benchmarks.worker_test --agents 40 --processes 4 --kill 1 --lease-seconds 3
+
+Writes a synthetic export and a fresh SQLite store in a temp directory, queues
+one work item per agent and starts --processes workers. With --kill N, N
+workers are SIGKILLed mid-audit; their items must be taken over once the
+lease expires. The run checks that every item ends "done" and every agent has
+exactly one stored audit.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audit_store import SQLiteAuditStore  # noqa: E402
+from benchmarks.synthetic_export import agent_names, generate_export  # noqa: E402
+from model_backends import FakeGeminiBackend  # noqa: E402
+from worker import AuditWorker  # noqa: E402
+
+
+def _worker_process(store_path, latency, lease_seconds, seed):
+    worker = AuditWorker(SQLiteAuditStore(store_path), FakeGeminiBackend(seed=seed, latency=("fixed", latency)),
+                         lease_seconds=lease_seconds)
+    worker.run(exit_when_idle=True, poll_interval=0.2)
+
+
+def run_workers(args, workdir):
+    export_path = os.path.join(workdir, "export.zip")
+    with open(export_path, "wb") as f:
+        f.write(generate_export(args.agents, args.chats, nesting_depth=1))
+    store_path = os.path.join(workdir, "audit_store.db")
+    store = SQLiteAuditStore(store_path)
+    store.enqueue_work("load-test", [(name, export_path, {}, 0) for name in agent_names(args.agents)])
+
+    start = time.perf_counter()
+    processes = [multiprocessing.Process(target=_worker_process, name=f"worker-{i}",
+                                         args=(store_path, args.latency, args.lease_seconds, i))
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    # Kill workers while they hold a lease, so their items have to be taken over
+    killed = 0
+    while killed < args.kill:
+        leased = {item["worker"] for item in store.list_work() if item["status"] == "leased"}
+        victim = next((process for process in processes if process.is_alive()
+                       and any(worker.split(":")[1] == str(process.pid) for worker in leased)), None)
+        if victim is None:
+            time.sleep(0.05)
+            continue
+        os.kill(victim.pid, signal.SIGKILL)
+        killed += 1
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    items = store.list_work()
+    audits = Counter(len(store.get_audit_history(name)) for name in agent_names(args.agents))
+    return {
+        "processes": args.processes,
+        "killed": killed,
+        "seconds": round(elapsed, 2),
+        "agents_per_minute": round(len(items) / elapsed * 60, 1),
+        "statuses": dict(Counter(item["status"] for item in items)),
+        "taken_over": sum(1 for item in items if item["attempts"] > 1),
+        "audits_per_agent": {str(count): agents for count, agents in audits.items()},
+        "ok": all(item["status"] == "done" for item in items) and set(audits) == {1},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run queued audits on local worker processes")
+    parser.add_argument("--agents", type=int, default=20)
+    parser.add_argument("--chats", type=int, default=10, help="Chats per agent")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake model latency per call (seconds)")
+    parser.add_argument("--lease-seconds", type=float, default=3.0)
+    parser.add_argument("--kill", type=int, default=0, help="Workers to SIGKILL mid-audit")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    args = parser.parse_args(argv)
+    if args.kill >= args.processes:
+        parser.error("--kill must leave at least one worker alive")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        result = run_workers(args, workdir)
+    print(f"{result['processes']} workers ({result['killed']} killed): {result['seconds']}s, "
+          f"{result['agents_per_minute']} agents/min, items {result['statuses']}, "
+          f"taken over {result['taken_over']}, audits per agent {result['audits_per_agent']} - "
+          f"{'OK' if result['ok'] else 'FAILED'}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "result": result}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0 if result["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
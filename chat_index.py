@@ -0,0 +1,332 @@
+"""Chat evidence index: every transcript stored once, keyed by chat id.
+
+Transcripts are appended to a pack file next to the SQLite index, which
+records each chat's byte offset and length. The evidence viewer loads one
+chat with a single seek + read, so sessions keep only chat ids in memory and
+audit examples can point straight back at their source chat.
+
+Each chat row also keeps a content fingerprint. A chat seen again in a
+later, overlapping export is stored once; if its content changed (the
+conversation continued) the newer transcript replaces the old one. Chats are
+stored before they are audited (audit examples point back at them), so the
+versions an agent's saved audits covered are recorded separately with
+mark_audited() once an audit succeeds, and audits can skip those via
+audited_chats().
+
+Each chat is labelled with an issue type by the local classifier as it is
+stored, which drives per-agent issue-mix statistics.
+
+Every message is also indexed in an FTS5 table as chats are added, so QA
+leads can search all ingested exports by phrase, agent, date and sender role.
+Message times are stored as ISO-8601 UTC (epoch and offset timestamps are
+converted; a message without a readable time takes its chat's start), so
+date filters compare like with like.
+"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from audit_store import _Transaction
+from extraction import _as_datetime, chat_key, content_fingerprint, parse_transcript, sender_role
+from issue_classifier import classify_issues
+
+# --- CONFIGURATION ---
+DEFAULT_CHAT_INDEX_PATH = os.environ.get("CHAT_INDEX_PATH", "chat_index.db")
+
+SENDER_ROLES = ("agent", "visitor", "bot")
+SEARCH_SNIPPET_TOKENS = 16
+# Chats read from the pack per batch when (re)classifying stored chats
+CLASSIFY_BATCH_SIZE = 1000
+# Bumped when the way messages are indexed for search changes; older search indexes are rebuilt
+SEARCH_INDEX_VERSION = 1
+
+
+def chat_keys(transcripts, chat_metadata):
+    """Keys for extraction output (transcripts and metadata are parallel lists)"""
+    return [chat_key(meta.get("chat_id"), transcript) for transcript, meta in zip(transcripts, chat_metadata)]
+
+
+def utc_timestamp(value):
+    """ISO-8601 UTC time ("2024-03-01T10:00:00") from an ISO or epoch (s/ms) timestamp; None if unreadable"""
+    value = str(value).strip() if value is not None else ""
+    if value.isdigit():
+        seconds = int(value) / (1000 if len(value) > 11 else 1)
+        try:
+            return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None).isoformat()
+        except (OverflowError, OSError, ValueError):
+            return None
+    parsed = _as_datetime(value)
+    return parsed.isoformat() if parsed is not None else None
+
+
+class ChatIndex:
+    """SQLite index over an append-only transcript pack file"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS chats (
+        chat_id TEXT PRIMARY KEY,
+        started_at TEXT,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        source TEXT,
+        pack_offset INTEGER NOT NULL,
+        pack_length INTEGER NOT NULL,
+        indexed_at TEXT NOT NULL,
+        fingerprint TEXT,
+        issue_type TEXT
+    );
+    CREATE TABLE IF NOT EXISTS chat_agents (
+        chat_id TEXT NOT NULL,
+        agent_name TEXT NOT NULL,
+        PRIMARY KEY (agent_name, chat_id)
+    );
+    CREATE TABLE IF NOT EXISTS audited_chats (
+        agent_name TEXT NOT NULL,
+        chat_id TEXT NOT NULL,
+        fingerprint TEXT,
+        PRIMARY KEY (agent_name, chat_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_chats_started ON chats (started_at);
+    CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+        body,
+        sender UNINDEXED,
+        role UNINDEXED,
+        chat_id UNINDEXED,
+        sent_at UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+    """
+
+    def __init__(self, path=DEFAULT_CHAT_INDEX_PATH):
+        self.path = path
+        self.pack_path = f"{path}.pack"
+        self._local = threading.local()
+        conn = self._connect()
+        self._migrate(conn)
+        tracks_audits = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'audited_chats'").fetchone()
+        conn.executescript(self.SCHEMA)
+        # Indexes from before audited_chats only stored chats once they were audited
+        if not tracks_audits:
+            conn.execute("INSERT OR IGNORE INTO audited_chats (agent_name, chat_id, fingerprint) "
+                         "SELECT a.agent_name, c.chat_id, c.fingerprint FROM chat_agents a "
+                         "JOIN chats c ON c.chat_id = a.chat_id")
+
+        # Indexes created before full-text search existed (or before message times were normalised) are rebuilt once
+        has_chats = conn.execute("SELECT 1 FROM chats LIMIT 1").fetchone()
+        has_messages = conn.execute("SELECT 1 FROM message_fts LIMIT 1").fetchone()
+        search_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if has_chats and (not has_messages or search_version < SEARCH_INDEX_VERSION):
+            self.rebuild_search_index()
+        conn.execute(f"PRAGMA user_version = {SEARCH_INDEX_VERSION}")
+        # ... and so do chats stored before fingerprints existed
+        if conn.execute("SELECT 1 FROM chats WHERE fingerprint IS NULL LIMIT 1").fetchone():
+            self._backfill_fingerprints()
+        if conn.execute("SELECT 1 FROM chats WHERE issue_type IS NULL LIMIT 1").fetchone():
+            self.reclassify_issues(missing_only=True)
+
+    @staticmethod
+    def _migrate(conn):
+        """Add columns introduced after an index was first created"""
+        present = {row[1] for row in conn.execute("PRAGMA table_info(chats)")}
+        for column in ("fingerprint", "issue_type"):
+            if present and column not in present:
+                conn.execute(f"ALTER TABLE chats ADD COLUMN {column} TEXT")
+
+    def _backfill_fingerprints(self):
+        with _Transaction(self._connect()) as conn, open(self.pack_path, "rb") as pack:
+            for row in conn.execute("SELECT chat_id, pack_offset, pack_length FROM chats "
+                                    "WHERE fingerprint IS NULL").fetchall():
+                pack.seek(row["pack_offset"])
+                conn.execute("UPDATE chats SET fingerprint = ? WHERE chat_id = ?",
+                             (content_fingerprint(pack.read(row["pack_length"]).decode("utf-8")), row["chat_id"]))
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def add_chats(self, agent_name, transcripts, chat_metadata, source=""):
+        """Store new or changed chats and link them to the agent; returns their keys in order"""
+        keys = chat_keys(transcripts, chat_metadata)
+        now = datetime.now().isoformat()
+
+        # The write transaction also serializes pack appends between processes
+        with _Transaction(self._connect()) as conn, open(self.pack_path, "ab") as pack:
+            pending = []
+            for key, transcript, meta in zip(keys, transcripts, chat_metadata):
+                fingerprint = meta.get("fingerprint") or content_fingerprint(transcript)
+                row = conn.execute("SELECT fingerprint, message_count FROM chats WHERE chat_id = ?",
+                                   (key,)).fetchone()
+                # Same chat in a later export: keep the stored copy unless the conversation grew
+                if row is None or (row["fingerprint"] != fingerprint
+                                   and meta.get("message_count", 0) >= row["message_count"]):
+                    pending.append((key, transcript, meta, fingerprint, row is not None))
+                conn.execute(
+                    "INSERT OR IGNORE INTO chat_agents (chat_id, agent_name) VALUES (?, ?)", (key, agent_name)
+                )
+
+            # Classify all new chats in one vectorized batch
+            issue_types = classify_issues([transcript for _, transcript, _, _, _ in pending])
+            for (key, transcript, meta, fingerprint, replaced), issue_type in zip(pending, issue_types):
+                data = transcript.encode("utf-8")
+                pack.seek(0, os.SEEK_END)
+                offset = pack.tell()
+                pack.write(data)
+                conn.execute(
+                    "INSERT OR REPLACE INTO chats (chat_id, started_at, message_count, source, pack_offset, "
+                    "pack_length, indexed_at, fingerprint, issue_type) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, meta.get("started_at"), meta.get("message_count", 0), source, offset, len(data), now,
+                     fingerprint, issue_type),
+                )
+                if replaced:
+                    conn.execute("DELETE FROM message_fts WHERE chat_id = ?", (key,))
+                self._index_messages(conn, key, transcript, meta.get("started_at"))
+            # Index rows must never point past the end of the pack
+            pack.flush()
+            os.fsync(pack.fileno())
+        return keys
+
+    def get_chat(self, chat_id):
+        """Return a chat's metadata and transcript, reading only that chat from the pack"""
+        row = self._connect().execute("SELECT * FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+        if row is None:
+            return None
+        with open(self.pack_path, "rb") as pack:
+            pack.seek(row["pack_offset"])
+            transcript = pack.read(row["pack_length"]).decode("utf-8")
+        agents = [r["agent_name"] for r in self._connect().execute(
+            "SELECT agent_name FROM chat_agents WHERE chat_id = ? ORDER BY agent_name", (chat_id,))]
+        return {
+            "chat_id": row["chat_id"],
+            "started_at": row["started_at"],
+            "message_count": row["message_count"],
+            "source": row["source"],
+            "agents": agents,
+            "transcript": transcript,
+        }
+
+    def list_agent_chats(self, agent_name):
+        """Metadata (no transcripts) for every indexed chat involving an agent"""
+        rows = self._connect().execute(
+            "SELECT c.chat_id, c.started_at, c.message_count, c.source FROM chats c "
+            "JOIN chat_agents a ON a.chat_id = c.chat_id WHERE a.agent_name = ? ORDER BY c.started_at",
+            (agent_name,),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def agent_issue_mix(self, agent_name):
+        """{issue type: chat count} over every indexed chat involving an agent"""
+        rows = self._connect().execute(
+            "SELECT c.issue_type, COUNT(*) FROM chats c JOIN chat_agents a ON a.chat_id = c.chat_id "
+            "WHERE a.agent_name = ? GROUP BY c.issue_type ORDER BY COUNT(*) DESC",
+            (agent_name,),
+        ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def issue_types(self, chat_ids):
+        """{chat id: issue type} for the given chats that are indexed"""
+        # One JSON parameter instead of one per id keeps large audits under SQLite's variable limit
+        rows = self._connect().execute(
+            "SELECT chat_id, issue_type FROM chats WHERE chat_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(chat_ids)),),
+        ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def reclassify_issues(self, classifier=None, missing_only=False):
+        """Relabel stored chats (all, or only unlabelled ones) in batches; returns how many"""
+        where = " WHERE issue_type IS NULL" if missing_only else ""
+        rows = self._connect().execute(f"SELECT chat_id, pack_offset, pack_length FROM chats{where}").fetchall()
+        with open(self.pack_path, "rb") as pack:
+            for start in range(0, len(rows), CLASSIFY_BATCH_SIZE):
+                batch = rows[start:start + CLASSIFY_BATCH_SIZE]
+                transcripts = []
+                for row in batch:
+                    pack.seek(row["pack_offset"])
+                    transcripts.append(pack.read(row["pack_length"]).decode("utf-8"))
+                with _Transaction(self._connect()) as conn:
+                    conn.executemany("UPDATE chats SET issue_type = ? WHERE chat_id = ?",
+                                     zip(classify_issues(transcripts, classifier), (row["chat_id"] for row in batch)))
+        return len(rows)
+
+    def mark_audited(self, agent_name, transcripts, chat_metadata):
+        """Record the chat versions a successful (saved) audit of the agent covered"""
+        with _Transaction(self._connect()) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO audited_chats (agent_name, chat_id, fingerprint) VALUES (?, ?, ?)",
+                [(agent_name, key, meta.get("fingerprint") or content_fingerprint(transcript))
+                 for key, transcript, meta in zip(chat_keys(transcripts, chat_metadata), transcripts, chat_metadata)],
+            )
+
+    def audited_chats(self, agent_name):
+        """(chat id, fingerprint) of every chat version already audited for an agent, to skip in the next audit"""
+        return {(row[0], row[1]) for row in self._connect().execute(
+            "SELECT chat_id, fingerprint FROM audited_chats WHERE agent_name = ?", (agent_name,))}
+
+    # --- FULL-TEXT SEARCH ---
+    @staticmethod
+    def _index_messages(conn, chat_id, transcript, started_at=None):
+        started_at = utc_timestamp(started_at)
+        conn.executemany(
+            "INSERT INTO message_fts (body, sender, role, chat_id, sent_at) VALUES (?, ?, ?, ?, ?)",
+            [(body, sender, sender_role(sender), chat_id, utc_timestamp(sent_at) or started_at)
+             for sent_at, sender, body in parse_transcript(transcript)],
+        )
+
+    def rebuild_search_index(self):
+        """Recompute the message index from the pack file"""
+        with _Transaction(self._connect()) as conn, open(self.pack_path, "rb") as pack:
+            conn.execute("DELETE FROM message_fts")
+            for row in conn.execute("SELECT chat_id, started_at, pack_offset, pack_length FROM chats").fetchall():
+                pack.seek(row["pack_offset"])
+                self._index_messages(conn, row["chat_id"], pack.read(row["pack_length"]).decode("utf-8"),
+                                     row["started_at"])
+
+    def search(self, query, agent_name=None, role=None, since=None, until=None, limit=50):
+        """Ranked message hits with snippets.
+
+        query uses FTS5 syntax ("exact phrase", OR, prefix*); anything that does not
+        parse is searched as plain words. With role="agent" and an agent_name only that
+        agent's own messages match, otherwise agent_name limits hits to their chats.
+        since/until are dates or ISO timestamps, compared in UTC against message times (until exclusive).
+        """
+        clauses = ["message_fts MATCH ?"]
+        params = []
+        if agent_name and role == "agent":
+            clauses.append("sender = ?")
+            params.append(agent_name)
+        elif agent_name:
+            clauses.append("chat_id IN (SELECT chat_id FROM chat_agents WHERE agent_name = ?)")
+            params.append(agent_name)
+        if role:
+            clauses.append("role = ?")
+            params.append(role)
+        if since:
+            clauses.append("sent_at >= ?")
+            params.append(utc_timestamp(since) or since)
+        if until:
+            clauses.append("sent_at < ?")
+            params.append(utc_timestamp(until) or until)
+        sql = (
+            "SELECT chat_id, sender, role, sent_at, bm25(message_fts) AS rank, "
+            f"snippet(message_fts, 0, '**', '**', ' … ', {SEARCH_SNIPPET_TOKENS}) AS snippet "
+            f"FROM message_fts WHERE {' AND '.join(clauses)} ORDER BY rank LIMIT ?"
+        )
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, [query, *params, limit]).fetchall()
+        except sqlite3.OperationalError:
+            # Stray quotes, colons or operators: fall back to matching every word literally
+            words = " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+            if not words:
+                return []
+            rows = conn.execute(sql, [words, *params, limit]).fetchall()
+        return [dict(row) for row in rows]
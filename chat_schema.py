@@ -0,0 +1,147 @@
+"""Typed decoding of tawk.to chat JSON.
+
+Only the fields the auditor uses are decoded (id, started, messages[].sender.n,
+msg, t); everything else in the file is skipped without building objects.
+With msgspec installed, chats decode straight into slotted Structs; without it
+the stdlib json module is used and validated into equivalent __slots__
+classes. Either way a file that is not JSON or does not match the schema
+raises ChatDecodeError with a reason, so extraction can count and report it
+instead of silently dropping the chat. Message bodies and timestamps that are
+numbers or null (seen in real exports) are accepted and turned into strings,
+as the original f-string formatting did. Numeric or null chat ids, start
+times and sender names are accepted too: a null id stays None (a missing id),
+a null start time becomes "" (unknown) and a null sender is a visitor.
+"""
+import json
+from typing import List, Union
+
+try:
+    import msgspec
+except ImportError:  # optional speed-up; the stdlib decoder below handles the same schema
+    msgspec = None
+
+MISSING_CHAT_ID = "unknown"
+DEFAULT_SENDER = "Visitor"
+
+
+def _as_text(value):
+    """msg/t as a string: numbers and null are formatted like an f-string would ("None" for null)"""
+    return value if isinstance(value, str) else str(value)
+
+
+def _as_text_or(value, default):
+    """sender.n/started as a string, with default for null"""
+    return default if value is None else _as_text(value)
+
+
+class ChatDecodeError(ValueError):
+    """A chat file that could not be decoded; reason is "json" (not JSON) or "schema" (wrong shape)"""
+
+    def __init__(self, reason, detail):
+        super().__init__(f"{reason}: {detail}")
+        self.reason = reason
+        self.detail = detail
+
+
+# --- SCHEMA ---
+if msgspec is not None:
+    # gc=False: chats never form reference cycles, so keep them out of the garbage collector
+    class Sender(msgspec.Struct, gc=False):
+        n: Union[str, int, float, None] = DEFAULT_SENDER
+
+        def __post_init__(self):
+            self.n = _as_text_or(self.n, DEFAULT_SENDER)
+
+    class ChatMessage(msgspec.Struct, gc=False):
+        sender: Sender = msgspec.field(default_factory=Sender)
+        msg: Union[str, int, float, None] = ""
+        t: Union[str, int, float, None] = ""
+
+        def __post_init__(self):
+            self.msg = _as_text(self.msg)
+            self.t = _as_text(self.t)
+
+    class Chat(msgspec.Struct, gc=False):
+        id: Union[str, int, float, None] = MISSING_CHAT_ID
+        started: Union[str, int, float, None] = ""
+        messages: List[ChatMessage] = []
+
+        def __post_init__(self):
+            self.started = _as_text_or(self.started, "")
+
+    _DECODER = msgspec.json.Decoder(Chat)
+
+    def decode_chat(raw):
+        """Decode one chat file's bytes into a Chat"""
+        try:
+            return _DECODER.decode(raw)
+        except msgspec.ValidationError as e:
+            raise ChatDecodeError("schema", str(e)) from None
+        except msgspec.DecodeError as e:
+            raise ChatDecodeError("json", str(e)) from None
+
+else:
+    class Sender:
+        __slots__ = ("n",)
+
+        def __init__(self, n=DEFAULT_SENDER):
+            self.n = _as_text_or(n, DEFAULT_SENDER)
+
+    class ChatMessage:
+        __slots__ = ("sender", "msg", "t")
+
+        def __init__(self, sender=None, msg="", t=""):
+            self.sender = sender if sender is not None else Sender()
+            self.msg = _as_text(msg)
+            self.t = _as_text(t)
+
+    class Chat:
+        __slots__ = ("id", "started", "messages")
+
+        def __init__(self, id=MISSING_CHAT_ID, started="", messages=()):
+            self.id = id
+            self.started = _as_text_or(started, "")
+            self.messages = list(messages)
+
+    _JSON_TYPE_NAMES = {str: "str", int: "int", float: "float", list: "array", dict: "object", type(None): "null"}
+
+    # Types accepted for msg, t, sender.n, id and started before _as_text
+    _TEXT_TYPES = (str, int, float, type(None))
+
+    def _type_error(expected, value, path):
+        got = "bool" if isinstance(value, bool) else _JSON_TYPE_NAMES.get(type(value), type(value).__name__)
+        return ChatDecodeError("schema", f"Expected `{expected}`, got `{got}` - at `{path}`")
+
+    def _field(obj, key, default, types, path):
+        value = obj.get(key, default)
+        types = types if isinstance(types, tuple) else (types,)
+        if not isinstance(value, types) or isinstance(value, bool):
+            raise _type_error(" | ".join(_JSON_TYPE_NAMES[t] for t in types), value, f"{path}.{key}")
+        return value
+
+    def _decode_message(data, path):
+        if not isinstance(data, dict):
+            raise _type_error("object", data, path)
+        sender = data.get("sender", {})
+        if not isinstance(sender, dict):
+            raise _type_error("object", sender, f"{path}.sender")
+        return ChatMessage(
+            Sender(_field(sender, "n", DEFAULT_SENDER, _TEXT_TYPES, f"{path}.sender")),
+            _field(data, "msg", "", _TEXT_TYPES, path),
+            _field(data, "t", "", _TEXT_TYPES, path),
+        )
+
+    def decode_chat(raw):
+        """Decode one chat file's bytes into a Chat"""
+        try:
+            data = json.loads(raw)
+        except ValueError as e:
+            raise ChatDecodeError("json", str(e)) from None
+        if not isinstance(data, dict):
+            raise _type_error("object", data, "$")
+        messages = _field(data, "messages", [], list, "$")
+        return Chat(
+            _field(data, "id", MISSING_CHAT_ID, _TEXT_TYPES, "$"),
+            _field(data, "started", "", _TEXT_TYPES, "$"),
+            [_decode_message(message, f"$.messages[{i}]") for i, message in enumerate(messages)],
+        )
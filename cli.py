@@ -0,0 +1,341 @@
+"""Headless batch audits for scheduled runs outside Streamlit.
+
+Usage:
+    python cli.py export.zip --output-dir reports/
+    python cli.py export.zip --agents "Athira" "Timothy" --concurrency 8 --formats pdf xlsx json
+    python cli.py export.zip --backend fake --output-dir /tmp/dry-run
+    python cli.py export.zip --team-workbook --team-pdf --formats json
+    python cli.py export.zip --formats form pdf
+    python cli.py export.zip --agents "Athira" --since 2024-03-01 --until 2024-04-01
+    python cli.py export.zip --adaptive --backend fake
+    python cli.py export.zip --tiered --escalation-model gemini-2.5-flash
+    python cli.py export.zip --store sqlite:///audit_store.db --daily-requests 1000 --run-tokens 2000000
+
+Runs extraction, run_comprehensive_audit and report generation for every
+selected agent. All selected agents are extracted in one pass over the export,
+skipping chats outside --since/--until before they are parsed. Model calls run
+on a thread pool (--concurrency) and reports render on a process pool
+(--report-processes, default: all CPUs). With --adaptive each agent is
+audited in rounds of chats until the scores converge instead of in one call.
+With --tiered a short triage prompt scores every agent first and only
+borderline or suspicious agents get the full audit (on --escalation-model).
+With request/token budgets, agents are estimated up front, audited in
+priority order while they fit and the rest are deferred to the next run.
+
+Exit status: 0 when every agent was audited or deferred, 1 when some agents
+failed or had no chats (also when none of them had chats), 2 when nothing
+could be audited (bad input, no agents, no model, or every audit that ran
+failed).
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+from functools import partial
+
+from audit_engine import run_adaptive_audit, run_comprehensive_audit, run_tiered_audit
+from audit_store import DEFAULT_LEASE_SECONDS, compute_audit_key, open_audit_store
+from chat_index import ChatIndex, chat_keys
+from extraction import get_agent_transcripts, get_all_agents_from_zip, get_transcripts_for_agents
+from instrumentation import configure as configure_metrics, METRICS
+from model_backends import create_backend
+from scheduler import (
+    DAILY_REQUEST_BUDGET,
+    DAILY_TOKEN_BUDGET,
+    Budget,
+    MeteredBackend,
+    ledger_recorder,
+    record_audited,
+    refused_calls,
+    schedule_bulk_audit,
+)
+from reports import (
+    generate_excel_report,
+    generate_pdf_report,
+    generate_team_excel_report,
+    generate_team_pdf_report,
+    generate_template_excel_report,
+)
+
+logger = logging.getLogger("auditor.cli")
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_FAILED = 2
+
+# format -> (writer, file extension)
+REPORT_WRITERS = {
+    "pdf": (generate_pdf_report, "pdf"),
+    "xlsx": (generate_excel_report, "xlsx"),
+    "form": (generate_template_excel_report, "form.xlsx"),
+}
+
+
+def safe_filename(name):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+
+
+def audit_agent(export_path, agent_name, model, store=None, chat_index=None, extracted=None, adaptive=False,
+                tiered=False, escalation_model=None, lock_owner=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """Audit one agent from pre-extracted (transcripts, metadata) or the export; returns a result row (never raises).
+
+    With a store, the row's audit_id is the stored audit; lock_owner and
+    lease_seconds are passed to the store's agent lock. A failed audit whose
+    model calls the budget refused gets status "deferred".
+    """
+    refused_before = refused_calls()
+    try:
+        if extracted is None:
+            extracted = get_agent_transcripts(export_path, agent_name, on_warning=logger.warning)
+        transcripts, metadata = extracted
+        if not transcripts:
+            return {"agent": agent_name, "status": "no_chats", "chats": 0, "score": None, "agent_data": None}
+
+        if chat_index is not None:
+            chat_ids = chat_index.add_chats(agent_name, transcripts, metadata, source=os.path.basename(export_path))
+            issue_types = chat_index.issue_types(chat_ids)
+        else:
+            chat_ids = chat_keys(transcripts, metadata)
+            issue_types = None
+
+        audit = run_adaptive_audit if adaptive else run_comprehensive_audit
+        if tiered:
+            audit = partial(run_tiered_audit, escalation_model=escalation_model, full_audit=audit)
+        variant = "+".join(mode for mode, enabled in (("tiered", tiered), ("adaptive", adaptive)) if enabled)
+        audit_id = None
+        if store is not None:
+            audit_key = compute_audit_key(agent_name, transcripts, variant=variant or None)
+            audit_result, _ = store.run_deduplicated(
+                agent_name,
+                audit_key,
+                lambda: audit(transcripts, agent_name, model, chat_ids=chat_ids, issue_types=issue_types),
+                total_chats=len(transcripts),
+                metadata={"chats": metadata, "source": os.path.basename(export_path)},
+                lease_seconds=lease_seconds,
+                owner=lock_owner,
+            )
+            latest = store.find_audit_by_key(agent_name, audit_key) if audit_result else None
+            audit_id = latest["id"] if latest else None
+        else:
+            audit_result = audit(transcripts, agent_name, model, chat_ids=chat_ids, issue_types=issue_types)
+
+        if not audit_result:
+            status = "deferred" if refused_calls() > refused_before else "failed"
+            return {"agent": agent_name, "status": status, "chats": len(transcripts), "score": None,
+                    "agent_data": None}
+        if chat_index is not None:
+            # Only chats covered by a saved audit count as audited for new-chats-only runs
+            chat_index.mark_audited(agent_name, transcripts, metadata)
+
+        agent_data = {
+            "name": agent_name,
+            "audit_data": audit_result,
+            "total_chats": len(transcripts),
+            "audit_timestamp": datetime.now().isoformat(),
+        }
+        return {"agent": agent_name, "status": "success", "chats": len(transcripts),
+                "score": audit_result.get("overall_score"), "agent_data": agent_data, "audit_id": audit_id}
+    except Exception as e:
+        logger.exception("Audit failed for %s", agent_name)
+        return {"agent": agent_name, "status": f"error: {e}", "chats": 0, "score": None, "agent_data": None}
+
+
+def write_reports(results, output_dir, formats, processes):
+    """Render report files for successful audits on a process pool; returns {agent: [paths]}"""
+    written = {}
+    jobs = []
+    for row in results:
+        if row["status"] != "success":
+            continue
+        base = os.path.join(output_dir, f"{safe_filename(row['agent'])}_Performance_Review")
+        if "json" in formats:
+            with open(f"{base}.json", "w", encoding="utf-8") as f:
+                json.dump(row["agent_data"]["audit_data"], f, indent=2)
+            written.setdefault(row["agent"], []).append(f"{base}.json")
+        for fmt, (writer, extension) in REPORT_WRITERS.items():
+            if fmt in formats:
+                jobs.append((row["agent"], writer, row["agent_data"], f"{base}.{extension}"))
+
+    if not jobs:
+        return written
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {pool.submit(writer, agent_data, agent, path): (agent, path)
+                   for agent, writer, agent_data, path in jobs}
+        for future in as_completed(futures):
+            agent, path = futures[future]
+            try:
+                future.result()
+                written.setdefault(agent, []).append(path)
+            except Exception:
+                logger.exception("Report generation failed for %s (%s)", agent, path)
+    return written
+
+
+def write_summary(results, output_dir):
+    path = os.path.join(output_dir, "summary.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["agent", "status", "score", "chats", "priority"])
+        writer.writeheader()
+        for row in results:
+            writer.writerow({key: row.get(key) for key in ("agent", "status", "score", "chats", "priority")})
+    return path
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run HostAfrica AI audits from a tawk.to export without the UI")
+    parser.add_argument("export", help="Path to the tawk.to export ZIP")
+    parser.add_argument("--agents", nargs="+", help="Only audit these agents (default: every detected agent)")
+    parser.add_argument("--since", type=date.fromisoformat,
+                        help="Only audit chats started on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", type=date.fromisoformat,
+                        help="Only audit chats started before this date (YYYY-MM-DD)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Agents audited in parallel")
+    parser.add_argument("--report-processes", type=int, default=os.cpu_count(),
+                        help="Processes used to render PDF/Excel reports")
+    parser.add_argument("--output-dir", default=f"audit_reports_{datetime.now().strftime('%Y%m%d')}")
+    parser.add_argument("--formats", nargs="+", default=["pdf", "xlsx", "json"], choices=["pdf", "xlsx", "form", "json"],
+                        help="form fills the QA review form from template.xlsx")
+    parser.add_argument("--backend", default=os.environ.get("MODEL_BACKEND", "gemini"), choices=["gemini", "fake"])
+    parser.add_argument("--team-workbook", action="store_true",
+                        help="Also write one Excel workbook with a summary sheet and a sheet per agent")
+    parser.add_argument("--team-pdf", action="store_true",
+                        help="Also write one PDF with a table of contents and a bookmarked section per agent")
+    parser.add_argument("--store", default=os.environ.get("AUDIT_STORE_URL"),
+                        help="Save results to a shared audit store, e.g. sqlite:///audit_store.db")
+    parser.add_argument("--chat-index", default=os.environ.get("CHAT_INDEX_PATH"),
+                        help="Store transcripts in this chat evidence index, e.g. chat_index.db")
+    parser.add_argument("--new-only", action="store_true",
+                        help="Skip chats each agent already has in --chat-index (overlapping exports)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Audit in rounds of chats and stop once the scores converge (fewer tokens for "
+                             "consistent agents)")
+    parser.add_argument("--tiered", action="store_true",
+                        help="Triage every agent with a short prompt; only borderline agents, critical incidents "
+                             "and lazy-looking scores get the full audit")
+    parser.add_argument("--escalation-model", default=os.environ.get("ESCALATION_GEMINI_MODEL"),
+                        help="Gemini model for agents escalated past triage (default: the triage model)")
+    parser.add_argument("--daily-requests", type=int, default=DAILY_REQUEST_BUDGET,
+                        help="Model requests allowed per quota day across runs (needs --store; 0 = unlimited)")
+    parser.add_argument("--daily-tokens", type=int, default=DAILY_TOKEN_BUDGET,
+                        help="Prompt + output tokens allowed per quota day across runs (needs --store; 0 = unlimited)")
+    parser.add_argument("--run-requests", type=int, help="Model requests allowed for this run")
+    parser.add_argument("--run-tokens", type=int, help="Prompt + output tokens allowed for this run")
+    parser.add_argument("--metrics-log", help="Append per-stage metrics to this JSONL file")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    if args.metrics_log:
+        configure_metrics(jsonl_path=args.metrics_log)
+
+    if not os.path.isfile(args.export):
+        logger.error("Export not found: %s", args.export)
+        return EXIT_FAILED
+
+    if args.backend == "gemini":
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            logger.error("GEMINI_API_KEY is not set (use --backend fake for a dry run)")
+            return EXIT_FAILED
+        model = create_backend("gemini", api_key=api_key)
+        escalation_model = model
+        if args.escalation_model:
+            escalation_model = create_backend("gemini", api_key=api_key, model_name=args.escalation_model)
+    else:
+        model = escalation_model = create_backend("fake")
+
+    agents = args.agents or get_all_agents_from_zip(args.export, on_warning=logger.warning)
+    if not agents:
+        logger.error("No agents found in %s", args.export)
+        return EXIT_FAILED
+
+    if args.new_only and not args.chat_index:
+        logger.error("--new-only needs --chat-index to know which chats were already audited")
+        return EXIT_FAILED
+
+    if (args.daily_requests or args.daily_tokens) and not args.store:
+        logger.error("Daily budgets need --store to keep the usage ledger")
+        return EXIT_FAILED
+
+    store = open_audit_store(args.store) if args.store else None
+    chat_index = ChatIndex(args.chat_index) if args.chat_index else None
+    skip_seen = {name: chat_index.audited_chats(name) for name in agents} if args.new_only else None
+    os.makedirs(args.output_dir, exist_ok=True)
+    try:
+        extracted = get_transcripts_for_agents(args.export, agents, on_warning=logger.warning,
+                                               since=args.since, until=args.until, skip_seen=skip_seen)
+    except Exception:
+        logger.exception("Could not read %s", args.export)
+        return EXIT_FAILED
+
+    # Highest-priority agents first, as many as the request/token budget covers
+    budget = Budget.for_window(store, args.daily_requests, args.daily_tokens, args.run_requests, args.run_tokens)
+    scheduled, deferred = schedule_bulk_audit(extracted, store, budget, args.adaptive, args.tiered)
+    on_usage = ledger_recorder(store) if store is not None else None
+    model = MeteredBackend(model, budget, on_usage)
+    escalation_model = model if escalation_model is model.backend else MeteredBackend(escalation_model, budget,
+                                                                                      on_usage)
+    logger.info("Auditing %d agent(s) with concurrency %d", len(scheduled), args.concurrency)
+
+    results = [{"agent": name, "status": "no_chats", "chats": 0, "score": None, "agent_data": None}
+               for name in agents if not extracted[name][0]]
+    results += [{"agent": entry["agent"], "status": "deferred", "chats": len(extracted[entry["agent"]][0]),
+                 "score": None, "agent_data": None, "priority": entry["priority"]} for entry in deferred]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        # Submitted in priority order, so if estimates fall short it is the lowest-priority agents that miss out
+        futures = {pool.submit(audit_agent, args.export, entry["agent"], model, store, chat_index,
+                               extracted[entry["agent"]], args.adaptive, args.tiered, escalation_model): entry
+                   for entry in scheduled}
+        for done, future in enumerate(as_completed(futures), 1):
+            row = dict(future.result(), priority=futures[future]["priority"])
+            if row["status"] == "deferred":
+                # Refused by the budget after an estimate fell short; it goes first next window
+                if store is not None:
+                    store.defer_audits([(row["agent"], futures[future]["cost"].tokens, "budget")])
+            results.append(row)
+            logger.info("[%d/%d] %s: %s (score %s, %d chats)", done, len(scheduled), row["agent"],
+                        row["status"], row["score"], row["chats"])
+    record_audited(store, [row["agent"] for row in results if row["status"] == "success"])
+
+    results.sort(key=lambda row: row["agent"])
+    write_reports(results, args.output_dir, args.formats, args.report_processes)
+    if args.team_workbook:
+        team_path = os.path.join(args.output_dir, "Team_Performance_Review.xlsx")
+        generate_team_excel_report([(row["agent"], row["agent_data"]) for row in results if row["agent_data"]],
+                                   team_path)
+        logger.info("Team workbook written to %s", team_path)
+    if args.team_pdf:
+        team_pdf_path = os.path.join(args.output_dir, "Team_Performance_Review.pdf")
+        generate_team_pdf_report([(row["agent"], row["agent_data"]) for row in results if row["agent_data"]],
+                                 team_pdf_path)
+        logger.info("Team PDF written to %s", team_pdf_path)
+    summary_path = write_summary(results, args.output_dir)
+
+    succeeded = sum(1 for row in results if row["status"] == "success")
+    if args.tiered:
+        escalated = sum(1 for row in results if row["agent_data"]
+                        and row["agent_data"]["audit_data"].get("triage", {}).get("escalated"))
+        logger.info("Triage: %d/%d audited agents escalated to the full audit", escalated, succeeded)
+    postponed = sum(1 for row in results if row["status"] == "deferred")
+    logger.info("Model usage this run: %d requests, %d tokens", budget.spent.requests, budget.spent.tokens)
+    logger.info("Done: %d/%d agents audited, %d deferred; summary at %s", succeeded, len(results), postponed,
+                summary_path)
+    logger.debug("Metrics:\n%s", METRICS.render_prometheus())
+
+    # Agents without chats had nothing to audit, so they alone do not make the run a failure
+    if succeeded == 0 and any(row["status"] not in ("deferred", "no_chats") for row in results):
+        return EXIT_FAILED
+    return EXIT_OK if succeeded + postponed == len(results) else EXIT_PARTIAL
+
+
+if __name__ == "__main__":
+    sys.exit(main())
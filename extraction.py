@@ -0,0 +1,460 @@
+import hashlib
+import io
+import json
+import re
+import zipfile
+from datetime import datetime, timezone
+from chat_schema import ChatDecodeError, decode_chat
+from instrumentation import METRICS, file_size, instrumented
+
+# Header of each "[timestamp] sender: body" line written by get_agent_transcripts
+MESSAGE_HEADER = re.compile(r"^\[([^\]\n]*)\] ([^\n]*?): ", re.MULTILINE)
+
+
+def sender_role(name):
+    """Classify a tawk.to sender name as visitor, bot or agent"""
+    if not name or name == "Visitor":
+        return "visitor"
+    if name.startswith("Bot"):
+        return "bot"
+    return "agent"
+
+
+def parse_transcript(chat_text):
+    """Split a transcript back into (timestamp, sender, body) messages"""
+    headers = list(MESSAGE_HEADER.finditer(chat_text))
+    messages = []
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(chat_text)
+        messages.append((header.group(1), header.group(2), chat_text[header.end():end].rstrip("\n")))
+    return messages
+
+
+# --- CHAT IDENTITY ---
+# tawk.to chats without an id come out of extraction as "unknown"
+MISSING_CHAT_IDS = {None, "", "unknown"}
+
+
+def content_fingerprint(transcript):
+    """Short hash of a transcript's text, equal for the same chat in any archive or export"""
+    return hashlib.sha1(transcript.encode("utf-8")).hexdigest()[:16]
+
+
+def chat_key(chat_id, transcript):
+    """Stable key for a chat: its tawk.to id, or a content hash when the export has none"""
+    if chat_id not in MISSING_CHAT_IDS:
+        return str(chat_id)
+    return "sha1-" + content_fingerprint(transcript)
+
+
+def _summarize_extraction(result, uploaded_zip, *args, **kwargs):
+    transcripts, _ = result
+    return {
+        "input_bytes": file_size(uploaded_zip),
+        "chats": len(transcripts),
+        "transcript_bytes": sum(len(t) for t in transcripts),
+    }
+
+# --- FILTER PUSHDOWN ---
+# Top-level "started" value, read from raw bytes before parsing the message list
+STARTED_FIELD = re.compile(rb'"started"\s*:\s*"([^"\\]*)"')
+# Words in nested archive names that do not identify an agent (e.g. Athira_chats.zip)
+ARCHIVE_NAME_NOISE = {"chats", "chat", "export", "exports", "transcripts", "tawk", "zip"}
+
+
+def _name_tokens(text):
+    return {token for token in re.split(r"[^0-9a-z]+", text.lower()) if token and token not in ARCHIVE_NAME_NOISE}
+
+
+def _as_datetime(value):
+    """Naive UTC datetime from a date, datetime or ISO string (None if unparseable)"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class ChatFilter:
+    """Cheap checks that let extraction skip archives and chats before parsing them.
+    
+    target_names=None extracts every agent (used for speculative extraction).
+    """
+    
+    def __init__(self, target_names, since=None, until=None, known_agents=None, skip_seen=None):
+        self.every_agent = target_names is None
+        self.targets = set(target_names or ())
+        # Every agent sender seen, including chats too short to keep (every_agent mode only)
+        self.seen_agents = set()
+        # {agent: {(chat key, fingerprint)}} of chat versions already audited for that agent
+        self.skip_seen = skip_seen or {}
+        # {chat id: (message count, agents)} of copies dropped because those agents already audited them;
+        # older, shorter copies of the same chat found later are dropped for them too
+        self.audited_copies = {}
+        self.since = _as_datetime(since)
+        self.until = _as_datetime(until)
+        self.other_agents = [_name_tokens(name) for name in (known_agents or []) if name not in self.targets]
+        self.target_tokens = [_name_tokens(name) for name in self.targets]
+        # A chat can only belong to a target if the name appears in its raw JSON (plain or \u-escaped)
+        self.needles = {needle for name in self.targets
+                        for needle in (name.encode("utf-8"), json.dumps(name)[1:-1].encode("ascii"))}
+    
+    def skip_archive(self, file_path):
+        """Skip a nested ZIP whose name identifies a known agent that is not being extracted"""
+        tokens = _name_tokens(file_path.rsplit("/", 1)[-1][:-len(".zip")])
+        if not tokens or not self.other_agents:
+            return False
+        if any(tokens <= agent for agent in self.target_tokens):
+            return False
+        return any(tokens <= agent for agent in self.other_agents)
+    
+    def skip_raw(self, raw):
+        """Reason to skip a chat from its raw bytes alone, or None"""
+        if not self.every_agent and not any(needle in raw for needle in self.needles):
+            return "agent"
+        if self.since or self.until:
+            match = STARTED_FIELD.search(raw)
+            if match and self.outside_window(match.group(1).decode("utf-8", "replace")):
+                return "date"
+        return None
+    
+    def owners(self, chat):
+        """Target agents who took part in a decoded chat"""
+        senders = {message.sender.n for message in chat.messages}
+        if not self.every_agent:
+            return self.targets & senders
+        agents = {name for name in senders if sender_role(name) == "agent"}
+        self.seen_agents |= agents
+        return agents
+    
+    def outside_window(self, started_at):
+        started = _as_datetime(started_at)
+        if started is None:
+            return False
+        return bool((self.since and started < self.since) or (self.until and started >= self.until))
+
+
+def format_transcript(chat):
+    """Render a decoded chat as "[timestamp] sender: body" lines"""
+    return "".join(f"[{message.t}] {message.sender.n}: {message.msg}\n" for message in chat.messages)
+
+
+class _ExtractedChat:
+    """One unique chat found during extraction and the target agents it involves.
+    
+    archives maps each archive the chat was found in ("" = top level) to the
+    position of its first copy there, so the chat can be ordered as a scan
+    skipping some archives would have found it.
+    """
+    
+    __slots__ = ("transcript", "metadata", "owners", "archives")
+    
+    def __init__(self, transcript, metadata, owners, archives):
+        self.transcript = transcript
+        self.metadata = metadata
+        self.owners = owners
+        self.archives = archives
+
+
+def _archive_of(file_path):
+    """Nested ZIP a chat file came from ("" for chats at the top level)"""
+    return file_path.split(".zip/", 1)[0] + ".zip" if ".zip/" in file_path else ""
+
+
+def _add_archive(archives, archive, position):
+    archives[archive] = min(position, archives.get(archive, position))
+
+
+def _collect_chat(raw, chat_filter, chats, seen_files, archive="", position=0):
+    """Decode one chat JSON and record it once, for every target agent who took part"""
+    reason = chat_filter.skip_raw(raw)
+    if not reason:
+        # The same file in several nested ZIPs (a transferred chat) is only decoded once
+        digest = hashlib.sha1(raw).digest()
+        if digest in seen_files:
+            reason = "duplicate"
+            if seen_files[digest] in chats:
+                _add_archive(chats[seen_files[digest]].archives, archive, position)
+        seen_files.setdefault(digest, None)
+    if reason:
+        METRICS.inc("auditor_extraction_skipped_total", reason=reason)
+        return
+    
+    chat = decode_chat(raw)
+    owners = chat_filter.owners(chat)
+    if not owners or len(chat.messages) <= 3 or chat_filter.outside_window(chat.started):
+        return
+    chat_id = str(chat.id) if chat.id not in MISSING_CHAT_IDS else None
+    
+    # Agents who already audited a longer copy of this chat do not get an older one
+    audited = chat_filter.audited_copies.get(chat_id)
+    if audited is not None and len(chat.messages) <= audited[0]:
+        owners = owners - audited[1]
+        if not owners:
+            METRICS.inc("auditor_extraction_skipped_total", reason="seen")
+            return
+    
+    # A chat id seen before (overlapping export) only replaces the earlier copy if it grew
+    earlier = chats.get(chat_id)
+    if earlier is not None and len(chat.messages) <= earlier.metadata["message_count"]:
+        earlier.owners |= owners
+        _add_archive(earlier.archives, archive, position)
+        seen_files[digest] = chat_id
+        METRICS.inc("auditor_extraction_skipped_total", reason="duplicate")
+        return
+    
+    # Only chats that are kept get a transcript string, built once and shared by every owner
+    chat_text = format_transcript(chat)
+    fingerprint = content_fingerprint(chat_text)
+    key = chat_key(chat.id, chat_text)
+    archives = {archive: position}
+    if key in chats:
+        # This copy supersedes the earlier one for all of its owners
+        owners |= chats[key].owners
+        for earlier_archive, earlier_position in chats[key].archives.items():
+            _add_archive(archives, earlier_archive, earlier_position)
+        METRICS.inc("auditor_extraction_skipped_total", reason="duplicate")
+    seen = {owner for owner in owners if (key, fingerprint) in chat_filter.skip_seen.get(owner, ())}
+    if seen and chat_id is not None:
+        audited = chat_filter.audited_copies.get(chat_id)
+        if audited is not None and audited[0] == len(chat.messages):
+            seen |= audited[1]
+        if audited is None or audited[0] <= len(chat.messages):
+            chat_filter.audited_copies[chat_id] = (len(chat.messages), seen)
+    owners -= seen
+    if not owners:
+        # Already audited: the shorter copy found earlier is stale, not new
+        chats.pop(key, None)
+        METRICS.inc("auditor_extraction_skipped_total", reason="seen")
+        return
+    chats[key] = _ExtractedChat(chat_text, {
+        "chat_id": chat.id,
+        "started_at": chat.started,
+        "message_count": len(chat.messages),
+        "fingerprint": fingerprint
+    }, owners, archives)
+    seen_files[digest] = key
+
+
+# --- REJECTED FILES ---
+class RejectedFiles:
+    """Chat files (or nested archives) that could not be read, counted by reason"""
+    
+    # Files named in the warning; the rest are only counted
+    REPORT_LIMIT = 5
+    
+    def __init__(self, stage_name):
+        self.stage = stage_name
+        self.files = []
+    
+    def add(self, file_path, reason, detail=""):
+        self.files.append((file_path, reason, detail))
+        METRICS.inc("auditor_parse_errors_total", stage=self.stage)
+        METRICS.inc("auditor_rejected_files_total", stage=self.stage, reason=reason)
+    
+    def report(self, on_warning):
+        """Send one warning listing what was skipped, if anything was"""
+        if not self.files or not on_warning:
+            return
+        listed = "; ".join(f"{path} ({detail or reason})" for path, reason, detail in self.files[:self.REPORT_LIMIT])
+        more = len(self.files) - self.REPORT_LIMIT
+        on_warning(f"Skipped {len(self.files)} unreadable chat file(s): {listed}"
+                   + (f" and {more} more" if more > 0 else ""))
+
+
+def _iter_chat_files(uploaded_zip, rejected, skip_archive=None):
+    """Yield (path, raw bytes) for every chat JSON in the ZIP and its nested ZIPs"""
+    with zipfile.ZipFile(uploaded_zip, 'r') as z:
+        for file_path in z.namelist():
+            # Handle nested ZIP files (agent-specific ZIPs inside main ZIP)
+            if file_path.endswith('.zip'):
+                if skip_archive and skip_archive(file_path):
+                    METRICS.inc("auditor_extraction_skipped_total", reason="archive_name")
+                    continue
+                try:
+                    nested_z = zipfile.ZipFile(io.BytesIO(z.read(file_path)), 'r')
+                except (zipfile.BadZipFile, OSError) as e:
+                    rejected.add(file_path, "archive", str(e))
+                    continue
+                with nested_z:
+                    for nested_file_path in nested_z.namelist():
+                        if nested_file_path.endswith('.json'):
+                            path = f"{file_path}/{nested_file_path}"
+                            try:
+                                raw = nested_z.read(nested_file_path)
+                            except (zipfile.BadZipFile, OSError) as e:
+                                rejected.add(path, "archive", str(e))
+                                continue
+                            yield path, raw
+            
+            # Also handle direct JSON files in main ZIP (original functionality)
+            elif file_path.endswith('.json'):
+                try:
+                    raw = z.read(file_path)
+                except (zipfile.BadZipFile, OSError) as e:
+                    rejected.add(file_path, "archive", str(e))
+                    continue
+                yield file_path, raw
+
+
+class ExtractionCancelled(Exception):
+    """Raised when should_stop() asks a running extraction to give up"""
+
+
+def _scan_chats(uploaded_zip, chat_filter, on_warning=None, should_stop=None):
+    """{chat key: _ExtractedChat} for every chat that passes the filter"""
+    chats = {}
+    seen_files = {}
+    rejected = RejectedFiles("extraction")
+    
+    files = _iter_chat_files(uploaded_zip, rejected, chat_filter.skip_archive)
+    for position, (file_path, raw) in enumerate(files):
+        if should_stop is not None and should_stop():
+            raise ExtractionCancelled(f"Extraction stopped at {file_path}")
+        try:
+            _collect_chat(raw, chat_filter, chats, seen_files, _archive_of(file_path), position)
+        except ChatDecodeError as e:
+            rejected.add(file_path, e.reason, e.detail)
+    rejected.report(on_warning)
+    return chats
+
+
+def _extract_transcripts(uploaded_zip, chat_filter, on_warning=None):
+    chats = _scan_chats(uploaded_zip, chat_filter, on_warning)
+    
+    # Each unique chat appears once per agent, in the order it was first found
+    results = {name: ([], []) for name in chat_filter.targets}
+    for chat in chats.values():
+        for owner in chat.owners:
+            transcripts, chat_metadata = results[owner]
+            transcripts.append(chat.transcript)
+            chat_metadata.append(dict(chat.metadata))
+    return results
+
+
+# --- RECURSIVE ZIP PROCESSING ---
+@instrumented("extraction", summarize=_summarize_extraction)
+def get_agent_transcripts(uploaded_zip, target_name, on_warning=None, since=None, until=None, known_agents=None,
+                          skip_chats=None):
+    """Extract transcripts for a specific agent from ZIP file (supports nested ZIPs).
+    
+    since/until (date, datetime or ISO string; until exclusive) keep only chats started
+    in that window. known_agents is the roster: nested ZIPs named after another known
+    agent (e.g. Timothy_chats.zip) are skipped without being opened. Chats that occur
+    more than once (transfers, overlapping exports) are returned once; chats whose
+    (chat key, content fingerprint) is in skip_chats (already audited) are left out.
+    """
+    chat_filter = ChatFilter([target_name], since, until, known_agents,
+                             {target_name: skip_chats} if skip_chats else None)
+    return _extract_transcripts(uploaded_zip, chat_filter, on_warning)[target_name]
+
+
+def _summarize_agents_extraction(results, uploaded_zip, *args, **kwargs):
+    return {
+        "input_bytes": file_size(uploaded_zip),
+        "chats": sum(len(transcripts) for transcripts, _ in results.values()),
+        "transcript_bytes": sum(len(t) for transcripts, _ in results.values() for t in transcripts),
+    }
+
+
+@instrumented("multi_agent_extraction", summarize=_summarize_agents_extraction)
+def get_transcripts_for_agents(uploaded_zip, agent_names, on_warning=None, since=None, until=None,
+                               known_agents=None, skip_seen=None):
+    """Extract several agents' transcripts in one pass; returns {agent: (transcripts, chat_metadata)}.
+    
+    skip_seen maps agent -> (chat key, fingerprint) pairs already audited for them.
+    """
+    chat_filter = ChatFilter(agent_names, since, until, known_agents, skip_seen)
+    return _extract_transcripts(uploaded_zip, chat_filter, on_warning)
+
+
+class ExtractedExport:
+    """Every agent's chats from one pass over an export, filtered per agent on demand.
+    
+    select() gives the same (transcripts, chat_metadata) as get_agent_transcripts
+    with the same period, roster and skip options, without reading the ZIP again.
+    One difference: when an overlapping export has grown copies of a chat, the
+    most complete copy anywhere in the export is used, even if it sits in a
+    nested ZIP the roster would skip.
+    """
+    
+    def __init__(self, chats, agents):
+        self.chats = list(chats.values())
+        # Agent names in the export (as get_all_agents_from_zip would report them)
+        self.agents = sorted(agents)
+        self._by_agent = {}
+        for chat in self.chats:
+            for owner in chat.owners:
+                self._by_agent.setdefault(owner, []).append(chat)
+    
+    def covers(self, agent_name):
+        """Whether select() can answer for this name (only agent senders are indexed)"""
+        return sender_role(agent_name) == "agent"
+    
+    
+    def select(self, agent_name, since=None, until=None, known_agents=None, skip_chats=None):
+        chat_filter = ChatFilter([agent_name], since, until, known_agents)
+        found = []
+        for chat in self._by_agent.get(agent_name, ()):
+            # Where a targeted scan would first meet the chat, skipping nested ZIPs named after other agents
+            positions = [position for archive, position in chat.archives.items()
+                         if archive == "" or not chat_filter.skip_archive(archive)]
+            if positions:
+                found.append((min(positions), chat))
+        transcripts, chat_metadata = [], []
+        for _, chat in sorted(found, key=lambda item: item[0]):
+            if chat_filter.outside_window(chat.metadata["started_at"]):
+                continue
+            if skip_chats and (chat_key(chat.metadata["chat_id"], chat.transcript),
+                               chat.metadata["fingerprint"]) in skip_chats:
+                continue
+            transcripts.append(chat.transcript)
+            chat_metadata.append(dict(chat.metadata))
+        return transcripts, chat_metadata
+
+
+def _summarize_export_extraction(extracted, uploaded_zip, *args, **kwargs):
+    return {"input_bytes": file_size(uploaded_zip), "agents": len(extracted.agents), "chats": len(extracted.chats)}
+
+
+@instrumented("export_extraction", summarize=_summarize_export_extraction)
+def extract_all_agents(uploaded_zip, on_warning=None, should_stop=None):
+    """Extract every agent's chats in one pass (no period or roster filters); returns an ExtractedExport.
+    
+    should_stop() is checked before each chat file; when it returns True the
+    scan raises ExtractionCancelled.
+    """
+    chat_filter = ChatFilter(None)
+    chats = _scan_chats(uploaded_zip, chat_filter, on_warning, should_stop)
+    return ExtractedExport(chats, chat_filter.seen_agents)
+
+
+def _summarize_detection(names, uploaded_zip, *args, **kwargs):
+    return {"input_bytes": file_size(uploaded_zip)}
+
+
+@instrumented("agent_detection", summarize=_summarize_detection)
+def get_all_agents_from_zip(uploaded_zip, on_warning=None):
+    """Auto-detect all agent names from a ZIP file (including nested ZIPs)"""
+    agent_names = set()
+    rejected = RejectedFiles("agent_detection")
+    
+    for file_path, raw in _iter_chat_files(uploaded_zip, rejected):
+        try:
+            chat = decode_chat(raw)
+        except ChatDecodeError as e:
+            rejected.add(file_path, e.reason, e.detail)
+            continue
+        for message in chat.messages:
+            if sender_role(message.sender.n) == "agent":
+                agent_names.add(message.sender.n)
+    
+    rejected.report(on_warning)
+    return sorted(agent_names)
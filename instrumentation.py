@@ -0,0 +1,215 @@
+"""Per-stage timing, size and token metrics for the audit pipeline.
+
+Metrics are process-wide (shared by every Streamlit session, CLI run or API
+worker in the process) and can be read three ways:
+    - render_prometheus(): Prometheus text exposition format, also served by
+      start_metrics_server(port) at /metrics
+    - a JSONL event log, one line per stage execution, when configure(jsonl_path=...)
+      or the AUDIT_METRICS_LOG environment variable is set
+    - snapshot(): rows for the in-app diagnostics panel
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram buckets for stage durations, from ZIP member parsing up to slow model calls
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms keyed by metric name and labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self.jsonl_path = os.environ.get("AUDIT_METRICS_LOG")
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = {"count": 0, "sum": 0.0, "min": value, "max": value, "buckets": [0] * len(SECONDS_BUCKETS)}
+                self._histograms[key] = hist
+            hist["count"] += 1
+            hist["sum"] += value
+            hist["min"] = min(hist["min"], value)
+            hist["max"] = max(hist["max"], value)
+            if name.endswith("_seconds"):
+                # Cumulative, as Prometheus expects: each bucket counts every value <= its bound
+                for i, bound in enumerate(SECONDS_BUCKETS):
+                    if value <= bound:
+                        hist["buckets"][i] += 1
+
+    def log_event(self, event, **fields):
+        """Append one JSON line to the event log, if one is configured"""
+        if not self.jsonl_path:
+            return
+        line = json.dumps({"ts": datetime.now().isoformat(), "event": event, **fields}, default=str)
+        with self._lock:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """Return counters and histogram summaries as plain dict rows"""
+        with self._lock:
+            rows = []
+            for (name, labels), value in sorted(self._counters.items()):
+                rows.append({"metric": name, **dict(labels), "count": value})
+            for (name, labels), hist in sorted(self._histograms.items()):
+                rows.append({
+                    "metric": name,
+                    **dict(labels),
+                    "count": hist["count"],
+                    "sum": round(hist["sum"], 4),
+                    "mean": round(hist["sum"] / hist["count"], 4) if hist["count"] else 0.0,
+                    "min": round(hist["min"], 4),
+                    "max": round(hist["max"], 4),
+                })
+            return rows
+
+    def render_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+
+        def fmt_labels(labels, extra=None):
+            items = list(labels) + (list(extra.items()) if extra else [])
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape_label_value(v)}"' for k, v in items) + "}"
+
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{fmt_labels(labels)} {value}")
+            for (name, labels), hist in sorted(self._histograms.items()):
+                is_histogram = name.endswith("_seconds")
+                if name not in typed:
+                    lines.append(f"# TYPE {name} {'histogram' if is_histogram else 'summary'}")
+                    typed.add(name)
+                if is_histogram:
+                    for bound, count in zip(SECONDS_BUCKETS, hist["buckets"]):
+                        lines.append(f"{name}_bucket{fmt_labels(labels, {'le': bound})} {count}")
+                    lines.append(f"{name}_bucket{fmt_labels(labels, {'le': '+Inf'})} {hist['count']}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {hist['sum']}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+def configure(jsonl_path=None):
+    """Enable (or change) the JSONL event log"""
+    METRICS.jsonl_path = jsonl_path
+
+
+class Span:
+    """Quantities recorded during one stage execution"""
+
+    def __init__(self, stage_name):
+        self.stage = stage_name
+        self.fields = {}
+
+    def record(self, quantity, value):
+        """Record a size/count for this stage, e.g. record("input_bytes", 1024)"""
+        self.fields[quantity] = self.fields.get(quantity, 0) + value
+        METRICS.observe(f"auditor_{quantity}", value, stage=self.stage)
+
+
+@contextmanager
+def stage(stage_name, **context):
+    """Time a pipeline stage; context fields only go to the JSONL log, not to metric labels"""
+    span = Span(stage_name)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield span
+    except Exception:
+        status = "error"
+        METRICS.inc("auditor_stage_errors_total", stage=stage_name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        METRICS.observe("auditor_stage_seconds", elapsed, stage=stage_name)
+        METRICS.log_event("stage", stage=stage_name, status=status, seconds=round(elapsed, 6),
+                          **context, **span.fields)
+
+
+def instrumented(stage_name, summarize=None):
+    """Decorator form of stage(); summarize(result, *args, **kwargs) returns {quantity: value}"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name) as span:
+                result = func(*args, **kwargs)
+                if summarize:
+                    for quantity, value in summarize(result, *args, **kwargs).items():
+                        span.record(quantity, value)
+                return result
+        return wrapper
+    return decorator
+
+
+def file_size(path_or_buffer):
+    """Size in bytes of a path, an UploadedFile or a seekable buffer (0 if unknown)"""
+    if isinstance(path_or_buffer, (str, os.PathLike)):
+        return os.path.getsize(path_or_buffer) if os.path.exists(path_or_buffer) else 0
+    size = getattr(path_or_buffer, "size", None)
+    if isinstance(size, int):
+        return size
+    if hasattr(path_or_buffer, "getbuffer"):
+        return path_or_buffer.getbuffer().nbytes
+    return 0
+
+
+# --- PROMETHEUS ENDPOINT ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve /metrics from a daemon thread; returns the server"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+    return server
@@ -0,0 +1,247 @@
+"""Local issue-type classifier for every ingested chat (no model calls).
+
+A linear scorer over a term vocabulary. Out of the box its weights are
+keyword rules (ISSUE_KEYWORDS); train() adds TF-IDF class centroids learned
+from past audits, whose technical examples carry the model's issue_type and
+the chat they came from. Scoring is vectorized with numpy, so tens of
+thousands of chats classify in seconds. Labels feed stratified audit
+sampling and per-agent issue-mix statistics in the chat index.
+
+Train from the audit store and chat evidence index:
+    python issue_classifier.py --store sqlite:///audit_store.db --chat-index chat_index.db
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+from collections import Counter
+
+import numpy as np
+
+from extraction import MESSAGE_HEADER
+from instrumentation import instrumented
+
+logger = logging.getLogger("auditor.issue_classifier")
+
+# --- CONFIGURATION ---
+DEFAULT_ISSUE_MODEL_PATH = os.environ.get("ISSUE_MODEL_PATH", "issue_model.npz")
+
+ISSUE_TYPES = ("VPS/Server", "Domain/WHOIS", "DNS", "Email", "SSL", "WordPress", "cPanel", "Billing")
+OTHER_ISSUE = "Other"
+ISSUE_KEYWORDS = {
+    "VPS/Server": "vps server servers root ssh reboot kvm ram cpu vm centos ubuntu almalinux whm",
+    "Domain/WHOIS": "domain domains whois registrar transfer epp renewal renew expired registration redemption",
+    "DNS": "dns nameserver nameservers propagation propagate cname mx txt zone a-record",
+    "Email": "email emails mailbox inbox webmail outlook smtp imap pop3 spam bounce bounced mail",
+    "SSL": "ssl certificate https autossl letsencrypt tls insecure",
+    "WordPress": "wordpress wp plugin plugins theme elementor woocommerce wp-admin",
+    "cPanel": "cpanel softaculous phpmyadmin database databases ftp",
+    "Billing": "invoice invoices payment paid billing refund card debit cancel cancellation price quote",
+}
+
+# Chats whose best score stays below this are labelled OTHER_ISSUE
+MIN_SCORE = 0.05
+# Weight of the keyword rules next to learned centroids in a trained model
+KEYWORD_PRIOR = 0.5
+MAX_VOCABULARY = 20000
+MIN_DOCUMENT_FREQUENCY = 2
+MIN_TRAINING_EXAMPLES = 20
+
+_TOKEN = re.compile(r"[a-z][a-z0-9\-]+")
+
+
+def _tokens(transcript):
+    # Drop "[timestamp] sender: " headers so names and dates do not become features
+    return _TOKEN.findall(MESSAGE_HEADER.sub(" ", transcript).lower())
+
+
+class IssueClassifier:
+    """Scores chats against one weight row per issue type"""
+
+    def __init__(self, vocabulary, idf, weights):
+        self.vocabulary = vocabulary          # term -> column
+        self.idf = idf                        # (terms,)
+        self.weights = weights                # (issue types, terms)
+
+    @classmethod
+    def from_keywords(cls):
+        """Untrained classifier: each keyword votes for its issue type"""
+        vocabulary = {}
+        for words in ISSUE_KEYWORDS.values():
+            for word in words.split():
+                vocabulary.setdefault(word, len(vocabulary))
+        return cls(vocabulary, np.ones(len(vocabulary)), cls._keyword_weights(vocabulary))
+
+    @staticmethod
+    def _keyword_weights(vocabulary):
+        weights = np.zeros((len(ISSUE_TYPES), len(vocabulary)))
+        for row, issue in enumerate(ISSUE_TYPES):
+            for word in ISSUE_KEYWORDS[issue].split():
+                weights[row, vocabulary[word]] = 1.0
+        return weights / np.linalg.norm(weights, axis=1, keepdims=True)
+
+    def _document_terms(self, token_lists):
+        """Sparse (document, term, count) triples for tokens in the vocabulary"""
+        documents, terms = [], []
+        for i, tokens in enumerate(token_lists):
+            columns = [self.vocabulary[token] for token in tokens if token in self.vocabulary]
+            documents.append(np.full(len(columns), i, dtype=np.int64))
+            terms.append(np.asarray(columns, dtype=np.int64))
+        if not documents:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+        keys, counts = np.unique(np.concatenate(documents) * len(self.vocabulary) + np.concatenate(terms),
+                                 return_counts=True)
+        return keys // len(self.vocabulary), keys % len(self.vocabulary), counts
+
+    def _tfidf(self, token_lists):
+        """L2-normalized sublinear TF-IDF values for each (document, term) pair"""
+        documents, terms, counts = self._document_terms(token_lists)
+        values = np.log1p(counts) * self.idf[terms]
+        norms = np.sqrt(np.bincount(documents, values * values, minlength=len(token_lists)))
+        return documents, terms, values / np.where(norms > 0, norms, 1.0)[documents]
+
+    def scores(self, transcripts):
+        """(chats, issue types) similarity matrix"""
+        if not transcripts:
+            return np.zeros((0, len(ISSUE_TYPES)))
+        documents, terms, values = self._tfidf([_tokens(transcript) for transcript in transcripts])
+        return np.stack([np.bincount(documents, values * row[terms], minlength=len(transcripts))
+                         for row in self.weights], axis=1)
+
+    def predict(self, transcripts):
+        """Issue type for each transcript (OTHER_ISSUE when nothing matches)"""
+        scores = self.scores(transcripts)
+        best = scores.argmax(axis=1)
+        return [ISSUE_TYPES[column] if scores[i, column] >= MIN_SCORE else OTHER_ISSUE
+                for i, column in enumerate(best)]
+
+    # --- TRAINING ---
+    @classmethod
+    def train(cls, transcripts, labels):
+        """Learn TF-IDF centroids from labelled chats, keeping the keyword rules as a prior"""
+        token_lists = [_tokens(transcript) for transcript in transcripts]
+        document_frequency = Counter(token for tokens in token_lists for token in set(tokens))
+        common = [term for term, df in document_frequency.most_common(MAX_VOCABULARY) if df >= MIN_DOCUMENT_FREQUENCY]
+        vocabulary = {term: column for column, term in enumerate(common)}
+        for words in ISSUE_KEYWORDS.values():
+            for word in words.split():
+                vocabulary.setdefault(word, len(vocabulary))
+
+        df = np.array([document_frequency.get(term, 0) for term in vocabulary], dtype=float)
+        idf = np.log((1 + len(transcripts)) / (1 + df)) + 1
+        model = cls(vocabulary, idf, np.zeros((len(ISSUE_TYPES), len(vocabulary))))
+
+        documents, terms, values = model._tfidf(token_lists)
+        # Learned centroid per issue type, plus the keyword rules so rare types are still recognized
+        classes = np.array([ISSUE_TYPES.index(label) if label in ISSUE_TYPES else -1 for label in labels])
+        labelled = classes[documents] >= 0
+        centroids = np.zeros_like(model.weights)
+        np.add.at(centroids, (classes[documents][labelled], terms[labelled]), values[labelled])
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        model.weights = centroids / np.where(norms > 0, norms, 1.0) + KEYWORD_PRIOR * cls._keyword_weights(vocabulary)
+        return model
+
+    def save(self, path=DEFAULT_ISSUE_MODEL_PATH):
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(path, "wb") as f:
+            np.savez_compressed(f, terms=np.array(terms), idf=self.idf, weights=self.weights,
+                                issue_types=np.array(ISSUE_TYPES))
+
+    @classmethod
+    def load(cls, path=DEFAULT_ISSUE_MODEL_PATH):
+        with np.load(path) as data:
+            if tuple(data["issue_types"]) != ISSUE_TYPES:
+                raise ValueError(f"{path} was trained for different issue types")
+            vocabulary = {str(term): column for column, term in enumerate(data["terms"])}
+            return cls(vocabulary, data["idf"], data["weights"])
+
+
+_DEFAULT_CLASSIFIER = None
+_KEYWORD_CLASSIFIER = IssueClassifier.from_keywords()
+
+
+def default_classifier():
+    """The trained model at ISSUE_MODEL_PATH if there is one, otherwise the keyword rules"""
+    global _DEFAULT_CLASSIFIER
+    if _DEFAULT_CLASSIFIER is None:
+        if os.path.exists(DEFAULT_ISSUE_MODEL_PATH):
+            try:
+                _DEFAULT_CLASSIFIER = IssueClassifier.load(DEFAULT_ISSUE_MODEL_PATH)
+            except (OSError, ValueError, KeyError):
+                logger.exception("Could not load %s; using keyword rules", DEFAULT_ISSUE_MODEL_PATH)
+        if _DEFAULT_CLASSIFIER is None:
+            _DEFAULT_CLASSIFIER = IssueClassifier.from_keywords()
+    return _DEFAULT_CLASSIFIER
+
+
+def _summarize_classification(labels, *args, **kwargs):
+    return {"chats": len(labels)}
+
+
+@instrumented("issue_classification", summarize=_summarize_classification)
+def classify_issues(transcripts, classifier=None):
+    """Issue type for each transcript"""
+    return (classifier or default_classifier()).predict(transcripts)
+
+
+def normalize_issue_type(label):
+    """Map a model-written issue_type ("Domain transfer", "VPS/Server") onto ISSUE_TYPES"""
+    if label in ISSUE_TYPES:
+        return label
+    return _KEYWORD_CLASSIFIER.predict([str(label or "")])[0]
+
+
+def training_examples(store, chat_index, audits_per_agent=50):
+    """(transcripts, labels) from audit examples that cite a chat stored in the index"""
+    labelled = {}
+    for agent in store.list_agents():
+        for audit in store.get_audit_history(agent["name"], limit=audits_per_agent):
+            for example in audit["audit_data"].get("technical_examples", []):
+                chat_id = example.get("chat_id")
+                label = normalize_issue_type(example.get("issue_type"))
+                if chat_id and label != OTHER_ISSUE:
+                    labelled.setdefault(chat_id, label)
+
+    transcripts, labels = [], []
+    for chat_id, label in labelled.items():
+        chat = chat_index.get_chat(chat_id)
+        if chat is not None:
+            transcripts.append(chat["transcript"])
+            labels.append(label)
+    return transcripts, labels
+
+
+def main(argv=None):
+    from audit_store import DEFAULT_STORE_URL, open_audit_store
+    from chat_index import DEFAULT_CHAT_INDEX_PATH, ChatIndex
+
+    parser = argparse.ArgumentParser(description="Train the local issue-type classifier from past audits")
+    parser.add_argument("--store", default=DEFAULT_STORE_URL, help="Audit store URL, e.g. sqlite:///audit_store.db")
+    parser.add_argument("--chat-index", default=DEFAULT_CHAT_INDEX_PATH, help="Chat evidence index path")
+    parser.add_argument("--output", default=DEFAULT_ISSUE_MODEL_PATH, help="Where to write the model")
+    parser.add_argument("--no-reclassify", action="store_true",
+                        help="Do not relabel the chats already in the index with the new model")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    chat_index = ChatIndex(args.chat_index)
+    transcripts, labels = training_examples(open_audit_store(args.store), chat_index)
+    if len(transcripts) < MIN_TRAINING_EXAMPLES:
+        logger.error("Only %d labelled chats found (need %d); keeping the keyword rules",
+                     len(transcripts), MIN_TRAINING_EXAMPLES)
+        return 1
+
+    model = IssueClassifier.train(transcripts, labels)
+    agreement = np.mean(np.array(model.predict(transcripts)) == np.array(labels))
+    model.save(args.output)
+    logger.info("Trained on %d chats (%s); %.0f%% agree with the audit labels; saved to %s", len(transcripts),
+                ", ".join(f"{issue} {count}" for issue, count in Counter(labels).most_common()), agreement * 100,
+                args.output)
+    if not args.no_reclassify:
+        logger.info("Relabelled %d indexed chats", chat_index.reclassify_issues(model))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
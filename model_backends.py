@@ -0,0 +1,222 @@
+"""Model backends behind run_comprehensive_audit.
+
+A backend is anything with ``generate_content(prompt)`` returning an object
+with a ``.text`` attribute - the interface of ``genai.GenerativeModel``. The
+fake backend produces schema-valid audit JSON locally and can inject
+latency, 429s, truncated output and malformed JSON, so bulk behaviour can be
+load-tested deterministically without network access.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+
+try:
+    from google.api_core.exceptions import ResourceExhausted as RateLimitError
+except ImportError:  # google-api-core ships with google-generativeai, but keep the fake usable without it
+    class RateLimitError(Exception):
+        code = 429
+
+# Using gemini-2.5-flash-lite for better free tier availability
+DEFAULT_GEMINI_MODEL = "gemini-2.5-flash-lite"
+# Generation stops at this many output tokens, so budgets can reserve a bound per call
+MAX_OUTPUT_TOKENS = int(os.environ.get("FULL_AUDIT_OUTPUT_TOKENS", "16000"))
+
+METRIC_KEYS = (
+    "security_pin_protocol",
+    "technical_capability",
+    "communication_professionalism",
+    "investigative_approach",
+    "chat_ownership_resolution",
+)
+ISSUE_TYPES = ["VPS/Server", "Domain/WHOIS", "DNS", "Email", "SSL", "WordPress", "cPanel", "Billing"]
+SEVERITIES = ["Minor", "Moderate", "Major", "Critical"]
+FILLER_WORDS = "hosting domain email server cpanel dns record mailbox certificate plugin backup".split()
+
+
+class UsageMetadata:
+    """Token counts with the same attribute names as genai's usage_metadata"""
+
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class ModelResponse:
+    """Minimal stand-in for a genai response"""
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class ModelBackend(ABC):
+    """Interface shared by the live Gemini model and local fakes"""
+
+    name = "backend"
+
+    @abstractmethod
+    def generate_content(self, prompt):
+        """Return a response object with a .text attribute"""
+
+
+# --- LIVE GEMINI ---
+class GeminiBackend(ModelBackend):
+    """Thin wrapper around genai.GenerativeModel"""
+
+    name = "gemini"
+
+    def __init__(self, api_key, model_name=DEFAULT_GEMINI_MODEL, max_output_tokens=MAX_OUTPUT_TOKENS):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name, generation_config={"max_output_tokens": max_output_tokens})
+
+    def generate_content(self, prompt):
+        return self.model.generate_content(prompt)
+
+
+# --- LOCAL FAKE ---
+def make_fake_audit(agent_name="Agent", num_examples=20, text_size=400, rng=None, chat_ids=None):
+    """Build an audit result that matches the schema requested by build_audit_prompt"""
+    rng = rng or random.Random(0)
+
+    def text(size=text_size):
+        return " ".join(rng.choice(FILLER_WORDS) for _ in range(max(1, size // 7)))
+
+    metrics = {key: round(rng.uniform(2.5, 5.0), 1) for key in METRIC_KEYS}
+    return {
+        "overall_score": round(rng.uniform(5.0, 10.0), 1),
+        "overall_assessment": f"{agent_name}: {text(text_size * 3)}",
+        "metrics": metrics,
+        "key_strengths": [text() for _ in range(5)],
+        "key_development_areas": [text() for _ in range(5)],
+        "pin_protocol_feedback": text(text_size * 2),
+        "technical_examples": [{
+            "example_number": i,
+            "chat_id": rng.choice(chat_ids) if chat_ids else None,
+            "client_name": f"Client {i}",
+            "pin_number": str(rng.randint(1000, 9999)),
+            "issue_type": rng.choice(ISSUE_TYPES),
+            "customer_issue": text(),
+            "agent_action": text(),
+            "pin_handled_well": rng.choice(["Yes", "No", "Redundant", "N/A"]),
+            "outcome": text(),
+            "assessment": text(),
+            "improvement": text(),
+            "severity": rng.choice(SEVERITIES),
+        } for i in range(1, num_examples + 1)],
+        "performance_trends": {key: text() for key in (
+            "response_time_assessment", "consistency", "technical_depth", "customer_satisfaction_indicators")},
+        "recommended_training": [text() for _ in range(3)],
+        "standout_moments": [text() for _ in range(2)],
+        "critical_incidents": [text() for _ in range(rng.randint(0, 2))],
+    }
+
+
+class FakeGeminiBackend(ModelBackend):
+    """Deterministic offline backend with injectable latency and failure modes.
+
+    latency is one of:
+        ("fixed", seconds)
+        ("uniform", low, high)
+        ("lognormal", median_seconds, sigma)
+    The *_rate arguments are per-call probabilities (0.0 - 1.0) of returning
+    a 429, cutting the JSON short, or returning text that is not JSON at all.
+    """
+
+    name = "fake"
+
+    def __init__(self, seed=0, latency=("fixed", 0.0), rate_limit_rate=0.0, truncate_rate=0.0,
+                 malformed_rate=0.0, num_examples=20, text_size=400, fenced=True, max_output_tokens=MAX_OUTPUT_TOKENS):
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.truncate_rate = truncate_rate
+        self.malformed_rate = malformed_rate
+        self.num_examples = num_examples
+        self.text_size = text_size
+        self.fenced = fenced
+        self.max_output_tokens = max_output_tokens
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "rate_limited": 0, "truncated": 0, "malformed": 0, "ok": 0,
+                      "prompt_chars": 0, "latency_seconds": 0.0}
+
+    def _sample_latency(self):
+        kind, *params = self.latency
+        if kind == "fixed":
+            return params[0]
+        if kind == "uniform":
+            return self._rng.uniform(params[0], params[1])
+        if kind == "lognormal":
+            median, sigma = params
+            return median * self._rng.lognormvariate(0.0, sigma)
+        raise ValueError(f"Unknown latency distribution: {kind}")
+
+    def generate_content(self, prompt):
+        # Draw every random decision under the lock so results only depend on call order
+        with self._lock:
+            delay = self._sample_latency()
+            outcome_roll = self._rng.random()
+            audit_seed = self._rng.getrandbits(32)
+            self.stats["calls"] += 1
+            self.stats["prompt_chars"] += len(prompt)
+            self.stats["latency_seconds"] += delay
+
+        if delay > 0:
+            time.sleep(delay)
+
+        if outcome_roll < self.rate_limit_rate:
+            self._count("rate_limited")
+            raise RateLimitError("Resource has been exhausted (e.g. check quota).")
+        outcome_roll -= self.rate_limit_rate
+
+        match = re.search(r"performance review of agent: (.+)", prompt)
+        agent_name = match.group(1).strip() if match else "Agent"
+        chat_ids = re.findall(r"^CHAT ID: (.+)$", prompt, re.MULTILINE)
+        if "QUICK TRIAGE" in prompt:
+            # Triage prompts ask for scores and a short summary only
+            audit = make_fake_audit(agent_name, 0, self.text_size // 4, random.Random(audit_seed), chat_ids)
+        else:
+            audit = make_fake_audit(agent_name, self.num_examples, self.text_size, random.Random(audit_seed),
+                                    chat_ids)
+        text = json.dumps(audit, indent=2)
+
+        if outcome_roll < self.truncate_rate:
+            self._count("truncated")
+            text = text[:len(text) // 2]
+        elif outcome_roll - self.truncate_rate < self.malformed_rate:
+            self._count("malformed")
+            text = "I'm sorry, here is the audit: {overall_score: 7.5, metrics: [unterminated"
+        else:
+            self._count("ok")
+
+        if self.fenced:
+            text = f"```json\n{text}\n```"
+        # Like the live model, stop at the output cap
+        text = text[:self.max_output_tokens * 4]
+        # Roughly 4 characters per token, like the Gemini tokenizer on English text
+        return ModelResponse(text, UsageMetadata(len(prompt) // 4, len(text) // 4))
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+
+# --- BACKEND REGISTRY ---
+MODEL_BACKENDS = {
+    "gemini": GeminiBackend,
+    "fake": FakeGeminiBackend,
+}
+
+
+def create_backend(name="gemini", **options):
+    """Instantiate a registered backend by name"""
+    if name not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown model backend: {name}")
+    return MODEL_BACKENDS[name](**options)
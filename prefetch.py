@@ -0,0 +1,128 @@
+"""Speculative extraction of an uploaded export while the user sets up the audit.
+
+Parsing a large export takes longer than picking an agent and a period, so
+as soon as a ZIP is uploaded a background thread reads every chat once and
+indexes it by agent (extraction.extract_all_agents). When the user clicks
+Run, the agent's chats are filtered out of that result (period, roster,
+new-chats-only) instead of reading the ZIP again; detecting agents is
+instant as well. Both tabs share one prefetch per upload.
+
+Each uploader has a slot holding at most one prefetch. Replacing or removing
+the upload cancels the old job (checked between chat files) and drops its
+result, so memory is only held for exports still on screen. Anything that
+is not ready, failed or was cancelled falls back to the normal extraction.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from extraction import ExtractionCancelled, extract_all_agents
+from instrumentation import METRICS
+
+logger = logging.getLogger("auditor.prefetch")
+
+# --- CONFIGURATION ---
+# Background extractions running at once (shared by every session of the app)
+PREFETCH_WORKERS = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        return _executor
+
+
+def upload_identity(uploaded_file):
+    """Key of an upload: the same file uploaded in both tabs shares one prefetch"""
+    return (uploaded_file.name, uploaded_file.size)
+
+
+class ExportPrefetch:
+    """One background extraction of every agent in an uploaded export"""
+
+    def __init__(self, uploaded_file):
+        self.key = upload_identity(uploaded_file)
+        self.name = uploaded_file.name
+        # Own copy of the bytes: the UploadedFile is read (and seeked) by the script thread too
+        self._data = uploaded_file.getvalue()
+        self._cancelled = threading.Event()
+        self.warnings = []
+        self.future = _get_executor().submit(self._run)
+
+    def _run(self):
+        try:
+            extracted = extract_all_agents(io.BytesIO(self._data), on_warning=self.warnings.append,
+                                           should_stop=self._cancelled.is_set)
+        except ExtractionCancelled:
+            METRICS.inc("auditor_prefetch_total", outcome="cancelled")
+            raise
+        except Exception:
+            logger.exception("Speculative extraction of %s failed", self.name)
+            METRICS.inc("auditor_prefetch_total", outcome="failed")
+            raise
+        finally:
+            self._data = None
+        METRICS.inc("auditor_prefetch_total", outcome="done")
+        logger.info("Prefetched %s: %d agent(s), %d chat(s)", self.name, len(extracted.agents),
+                    len(extracted.chats))
+        return extracted
+
+    def cancel(self):
+        self._cancelled.set()
+        self.future.cancel()
+
+    @property
+    def status(self):
+        """"running", "ready", "cancelled" or "failed" """
+        if self._cancelled.is_set():
+            return "cancelled"
+        if not self.future.done():
+            return "running"
+        return "failed" if self.future.exception() is not None else "ready"
+
+    def result(self, wait=True):
+        """The ExtractedExport, or None if it failed, was cancelled or (wait=False) is still running"""
+        if self._cancelled.is_set() or (not wait and not self.future.done()):
+            return None
+        try:
+            return self.future.result()
+        except (CancelledError, Exception):
+            return None
+
+
+class PrefetchRegistry:
+    """Prefetches of the uploads currently on screen, one slot per uploader (kept in session state)"""
+
+    def __init__(self):
+        self._slots = {}
+
+    def _shared(self, key):
+        return next((prefetch for prefetch in self._slots.values() if prefetch.key == key), None)
+
+    def track(self, slot, uploaded_file):
+        """Prefetch for the file now in an uploader, starting one for a new upload; None clears the slot"""
+        current = self._slots.get(slot)
+        if uploaded_file is None:
+            self._release(slot)
+            return None
+        key = upload_identity(uploaded_file)
+        if current is not None and current.key == key and current.status != "cancelled":
+            return current
+        self._release(slot)
+        prefetch = self._shared(key)
+        if prefetch is None or prefetch.status in ("cancelled", "failed"):
+            prefetch = ExportPrefetch(uploaded_file)
+        self._slots[slot] = prefetch
+        return prefetch
+
+    def _release(self, slot):
+        prefetch = self._slots.pop(slot, None)
+        # Still in use by the other uploader: keep it running
+        if prefetch is not None and prefetch not in self._slots.values():
+            prefetch.cancel()
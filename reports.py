@@ -0,0 +1,906 @@
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape as xml_escape
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Table, TableStyle, Flowable
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
+from openpyxl.cell import WriteOnlyCell, MergedCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import get_column_letter, range_boundaries
+from instrumentation import file_size, instrumented, stage
+
+
+def _summarize_report(result, agent_data, agent_name, output_path):
+    return {"output_bytes": file_size(output_path)}
+
+# --- PDF LAYOUT (built once, shared by every report) ---
+PDF_SAMPLE_STYLES = getSampleStyleSheet()
+
+PDF_TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=PDF_SAMPLE_STYLES['Title'],
+    fontSize=24,
+    textColor=colors.HexColor('#1f77b4'),
+    spaceAfter=30,
+    alignment=TA_CENTER
+)
+
+PDF_HEADING1_STYLE = ParagraphStyle(
+    'CustomHeading1',
+    parent=PDF_SAMPLE_STYLES['Heading1'],
+    fontSize=16,
+    textColor=colors.HexColor('#1f77b4'),
+    spaceAfter=12,
+    spaceBefore=12
+)
+
+PDF_HEADING2_STYLE = ParagraphStyle(
+    'CustomHeading2',
+    parent=PDF_SAMPLE_STYLES['Heading2'],
+    fontSize=14,
+    textColor=colors.HexColor('#333333'),
+    spaceAfter=10,
+    spaceBefore=10
+)
+
+PDF_BODY_STYLE = ParagraphStyle(
+    'CustomBody',
+    parent=PDF_SAMPLE_STYLES['BodyText'],
+    fontSize=11,
+    alignment=TA_JUSTIFY,
+    spaceAfter=10
+)
+
+PDF_SCORE_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 24),
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#e8f4f8')),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#1f77b4')),
+    ('PADDING', (0, 0), (-1, -1), 20),
+    ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#1f77b4'))
+])
+
+PDF_HEADER_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f77b4')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f0f0f0')])
+])
+
+PDF_EXAMPLE_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0f0f0')),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('PADDING', (0, 0), (-1, -1), 8)
+])
+
+
+def _pdf_document(output_path):
+    return SimpleDocTemplate(
+        output_path,
+        pagesize=letter,
+        rightMargin=0.75*inch,
+        leftMargin=0.75*inch,
+        topMargin=1*inch,
+        bottomMargin=0.75*inch
+    )
+
+
+def _numbered_paragraphs(story, title, items):
+    story.append(Paragraph(title, PDF_HEADING1_STYLE))
+    for i, item in enumerate(items, 1):
+        story.append(Paragraph(f"<b>{i}.</b> {item}", PDF_BODY_STYLE))
+
+
+def _agent_story(agent_data, agent_name, title="PERFORMANCE REVIEW REPORT", title_style=PDF_TITLE_STYLE):
+    """Flowables for one agent's review, shared by single and team PDFs"""
+    audit_data = agent_data.get('audit_data', {})
+    normal_style = PDF_SAMPLE_STYLES['Normal']
+    story = []
+    
+    # Title
+    story.append(Paragraph(title, title_style))
+    story.append(Paragraph(f"<b>Agent:</b> {xml_escape(agent_name)}", normal_style))
+    story.append(Paragraph(f"<b>Review Date:</b> {datetime.now().strftime('%B %d, %Y')}", normal_style))
+    story.append(Paragraph(f"<b>Chats Analyzed:</b> {agent_data.get('total_chats', 0)}", normal_style))
+    story.append(Spacer(1, 0.3*inch))
+    
+    # Overall Score
+    overall_score = audit_data.get('overall_score', 0)
+    story.append(Paragraph("OVERALL PERFORMANCE SCORE", PDF_HEADING1_STYLE))
+    score_table = Table([[f"{overall_score}/10.0"]], colWidths=[2*inch])
+    score_table.setStyle(PDF_SCORE_TABLE_STYLE)
+    story.append(score_table)
+    story.append(Spacer(1, 0.3*inch))
+    
+    # Overall Assessment
+    story.append(Paragraph("OVERALL ASSESSMENT", PDF_HEADING1_STYLE))
+    story.append(Paragraph(audit_data.get('overall_assessment', 'No assessment available'), PDF_BODY_STYLE))
+    story.append(Spacer(1, 0.2*inch))
+    
+    # Metrics
+    story.append(Paragraph("PERFORMANCE METRICS", PDF_HEADING1_STYLE))
+    metrics_data = [['Metric', 'Score (out of 5.0)']]
+    for key, value in audit_data.get('metrics', {}).items():
+        metrics_data.append([key.replace('_', ' ').title(), f"{value}/5.0"])
+    metrics_table = Table(metrics_data, colWidths=[4*inch, 1.5*inch])
+    metrics_table.setStyle(PDF_HEADER_TABLE_STYLE)
+    story.append(metrics_table)
+    story.append(Spacer(1, 0.3*inch))
+    
+    # Page Break
+    story.append(PageBreak())
+    
+    # Strengths
+    _numbered_paragraphs(story, "KEY STRENGTHS", audit_data.get('key_strengths', []))
+    story.append(Spacer(1, 0.2*inch))
+    
+    # Development Areas
+    _numbered_paragraphs(story, "AREAS FOR DEVELOPMENT", audit_data.get('key_development_areas', []))
+    story.append(Spacer(1, 0.2*inch))
+    
+    # PIN Protocol Feedback
+    story.append(Paragraph("SECURITY & PIN PROTOCOL ANALYSIS", PDF_HEADING1_STYLE))
+    story.append(Paragraph(audit_data.get('pin_protocol_feedback', 'No feedback available'), PDF_BODY_STYLE))
+    story.append(Spacer(1, 0.2*inch))
+    
+    # Page Break
+    story.append(PageBreak())
+    
+    # Technical Examples
+    story.append(Paragraph("DETAILED TECHNICAL EXAMPLES", PDF_HEADING1_STYLE))
+    examples = audit_data.get('technical_examples', [])
+    
+    for i, example in enumerate(examples, 1):
+        story.append(Paragraph(f"<b>Example {i}: {example.get('issue_type', 'N/A')}</b>", PDF_HEADING2_STYLE))
+        
+        example_data = [
+            ['Client Name:', example.get('client_name', 'N/A')],
+            ['PIN Number:', example.get('pin_number', 'N/A')],
+            ['Customer Issue:', example.get('customer_issue', 'N/A')],
+            ['Agent Action:', example.get('agent_action', 'N/A')],
+            ['PIN Handled Well:', example.get('pin_handled_well', 'N/A')],
+            ['Outcome:', example.get('outcome', 'N/A')],
+            ['Assessment:', example.get('assessment', 'N/A')],
+            ['Improvement:', example.get('improvement', 'N/A')],
+            ['Severity:', example.get('severity', 'N/A')]
+        ]
+        
+        example_table = Table(example_data, colWidths=[1.5*inch, 5*inch])
+        example_table.setStyle(PDF_EXAMPLE_TABLE_STYLE)
+        
+        story.append(example_table)
+        story.append(Spacer(1, 0.2*inch))
+        
+        # Page break every 4 examples
+        if i % 4 == 0 and i < len(examples):
+            story.append(PageBreak())
+    
+    # Performance Trends (if available)
+    trends = audit_data.get('performance_trends', {})
+    if trends:
+        story.append(PageBreak())
+        story.append(Paragraph("PERFORMANCE TRENDS", PDF_HEADING1_STYLE))
+        for key, value in trends.items():
+            trend_name = key.replace('_', ' ').title()
+            story.append(Paragraph(f"<b>{trend_name}:</b> {value}", PDF_BODY_STYLE))
+        story.append(Spacer(1, 0.2*inch))
+    
+    # Recommended Training
+    training = audit_data.get('recommended_training', [])
+    if training:
+        _numbered_paragraphs(story, "RECOMMENDED TRAINING", training)
+        story.append(Spacer(1, 0.2*inch))
+    
+    # Standout Moments
+    standout = audit_data.get('standout_moments', [])
+    if standout:
+        _numbered_paragraphs(story, "STANDOUT MOMENTS", standout)
+        story.append(Spacer(1, 0.2*inch))
+    
+    # Critical Incidents
+    critical = audit_data.get('critical_incidents', [])
+    if critical:
+        _numbered_paragraphs(story, "CRITICAL INCIDENTS", critical)
+    
+    return story
+
+
+# --- ENHANCED PDF REPORT GENERATION ---
+@instrumented("pdf_report", summarize=_summarize_report)
+def generate_pdf_report(agent_data, agent_name, output_path):
+    """Generate a comprehensive PDF performance review report"""
+    doc = _pdf_document(output_path)
+    doc.build(_agent_story(agent_data, agent_name))
+    return output_path
+
+
+# --- TEAM PDF REPORT (Table of Contents + Bookmark Per Agent) ---
+PDF_PAGE_REF_WIDTH = 0.6*inch
+
+
+class _AgentBookmark(Flowable):
+    """Zero-size marker at the top of an agent section: PDF outline entry plus page-number form"""
+    
+    def __init__(self, key, title):
+        super().__init__()
+        self.key = key
+        self.title = title
+    
+    def wrap(self, available_width, available_height):
+        return 0, 0
+    
+    def draw(self):
+        self.canv.bookmarkPage(self.key)
+        self.canv.addOutlineEntry(self.title, self.key, level=0)
+        # Contents rows reference this form before it exists, so the team PDF builds in one pass
+        self.canv.beginForm(f"{self.key}-page")
+        self.canv.setFont('Helvetica', 10)
+        self.canv.drawRightString(PDF_PAGE_REF_WIDTH, 0, str(self.canv.getPageNumber()))
+        self.canv.endForm()
+
+
+class _PageRef(Flowable):
+    """Draws the page number recorded later by the matching _AgentBookmark"""
+    
+    def __init__(self, key):
+        super().__init__()
+        self.key = key
+    
+    def wrap(self, available_width, available_height):
+        return PDF_PAGE_REF_WIDTH, 10
+    
+    def draw(self):
+        self.canv.doForm(f"{self.key}-page")
+
+
+def _summarize_team_pdf(result, agents, output_path):
+    return {"output_bytes": file_size(output_path)}
+
+
+@instrumented("team_pdf_report", summarize=_summarize_team_pdf)
+def generate_team_pdf_report(agents, output_path):
+    """Generate one PDF with a linked table of contents and every agent's review.
+    
+    agents is a dict {agent_name: agent_data} or an iterable of (agent_name, agent_data)
+    pairs. Sections reuse the module-level layout objects, each agent gets a PDF
+    outline bookmark, and the document is laid out in a single pass.
+    """
+    items = agents.items() if hasattr(agents, 'items') else agents
+    audited = [(name, data) for name, data in items if data and data.get('audit_data')]
+    
+    story = [
+        Paragraph("TEAM PERFORMANCE REVIEW", PDF_TITLE_STYLE),
+        Paragraph(f"<b>Review Date:</b> {datetime.now().strftime('%B %d, %Y')}", PDF_SAMPLE_STYLES['Normal']),
+        Paragraph(f"<b>Agents Reviewed:</b> {len(audited)}", PDF_SAMPLE_STYLES['Normal']),
+        Spacer(1, 0.3*inch),
+        Paragraph("CONTENTS", PDF_HEADING1_STYLE),
+    ]
+    
+    contents_data = [['Agent', 'Overall Score', 'Chats Analyzed', 'Page']]
+    for index, (agent_name, agent_data) in enumerate(audited, 1):
+        contents_data.append([
+            Paragraph(f'<a href="#agent-{index}" color="#1f77b4">{xml_escape(agent_name)}</a>',
+                      PDF_SAMPLE_STYLES['Normal']),
+            f"{agent_data['audit_data'].get('overall_score', 0)}/10.0",
+            agent_data.get('total_chats', 0),
+            _PageRef(f"agent-{index}"),
+        ])
+    contents_table = Table(contents_data, colWidths=[3*inch, 1.3*inch, 1.3*inch, 0.9*inch], repeatRows=1)
+    contents_table.setStyle(PDF_HEADER_TABLE_STYLE)
+    story.append(contents_table)
+    
+    for index, (agent_name, agent_data) in enumerate(audited, 1):
+        story.append(PageBreak())
+        story.append(_AgentBookmark(f"agent-{index}", agent_name))
+        story.extend(_agent_story(agent_data, agent_name, title=xml_escape(agent_name)))
+    
+    doc = _pdf_document(output_path)
+    doc.build(story)
+    return output_path
+
+# --- EXCEL REPORT GENERATION (Consolidated Single-Sheet Version) ---
+@instrumented("excel_report", summarize=_summarize_report)
+def generate_excel_report(agent_data, agent_name, output_path):
+    """Generate a single-sheet Excel performance review report for easy copy-pasting"""
+    
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Performance Review Report"
+    
+    # Define styles
+    header_fill = PatternFill(start_color="1F77B4", end_color="1F77B4", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF", size=12)
+    subheader_font = Font(bold=True, size=11)
+    title_font = Font(bold=True, size=16, color="1F77B4")
+    border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+    center_align = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    left_align = Alignment(horizontal='left', vertical='top', wrap_text=True)
+    
+    current_row = 1
+
+    # --- SECTION 1: HEADER & AGENT INFO ---
+    ws.cell(row=current_row, column=1, value="PERFORMANCE REVIEW REPORT").font = title_font
+    ws.merge_cells(start_row=current_row, start_column=1, end_row=current_row, end_column=4)
+    ws.cell(row=current_row, column=1).alignment = center_align
+    current_row += 2
+    
+    info_items = [
+        ("Agent:", agent_name),
+        ("Review Date:", datetime.now().strftime('%B %d, %Y')),
+        ("Chats Analyzed:", agent_data.get('total_chats', 0))
+    ]
+    
+    for label, value in info_items:
+        ws.cell(row=current_row, column=1, value=label).font = Font(bold=True)
+        ws.cell(row=current_row, column=2, value=value)
+        current_row += 1
+    
+    current_row += 1
+
+    # --- SECTION 2: OVERALL SCORE ---
+    ws.cell(row=current_row, column=1, value="OVERALL PERFORMANCE SCORE").font = subheader_font
+    ws.merge_cells(start_row=current_row, start_column=1, end_row=current_row, end_column=4)
+    current_row += 1
+    
+    overall_score = agent_data.get('audit_data', {}).get('overall_score', 0)
+    score_cell = ws.cell(row=current_row, column=1, value=f"{overall_score}/10.0")
+    score_cell.font = Font(bold=True, size=24, color="1F77B4")
+    ws.merge_cells(start_row=current_row, start_column=1, end_row=current_row+1, end_column=4)
+    score_cell.alignment = center_align
+    current_row += 3
+
+    # --- SECTION 3: PERFORMANCE METRICS ---
+    metrics = agent_data.get('audit_data', {}).get('metrics', {})
+    if metrics:
+        ws.cell(row=current_row, column=1, value="PERFORMANCE METRICS").font = subheader_font
+        current_row += 1
+        
+        headers = ["Metric", "Score (out of 5.0)"]
+        for c_idx, h in enumerate(headers, 1):
+            cell = ws.cell(row=current_row, column=c_idx, value=h)
+            cell.fill, cell.font, cell.border, cell.alignment = header_fill, header_font, border, center_align
+        
+        current_row += 1
+        for key, value in metrics.items():
+            ws.cell(row=current_row, column=1, value=key.replace('_', ' ').title()).border = border
+            score_cell = ws.cell(row=current_row, column=2, value=f"{value}/5.0")
+            score_cell.border, score_cell.alignment = border, center_align
+            current_row += 1
+        current_row += 1
+
+    # --- SECTION 4: TECHNICAL EXAMPLES ---
+    examples = agent_data.get('audit_data', {}).get('technical_examples', [])
+    if examples:
+        ws.cell(row=current_row, column=1, value="TECHNICAL EXAMPLES").font = subheader_font
+        current_row += 1
+        
+        headers = ['#', 'Client', 'PIN', 'Issue Type', 'Customer Issue', 'Agent Action', 'Outcome', 'Assessment', 'Severity']
+        for c_idx, h in enumerate(headers, 1):
+            cell = ws.cell(row=current_row, column=c_idx, value=h)
+            cell.fill, cell.font, cell.border, cell.alignment = header_fill, header_font, border, center_align
+        
+        current_row += 1
+        for idx, ex in enumerate(examples, 1):
+            data = [
+                ex.get('example_number', idx), ex.get('client_name', 'N/A'), ex.get('pin_number', 'N/A'),
+                ex.get('issue_type', 'N/A'), ex.get('customer_issue', 'N/A'), ex.get('agent_action', 'N/A'),
+                ex.get('outcome', 'N/A'), ex.get('assessment', 'N/A'), ex.get('severity', 'N/A')
+            ]
+            for c_idx, value in enumerate(data, 1):
+                cell = ws.cell(row=current_row, column=c_idx, value=value)
+                cell.border, cell.alignment = border, left_align
+                # Severity Coloring
+                if c_idx == 9: 
+                    sev_colors = {'Critical': "F8D7DA", 'Major': "FFF3CD", 'Moderate': "D1ECF1", 'Minor': "D4EDDA"}
+                    if value in sev_colors:
+                        cell.fill = PatternFill(start_color=sev_colors[value], end_color=sev_colors[value], fill_type="solid")
+            current_row += 1
+        current_row += 1
+
+    # --- SECTION 5: STRENGTHS & DEVELOPMENT ---
+    for title, key in [("KEY STRENGTHS", "key_strengths"), ("AREAS FOR DEVELOPMENT", "key_development_areas")]:
+        ws.cell(row=current_row, column=1, value=title).font = title_font
+        current_row += 1
+        items = agent_data.get('audit_data', {}).get(key, [])
+        for i, item in enumerate(items, 1):
+            ws.cell(row=current_row, column=1, value=f"{i}.")
+            content_cell = ws.cell(row=current_row, column=2, value=item)
+            content_cell.alignment, content_cell.border = left_align, border
+            ws.merge_cells(start_row=current_row, start_column=2, end_row=current_row, end_column=4)
+            current_row += 1
+        current_row += 1
+
+    # --- SECTION 6: SECURITY & PIN PROTOCOL ---
+    ws.cell(row=current_row, column=1, value="SECURITY & PIN PROTOCOL ANALYSIS").font = title_font
+    current_row += 1
+    pin_feedback = agent_data.get('audit_data', {}).get('pin_protocol_feedback', 'No feedback available')
+    ws.cell(row=current_row, column=1, value=pin_feedback).alignment = left_align
+    ws.merge_cells(start_row=current_row, start_column=1, end_row=current_row+1, end_column=4)
+    current_row += 3
+
+    # --- SECTION 7: OVERALL ASSESSMENT ---
+    ws.cell(row=current_row, column=1, value="OVERALL ASSESSMENT").font = title_font
+    current_row += 1
+    assessment = agent_data.get('audit_data', {}).get('overall_assessment', 'No assessment available')
+    ws.cell(row=current_row, column=1, value=assessment).alignment = left_align
+    ws.merge_cells(start_row=current_row, start_column=1, end_row=current_row+4, end_column=4)
+    current_row += 6
+
+    # --- SECTION 8: CRITICAL INCIDENTS (Conditional) ---
+    critical = agent_data.get('audit_data', {}).get('critical_incidents', [])
+    if critical:
+        ws.cell(row=current_row, column=1, value="CRITICAL INCIDENTS").font = Font(bold=True, size=16, color="DC3545")
+        current_row += 1
+        for i, incident in enumerate(critical, 1):
+            ws.cell(row=current_row, column=1, value=f"{i}.")
+            cell = ws.cell(row=current_row, column=2, value=incident)
+            cell.alignment, cell.border = left_align, border
+            cell.fill = PatternFill(start_color="F8D7DA", end_color="F8D7DA", fill_type="solid")
+            ws.merge_cells(start_row=current_row, start_column=2, end_row=current_row, end_column=4)
+            current_row += 1
+
+    # Final adjustments
+    ws.column_dimensions['A'].width = 15
+    ws.column_dimensions['B'].width = 30
+    ws.column_dimensions['C'].width = 30
+    ws.column_dimensions['D'].width = 30
+    ws.column_dimensions['E'].width = 40
+    ws.column_dimensions['F'].width = 40
+    ws.column_dimensions['G'].width = 35
+    ws.column_dimensions['H'].width = 35
+    ws.column_dimensions['I'].width = 15
+    
+    wb.save(output_path)
+    return output_path
+
+# --- TEAM EXCEL WORKBOOK (Streaming, One Sheet Per Agent) ---
+# Style objects are built once per process and shared by every cell that uses them
+TEAM_HEADER_FILL = PatternFill(start_color="1F77B4", end_color="1F77B4", fill_type="solid")
+TEAM_HEADER_FONT = Font(bold=True, color="FFFFFF", size=12)
+TEAM_TITLE_FONT = Font(bold=True, size=16, color="1F77B4")
+TEAM_SECTION_FONT = Font(bold=True, size=12, color="1F77B4")
+TEAM_LABEL_FONT = Font(bold=True)
+TEAM_CRITICAL_FONT = Font(bold=True, size=12, color="DC3545")
+TEAM_BORDER = Border(
+    left=Side(style='thin'),
+    right=Side(style='thin'),
+    top=Side(style='thin'),
+    bottom=Side(style='thin')
+)
+TEAM_CENTER_ALIGN = Alignment(horizontal='center', vertical='center', wrap_text=True)
+TEAM_LEFT_ALIGN = Alignment(horizontal='left', vertical='top', wrap_text=True)
+TEAM_SEVERITY_FILLS = {
+    severity: PatternFill(start_color=color, end_color=color, fill_type="solid")
+    for severity, color in {'Critical': "F8D7DA", 'Major': "FFF3CD", 'Moderate': "D1ECF1", 'Minor': "D4EDDA"}.items()
+}
+
+TEAM_METRIC_KEYS = [
+    'security_pin_protocol',
+    'technical_capability',
+    'communication_professionalism',
+    'investigative_approach',
+    'chat_ownership_resolution'
+]
+TEAM_SUMMARY_HEADERS = (
+    ["Agent", "Overall Score (out of 10.0)"]
+    + [key.replace('_', ' ').title() for key in TEAM_METRIC_KEYS]
+    + ["Chats Analyzed", "Examples", "Critical Examples", "Major Examples", "Critical Incidents", "Audit Date"]
+)
+TEAM_EXAMPLE_HEADERS = ['#', 'Client', 'PIN', 'Issue Type', 'Customer Issue', 'Agent Action', 'Outcome', 'Assessment',
+                        'Severity']
+TEAM_AGENT_COLUMN_WIDTHS = {'A': 15, 'B': 30, 'C': 30, 'D': 30, 'E': 40, 'F': 40, 'G': 35, 'H': 35, 'I': 15}
+
+
+# Named styles registered once per workbook; assigning a cell by style name skips openpyxl's
+# per-cell style hashing, which dominates write time for large workbooks
+TEAM_NAMED_STYLES = {
+    "team_title": {"font": TEAM_TITLE_FONT},
+    "team_section": {"font": TEAM_SECTION_FONT},
+    "team_label": {"font": TEAM_LABEL_FONT},
+    "team_critical_title": {"font": TEAM_CRITICAL_FONT},
+    "team_header": {"font": TEAM_HEADER_FONT, "fill": TEAM_HEADER_FILL, "alignment": TEAM_CENTER_ALIGN,
+                    "border": TEAM_BORDER},
+    "team_bordered": {"border": TEAM_BORDER},
+    "team_score": {"alignment": TEAM_CENTER_ALIGN, "border": TEAM_BORDER},
+    "team_text": {"alignment": TEAM_LEFT_ALIGN, "border": TEAM_BORDER},
+    "team_paragraph": {"alignment": TEAM_LEFT_ALIGN},
+    **{
+        f"team_severity_{severity}": {"fill": fill, "alignment": TEAM_LEFT_ALIGN, "border": TEAM_BORDER}
+        for severity, fill in TEAM_SEVERITY_FILLS.items()
+    }
+}
+
+
+def _register_team_styles(wb):
+    for name, attributes in TEAM_NAMED_STYLES.items():
+        wb.add_named_style(NamedStyle(name=name, **attributes))
+
+
+def _styled_cell(ws, value, style=None):
+    """Write-only cell using one of TEAM_NAMED_STYLES"""
+    cell = WriteOnlyCell(ws, value=value)
+    if style is not None:
+        cell.style = style
+    return cell
+
+
+def _header_row(ws, headers):
+    return [_styled_cell(ws, h, "team_header") for h in headers]
+
+
+def _unique_sheet_title(agent_name, used_titles):
+    """Excel sheet names: max 31 characters, no []:*?/\\ and unique (case-insensitive)"""
+    base = "".join('_' if c in '[]:*?/\\' else c for c in agent_name).strip("'") or "Agent"
+    title, suffix = base[:31], 2
+    while title.lower() in used_titles:
+        tag = f" ({suffix})"
+        title = base[:31 - len(tag)] + tag
+        suffix += 1
+    used_titles.add(title.lower())
+    return title
+
+
+def _team_summary_row(agent_name, agent_data):
+    audit_data = agent_data.get('audit_data') or {}
+    metrics = audit_data.get('metrics', {})
+    examples = audit_data.get('technical_examples', [])
+    timestamp = agent_data.get('audit_timestamp')
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.strftime('%Y-%m-%d %H:%M')
+    return (
+        [agent_name, audit_data.get('overall_score', 0)]
+        + [metrics.get(key) for key in TEAM_METRIC_KEYS]
+        + [
+            agent_data.get('total_chats', 0),
+            len(examples),
+            sum(1 for ex in examples if ex.get('severity') == 'Critical'),
+            sum(1 for ex in examples if ex.get('severity') == 'Major'),
+            len(audit_data.get('critical_incidents', [])),
+            timestamp or ""
+        ]
+    )
+
+
+def _write_agent_sheet(ws, agent_name, agent_data):
+    """Stream one agent's review into a write-only sheet, row by row"""
+    audit_data = agent_data.get('audit_data') or {}
+    for column, width in TEAM_AGENT_COLUMN_WIDTHS.items():
+        ws.column_dimensions[column].width = width
+    
+    ws.append([_styled_cell(ws, "PERFORMANCE REVIEW REPORT", "team_title")])
+    ws.append([])
+    for label, value in [
+        ("Agent:", agent_name),
+        ("Review Date:", datetime.now().strftime('%B %d, %Y')),
+        ("Chats Analyzed:", agent_data.get('total_chats', 0)),
+        ("Overall Score:", f"{audit_data.get('overall_score', 0)}/10.0")
+    ]:
+        ws.append([_styled_cell(ws, label, "team_label"), value])
+    ws.append([])
+    
+    metrics = audit_data.get('metrics', {})
+    if metrics:
+        ws.append([_styled_cell(ws, "PERFORMANCE METRICS", "team_section")])
+        ws.append(_header_row(ws, ["Metric", "Score (out of 5.0)"]))
+        for key, value in metrics.items():
+            ws.append([
+                _styled_cell(ws, key.replace('_', ' ').title(), "team_bordered"),
+                _styled_cell(ws, f"{value}/5.0", "team_score")
+            ])
+        ws.append([])
+    
+    examples = audit_data.get('technical_examples', [])
+    if examples:
+        ws.append([_styled_cell(ws, "TECHNICAL EXAMPLES", "team_section")])
+        ws.append(_header_row(ws, TEAM_EXAMPLE_HEADERS))
+        for idx, ex in enumerate(examples, 1):
+            values = [
+                ex.get('example_number', idx), ex.get('client_name', 'N/A'), ex.get('pin_number', 'N/A'),
+                ex.get('issue_type', 'N/A'), ex.get('customer_issue', 'N/A'), ex.get('agent_action', 'N/A'),
+                ex.get('outcome', 'N/A'), ex.get('assessment', 'N/A'), ex.get('severity', 'N/A')
+            ]
+            row = [_styled_cell(ws, v, "team_text") for v in values[:-1]]
+            severity_style = f"team_severity_{values[-1]}" if values[-1] in TEAM_SEVERITY_FILLS else "team_text"
+            row.append(_styled_cell(ws, values[-1], severity_style))
+            ws.append(row)
+        ws.append([])
+    
+    for title, key in [("KEY STRENGTHS", "key_strengths"), ("AREAS FOR DEVELOPMENT", "key_development_areas")]:
+        ws.append([_styled_cell(ws, title, "team_section")])
+        for i, item in enumerate(audit_data.get(key, []), 1):
+            ws.append([f"{i}.", _styled_cell(ws, item, "team_text")])
+        ws.append([])
+    
+    for title, key, default in [
+        ("SECURITY & PIN PROTOCOL ANALYSIS", "pin_protocol_feedback", "No feedback available"),
+        ("OVERALL ASSESSMENT", "overall_assessment", "No assessment available")
+    ]:
+        ws.append([_styled_cell(ws, title, "team_section")])
+        ws.append([_styled_cell(ws, audit_data.get(key, default), "team_paragraph")])
+        ws.append([])
+    
+    critical = audit_data.get('critical_incidents', [])
+    if critical:
+        ws.append([_styled_cell(ws, "CRITICAL INCIDENTS", "team_critical_title")])
+        for i, incident in enumerate(critical, 1):
+            ws.append([f"{i}.", _styled_cell(ws, incident, "team_severity_Critical")])
+
+
+def _summarize_team_report(result, agents, output_path):
+    return {"output_bytes": file_size(output_path)}
+
+
+@instrumented("team_excel_report", summarize=_summarize_team_report)
+def generate_team_excel_report(agents, output_path):
+    """Generate one workbook with a team summary sheet and a sheet per audited agent.
+    
+    agents is a dict {agent_name: agent_data} or any iterable of (agent_name, agent_data)
+    pairs - a generator keeps memory flat, since each agent sheet is streamed to disk
+    as it is written and only one summary row per agent is kept.
+    """
+    items = agents.items() if hasattr(agents, 'items') else agents
+    
+    wb = Workbook(write_only=True)
+    _register_team_styles(wb)
+    summary_ws = wb.create_sheet("Team Summary")
+    summary_ws.column_dimensions['A'].width = 25
+    for column in "BCDEFGHIJKLM":
+        summary_ws.column_dimensions[column].width = 16
+    summary_ws.freeze_panes = "B2"
+    summary_ws.append(_header_row(summary_ws, TEAM_SUMMARY_HEADERS))
+    
+    used_titles = {"team summary"}
+    for agent_name, agent_data in items:
+        if not agent_data or not agent_data.get('audit_data'):
+            continue
+        summary_ws.append(_team_summary_row(agent_name, agent_data))
+        agent_ws = wb.create_sheet(_unique_sheet_title(agent_name, used_titles))
+        _write_agent_sheet(agent_ws, agent_name, agent_data)
+    
+    wb.save(output_path)
+    return output_path
+
+
+# --- TEMPLATE EXCEL EXPORT (template.xlsx + template_mapping.json) ---
+REPORTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TEMPLATE_PATH = os.environ.get("EXCEL_TEMPLATE_PATH", os.path.join(REPORTS_DIR, "template.xlsx"))
+DEFAULT_TEMPLATE_MAPPING_PATH = os.environ.get(
+    "EXCEL_TEMPLATE_MAPPING", os.path.join(REPORTS_DIR, "template_mapping.json")
+)
+
+# Placeholder written into mapped cells when the template is compiled
+TEMPLATE_SLOT = "__auditslot_{}__"
+TEMPLATE_SLOT_PATTERN = re.compile(rb'<c ([^>]*)><is><t[^>]*>__auditslot_(\d+)__</t></is></c>')
+TEMPLATE_CELL_ATTR_PATTERN = re.compile(r'\b(r|s)="([^"]*)"')
+
+_TEMPLATE_CACHE = {}
+_TEMPLATE_CACHE_LOCK = threading.Lock()
+
+
+def load_template_mapping(mapping_path):
+    """Read {sheet: {cell_or_range: spec}}; a spec is a field path or a dict with "field"
+    (path or list of paths), optional "scale", and for ranges a "rating" threshold list"""
+    with open(mapping_path, encoding="utf-8") as f:
+        mapping = json.load(f)
+    
+    for sheet_name, cells in mapping.items():
+        for ref, spec in cells.items():
+            spec = {"field": spec} if isinstance(spec, str) else spec
+            if "field" not in spec:
+                raise ValueError(f"Template mapping {sheet_name}!{ref} has no field")
+            if ":" in ref and "rating" not in spec:
+                raise ValueError(f"Template mapping {sheet_name}!{ref}: only rating specs can span a range")
+            cells[ref] = spec
+    return mapping
+
+
+def _range_cells(ref):
+    min_col, min_row, max_col, max_row = range_boundaries(ref)
+    return [f"{get_column_letter(col)}{row}"
+            for row in range(min_row, max_row + 1) for col in range(min_col, max_col + 1)]
+
+
+def _compile_template(template_path, mapping_path):
+    """Parse the template once and split its package into static bytes and data-cell slots"""
+    mapping = load_template_mapping(mapping_path)
+    wb = load_workbook(template_path)
+    slots = []
+    
+    for sheet_name, cells in mapping.items():
+        if sheet_name not in wb.sheetnames:
+            raise ValueError(f"Template mapping refers to missing sheet '{sheet_name}'")
+        ws = wb[sheet_name]
+        for ref, spec in cells.items():
+            for position, cell_ref in enumerate(_range_cells(ref) if ":" in ref else [ref]):
+                if isinstance(ws[cell_ref], MergedCell):
+                    raise ValueError(f"Template mapping {sheet_name}!{cell_ref} is inside a merged range; "
+                                     f"map the range's top-left cell instead")
+                ws[cell_ref].value = TEMPLATE_SLOT.format(len(slots))
+                slots.append((spec, position))
+    
+    # Let openpyxl normalize the package once; every report reuses these bytes
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    parts = []
+    with zipfile.ZipFile(buffer) as package:
+        for name in package.namelist():
+            data = package.read(name)
+            if b"__auditslot_" not in data:
+                parts.append((name, data))
+                continue
+            chunks = []
+            last = 0
+            for match in TEMPLATE_SLOT_PATTERN.finditer(data):
+                attrs = dict(TEMPLATE_CELL_ATTR_PATTERN.findall(match.group(1).decode()))
+                chunks.append(data[last:match.start()])
+                chunks.append((attrs["r"], attrs.get("s"), *slots[int(match.group(2))]))
+                last = match.end()
+            chunks.append(data[last:])
+            parts.append((name, chunks))
+    return parts
+
+
+def load_excel_template(template_path=None, mapping_path=None):
+    """Compiled template, cached per process and rebuilt when either file changes"""
+    template_path = os.path.abspath(template_path or DEFAULT_TEMPLATE_PATH)
+    mapping_path = os.path.abspath(mapping_path or DEFAULT_TEMPLATE_MAPPING_PATH)
+    key = (template_path, mapping_path)
+    signature = (os.path.getmtime(template_path), os.path.getmtime(mapping_path))
+    
+    with _TEMPLATE_CACHE_LOCK:
+        cached = _TEMPLATE_CACHE.get(key)
+        if cached is None or cached[0] != signature:
+            with stage("template_compile"):
+                cached = (signature, _compile_template(template_path, mapping_path))
+            _TEMPLATE_CACHE[key] = cached
+        return cached[1]
+
+
+def _template_context(agent_data, agent_name):
+    return {
+        **agent_data.get('audit_data', {}),
+        "agent_name": agent_name,
+        "team": agent_data.get('team', ''),
+        "review_date": datetime.now().strftime('%B %d, %Y'),
+        "total_chats": agent_data.get('total_chats', 0),
+    }
+
+
+def _lookup(context, path):
+    value = context
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _template_value(context, spec, position):
+    fields = spec["field"] if isinstance(spec["field"], list) else [spec["field"]]
+    values = [_lookup(context, field) for field in fields]
+    
+    if len(values) == 1 and isinstance(values[0], (int, float)) and not isinstance(values[0], bool):
+        number = round(values[0] * spec.get("scale", 1), 1)
+        if "rating" not in spec:
+            return number
+        # Rating rows put an "X" in the first column whose threshold the score reaches
+        band = next((i for i, threshold in enumerate(spec["rating"]) if number >= threshold), len(spec["rating"]))
+        return "X" if band == position else None
+    if "rating" in spec:
+        return None
+    
+    lines = []
+    for value in values:
+        if isinstance(value, list):
+            lines.extend(f"• {item}" for item in value if isinstance(item, (str, int, float)))
+        elif value not in (None, ""):
+            lines.append(str(value))
+    return "\n".join(lines) or None
+
+
+def _render_template_cell(ref, style, value):
+    style_attr = f' s="{style}"' if style else ''
+    if value is None:
+        return f'<c r="{ref}"{style_attr}/>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"{style_attr}><v>{value}</v></c>'
+    text = xml_escape(ILLEGAL_CHARACTERS_RE.sub('', value))
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _summarize_template_report(result, agent_data, agent_name, output_path, **options):
+    return {"output_bytes": file_size(output_path)}
+
+
+@instrumented("template_excel_report", summarize=_summarize_template_report)
+def generate_template_excel_report(agent_data, agent_name, output_path, template_path=None, mapping_path=None):
+    """Fill the QA review form (template.xlsx) with an agent's audit.
+    
+    The template is parsed once per process; each report only renders the cells
+    listed in the mapping file, so QA leads can restyle or move fields by editing
+    template.xlsx and template_mapping.json without touching code.
+    """
+    parts = load_excel_template(template_path, mapping_path)
+    context = _template_context(agent_data, agent_name)
+    
+    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as package:
+        for name, data in parts:
+            if not isinstance(data, bytes):
+                data = b"".join(
+                    chunk if isinstance(chunk, bytes)
+                    else _render_template_cell(chunk[0], chunk[1], _template_value(context, chunk[2], chunk[3])).encode()
+                    for chunk in data
+                )
+            package.writestr(name, data)
+    return output_path
+
+
+# --- BULK REPORT ARCHIVES (Spooled ZIP, One Report On Disk At A Time) ---
+# Archives stay in memory up to this size, then spill to a temp file
+ARCHIVE_SPOOL_BYTES = 16 * 1024 * 1024
+
+ARCHIVE_WRITERS = {
+    "pdf": generate_pdf_report,
+    "xlsx": generate_excel_report,
+    "form.xlsx": generate_template_excel_report,
+}
+
+
+def _summarize_archive(result, *args, **kwargs):
+    result.seek(0, os.SEEK_END)
+    size = result.tell()
+    result.seek(0)
+    return {"output_bytes": size}
+
+
+@instrumented("report_archive", summarize=_summarize_archive)
+def write_report_archive(agents, formats=("pdf",), spool_bytes=ARCHIVE_SPOOL_BYTES, target=None):
+    """Write every audited agent's reports into a ZIP held in a spooled temp file.
+    
+    Each report is rendered to a scratch file, copied into the archive in chunks
+    and deleted before the next one, so peak memory is about one report. Returns
+    the archive rewound to the start; the caller closes it. target is an open
+    binary file to write the ZIP into instead (e.g. a NamedTemporaryFile).
+    """
+    items = agents.items() if hasattr(agents, 'items') else agents
+    archive = target if target is not None else tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    
+    with tempfile.TemporaryDirectory(prefix="audit_reports_") as scratch_dir, \
+            zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for agent_name, agent_data in items:
+            if not agent_data or not agent_data.get('audit_data'):
+                continue
+            for fmt in formats:
+                scratch_path = os.path.join(scratch_dir, f"report.{fmt}")
+                ARCHIVE_WRITERS[fmt](agent_data, agent_name, scratch_path)
+                zip_file.write(scratch_path, f"{agent_name}_Performance_Review.{fmt}")
+                os.remove(scratch_path)
+    
+    archive.seek(0)
+    return archive
@@ -0,0 +1,159 @@
+"""Choosing which of an agent's chats go into the audit prompt.
+
+Many chats are near-identical (the same macro for "reset my email password"),
+so before sampling, chats are clustered by MinHash over the agent's own
+messages. Each cluster sends one representative and its size, so the sample
+covers more distinct situations for the same token budget.
+
+MinHash with LSH banding: every chat's agent messages become word 3-gram
+shingles, 128 hash permutations give a signature whose per-position agreement
+estimates Jaccard similarity, and chats sharing any 8-row band become
+candidates that are confirmed against NEAR_DUPLICATE_THRESHOLD.
+"""
+import re
+import zlib
+
+import numpy as np
+
+from extraction import parse_transcript
+from instrumentation import instrumented
+
+# --- CONFIGURATION ---
+SHINGLE_SIZE = 3
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16
+# Estimated Jaccard similarity of agent-message shingles above which two chats are one cluster
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+# Universal hashing h(x) = (a*x + b) mod p over 32-bit shingle hashes; a < 2^31 keeps a*x + b inside uint64
+_PRIME = np.uint64(4294967311)
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, 2 ** 31, NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 2 ** 32, NUM_PERMUTATIONS, dtype=np.uint64)
+
+_WORD = re.compile(r"\w+")
+# PINs, order numbers and amounts differ between otherwise identical chats
+_DIGITS = re.compile(r"\d+")
+
+
+def agent_shingles(transcript, agent_name):
+    """Hashes of the word 3-grams in the agent's own messages"""
+    words = []
+    for _, sender, body in parse_transcript(transcript):
+        if sender == agent_name:
+            words.extend(_WORD.findall(_DIGITS.sub("0", body.lower())))
+    grams = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+def minhash_signature(shingles):
+    """NUM_PERMUTATIONS minimum hash values for one shingle set (shingles must be non-empty)"""
+    return ((np.outer(_PERM_A, shingles) + _PERM_B[:, None]) % _PRIME).min(axis=1)
+
+
+class _DisjointSet:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        # The earlier chat stays the root, so clusters are represented by their first chat
+        if root_i != root_j:
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def _summarize_clusters(clusters, transcripts, *args, **kwargs):
+    return {"chats": len(transcripts), "clusters": len(clusters)}
+
+
+@instrumented("near_duplicate_clustering", summarize=_summarize_clusters)
+def near_duplicate_clusters(transcripts, agent_name, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """Group chats whose agent messages are near-identical; returns lists of indices ordered by first chat"""
+    signatures = {}
+    for i, transcript in enumerate(transcripts):
+        shingles = agent_shingles(transcript, agent_name)
+        # Too little agent text to compare: the chat stays on its own
+        if len(shingles):
+            signatures[i] = minhash_signature(shingles)
+
+    clusters = _DisjointSet(len(transcripts))
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    for band in range(LSH_BANDS):
+        buckets = {}
+        for i, signature in signatures.items():
+            buckets.setdefault(signature[band * rows:(band + 1) * rows].tobytes(), []).append(i)
+        for members in buckets.values():
+            for position, j in enumerate(members[1:], 1):
+                for i in members[:position]:
+                    if clusters.find(i) != clusters.find(j) and \
+                            np.mean(signatures[i] == signatures[j]) >= threshold:
+                        clusters.union(i, j)
+
+    groups = {}
+    for i in range(len(transcripts)):
+        groups.setdefault(clusters.find(i), []).append(i)
+    return [groups[root] for root in sorted(groups)]
+
+
+def collapse_near_duplicates(transcripts, agent_name, chat_ids=None, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """One representative per near-duplicate cluster.
+
+    Returns (transcripts, chat_ids or None, cluster_sizes), in the order the
+    clusters' first chats appear; each representative is its cluster's first chat.
+    """
+    clusters = near_duplicate_clusters(transcripts, agent_name, threshold)
+    representatives = [members[0] for members in clusters]
+    return (
+        [transcripts[i] for i in representatives],
+        [chat_ids[i] for i in representatives] if chat_ids else None,
+        [len(members) for members in clusters],
+    )
+
+
+def stratified_sample(labels, sample_size, weights=None):
+    """Indices of up to sample_size items spread over labels in proportion to their weight.
+
+    Each label gets one slot while slots last (heaviest labels first); the rest
+    go to whichever label is furthest below its proportional share. Indices
+    keep their original order.
+    """
+    if len(labels) <= sample_size:
+        return list(range(len(labels)))
+    weights = weights or [1] * len(labels)
+    strata = {}
+    for i, label in enumerate(labels):
+        strata.setdefault(label, []).append(i)
+    mass = {label: sum(weights[i] for i in members) for label, members in strata.items()}
+    total = sum(mass.values())
+
+    quota = {label: 0 for label in strata}
+    for label in sorted(strata, key=mass.get, reverse=True)[:sample_size]:
+        quota[label] = 1
+    for _ in range(sample_size - sum(quota.values())):
+        deficits = {label: mass[label] / total * sample_size - quota[label]
+                    for label in strata if quota[label] < len(strata[label])}
+        quota[max(deficits, key=deficits.get)] += 1
+    return sorted(i for label, members in strata.items() for i in members[:quota[label]])
+
+
+def stratified_batches(labels, batch_size, weights=None, max_batches=None):
+    """Split indices into batches of batch_size, each stratified over what is left.
+
+    Any run of leading batches is itself spread across labels, so chats can be
+    audited round by round and stopped early.
+    """
+    remaining = list(range(len(labels)))
+    batches = []
+    while remaining and (max_batches is None or len(batches) < max_batches):
+        chosen = stratified_sample([labels[i] for i in remaining], batch_size,
+                                   [weights[i] for i in remaining] if weights else None)
+        batches.append([remaining[position] for position in chosen])
+        taken = set(chosen)
+        remaining = [i for position, i in enumerate(remaining) if position not in taken]
+    return batches
@@ -0,0 +1,295 @@
+"""Fitting bulk audits into the model quota.
+
+Bulk runs used to audit agents in roster order until the free-tier quota ran
+out, so the same agents at the end of the list were never reached. Here every
+agent's model cost is estimated from its extracted chats before any call is
+made, agents are ranked by how much they need an audit (overdue, low last
+score, high chat volume, deferred last time) and the queue is filled greedily
+in that order under the remaining daily and per-run budgets. Whatever does not
+fit is recorded in the audit store and gets a priority boost next window.
+
+Budgets count model requests and tokens (prompt + output). Daily usage is
+kept in the store's model_usage ledger, keyed by the quota day (Gemini quotas
+reset at midnight Pacific time), so separate runs on one day share the limit.
+MeteredBackend enforces the budget per call in case an estimate falls short:
+each call reserves its prompt plus the output cap under the budget lock
+before it is made (so concurrent workers cannot overshoot together), then
+the reservation is corrected to the usage the API reports, which also feeds
+the ledger.
+"""
+import logging
+import os
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from audit_engine import audit_prompts
+from chat_index import chat_keys
+from model_backends import MAX_OUTPUT_TOKENS, ModelBackend
+
+logger = logging.getLogger("auditor.scheduler")
+
+# --- CONFIGURATION ---
+# Daily limits shared by every run (0 = unlimited); free-tier defaults are set in the environment
+DAILY_REQUEST_BUDGET = int(os.environ.get("DAILY_REQUEST_BUDGET", "0"))
+DAILY_TOKEN_BUDGET = int(os.environ.get("DAILY_TOKEN_BUDGET", "0"))
+QUOTA_TIMEZONE = ZoneInfo(os.environ.get("QUOTA_TIMEZONE", "America/Los_Angeles"))
+
+# Roughly 4 characters per token, like the Gemini tokenizer on English text
+CHARS_PER_TOKEN = 4
+# Output cap per call (the backends stop generating there), sized for a full audit with 20 technical examples;
+# estimates and MeteredBackend's reservations both count every call at this cap
+FULL_AUDIT_OUTPUT_TOKENS = MAX_OUTPUT_TOKENS
+
+# An audit older than this is fully overdue
+OVERDUE_DAYS = 30
+PRIORITY_WEIGHTS = {
+    "overdue": 0.4,      # days since the last audit (never audited counts as fully overdue)
+    "low_score": 0.3,    # how far the last overall score is below 10
+    "volume": 0.2,       # chats in this export, relative to the busiest agent
+    "deferred": 0.3,     # left over from an earlier window
+}
+# Score assumed for agents that were never audited
+UNKNOWN_SCORE = 5.0
+
+
+class AuditCost(namedtuple("AuditCost", ["requests", "prompt_tokens", "output_tokens"])):
+    """Estimated or measured model usage"""
+
+    __slots__ = ()
+
+    @property
+    def tokens(self):
+        return self.prompt_tokens + self.output_tokens
+
+    def __add__(self, other):
+        return AuditCost(*(a + b for a, b in zip(self, other)))
+
+
+NO_COST = AuditCost(0, 0, 0)
+
+
+def quota_day(now=None):
+    """The quota window (a date string) that now falls in"""
+    return (now or datetime.now(QUOTA_TIMEZONE)).astimezone(QUOTA_TIMEZONE).date().isoformat()
+
+
+# --- COST ESTIMATES ---
+def estimate_cost(transcripts, agent_name, adaptive=False, tiered=False, chat_ids=None):
+    """Estimated model usage of one agent's audit, before any call.
+
+    Builds the prompts the audit would send (audit_engine.audit_prompts: the
+    same near-duplicate collapsing, issue-stratified sample and CHAT ID lines)
+    and costs each call as MeteredBackend reserves it: prompt characters / 4
+    plus FULL_AUDIT_OUTPUT_TOKENS. Adaptive audits are costed at their maximum
+    number of rounds and tiered audits as triage plus escalation.
+    """
+    prompts = audit_prompts(transcripts, agent_name, chat_ids, adaptive=adaptive, tiered=tiered)
+    return sum((AuditCost(1, len(prompt) // CHARS_PER_TOKEN, FULL_AUDIT_OUTPUT_TOKENS) for prompt in prompts),
+               NO_COST)
+
+
+# --- BUDGETS ---
+class Budget:
+    """Request and token allowance for one run (None = unlimited); safe to share between threads"""
+
+    def __init__(self, requests=None, tokens=None):
+        self.requests = requests
+        self.tokens = tokens
+        self.spent = NO_COST
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_window(cls, store=None, daily_requests=DAILY_REQUEST_BUDGET, daily_tokens=DAILY_TOKEN_BUDGET,
+                   run_requests=None, run_tokens=None, day=None):
+        """The tighter of the per-run limits and what today's daily limits have left in the store's ledger"""
+        requests, tokens = run_requests or None, run_tokens or None
+        if store is not None and (daily_requests or daily_tokens):
+            used = store.get_usage(day or quota_day())
+            if daily_requests:
+                left = max(0, daily_requests - used["requests"])
+                requests = left if requests is None else min(requests, left)
+            if daily_tokens:
+                left = max(0, daily_tokens - used["prompt_tokens"] - used["output_tokens"])
+                tokens = left if tokens is None else min(tokens, left)
+        return cls(requests, tokens)
+
+    @property
+    def limited(self):
+        return self.requests is not None or self.tokens is not None
+
+    def remaining(self):
+        """(requests, tokens) still available; None where unlimited"""
+        with self._lock:
+            return (None if self.requests is None else self.requests - self.spent.requests,
+                    None if self.tokens is None else self.tokens - self.spent.tokens)
+
+    def _fits(self, requests, tokens):
+        return (self.requests is None or requests <= self.requests - self.spent.requests) and \
+               (self.tokens is None or tokens <= self.tokens - self.spent.tokens)
+
+    def allows(self, requests=1, tokens=0):
+        with self._lock:
+            return self._fits(requests, tokens)
+
+    def reserve(self, cost):
+        """Count cost as spent if it fits what is left; False (nothing reserved) if it does not"""
+        with self._lock:
+            if not self._fits(cost.requests, cost.tokens):
+                return False
+            self.spent += cost
+            return True
+
+    def settle(self, reserved, actual):
+        """Replace a reservation with the usage the call actually had"""
+        with self._lock:
+            self.spent += AuditCost(*(used - held for used, held in zip(actual, reserved)))
+
+
+class BudgetExhausted(Exception):
+    """Raised instead of a model call that the run's budget no longer covers"""
+
+
+# Calls refused by any MeteredBackend, per thread (an audit's calls run on the thread that started it)
+_refusals = threading.local()
+
+
+def refused_calls():
+    """Model calls refused for lack of budget so far on this thread; compare before and after an audit"""
+    return getattr(_refusals, "count", 0)
+
+
+class MeteredBackend(ModelBackend):
+    """Wraps a backend to refuse calls beyond a Budget and report each call's usage.
+
+    Each call reserves its estimated prompt plus max_output_tokens (the cap the
+    backend generates up to) before it is made, and settles to the reported
+    usage afterwards.
+    """
+
+    def __init__(self, backend, budget=None, on_usage=None, max_output_tokens=FULL_AUDIT_OUTPUT_TOKENS):
+        self.backend = backend
+        self.budget = budget
+        self.on_usage = on_usage
+        self.max_output_tokens = max_output_tokens
+        self.name = getattr(backend, "name", type(backend).__name__)
+
+    def generate_content(self, prompt):
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+        reserved = AuditCost(1, prompt_tokens, self.max_output_tokens)
+        # Read the budget per call: the app and CLI attach one after wrapping the backend
+        budget = self.budget
+        if budget is not None and not budget.reserve(reserved):
+            _refusals.count = refused_calls() + 1
+            raise BudgetExhausted("Model budget for this run is used up")
+        try:
+            response = self.backend.generate_content(prompt)
+        except Exception as e:
+            # Rate-limited calls are rejected before they count against the quota
+            self._record(NO_COST if getattr(e, "code", None) == 429 else AuditCost(1, 0, 0), budget, reserved)
+            raise
+        usage = getattr(response, "usage_metadata", None)
+        self._record(AuditCost(
+            1,
+            getattr(usage, "prompt_token_count", None) or prompt_tokens,
+            getattr(usage, "candidates_token_count", None) or len(response.text) // CHARS_PER_TOKEN,
+        ), budget, reserved)
+        return response
+
+    def _record(self, cost, budget, reserved):
+        if budget is not None:
+            budget.settle(reserved, cost)
+        if self.on_usage is not None and cost.requests:
+            try:
+                self.on_usage(cost)
+            except Exception:
+                logger.exception("Could not record model usage")
+
+
+# --- PRIORITIES ---
+def audit_priorities(agent_names, chat_counts, store=None, now=None):
+    """{agent: (priority, reasons)} - higher priority goes first; reasons name the factors that count most"""
+    now = now or datetime.now()
+    history = {row["name"]: row for row in store.list_agent_scores()} if store is not None else {}
+    deferred = store.list_deferred() if store is not None else {}
+    busiest = max([chat_counts.get(name, 0) for name in agent_names] + [1])
+
+    priorities = {}
+    for name in agent_names:
+        record = history.get(name) or {}
+        if record.get("last_audit_at"):
+            age = now - datetime.fromisoformat(record["last_audit_at"])
+            overdue = min(1.0, max(0.0, age / timedelta(days=OVERDUE_DAYS)))
+        else:
+            overdue = 1.0
+        score = record.get("overall_score")
+        factors = {
+            "overdue": overdue,
+            "low_score": 1 - min(10.0, max(0.0, UNKNOWN_SCORE if score is None else score)) / 10,
+            "volume": chat_counts.get(name, 0) / busiest,
+            "deferred": 1.0 if name in deferred else 0.0,
+        }
+        contributions = {factor: PRIORITY_WEIGHTS[factor] * value for factor, value in factors.items()}
+        reasons = [factor for factor, value in sorted(contributions.items(), key=lambda item: -item[1])
+                   if value >= 0.15]
+        priorities[name] = (round(sum(contributions.values()), 3), reasons)
+    return priorities
+
+
+# --- PLANNING ---
+def plan_audits(costs, priorities, budget):
+    """Order agents by priority and keep those that fit the budget.
+
+    costs is {agent: AuditCost}. Agents are taken in priority order; one that
+    does not fit is deferred, but smaller agents after it may still fill the
+    remaining allowance. Returns (scheduled, deferred) as lists of
+    {"agent", "priority", "reasons", "cost"} in priority order.
+    """
+    requests_left, tokens_left = budget.remaining()
+    scheduled, deferred = [], []
+    for agent in sorted(costs, key=lambda name: (-priorities[name][0], name)):
+        cost = costs[agent]
+        entry = {"agent": agent, "priority": priorities[agent][0], "reasons": priorities[agent][1], "cost": cost}
+        fits = (requests_left is None or cost.requests <= requests_left) and \
+               (tokens_left is None or cost.tokens <= tokens_left)
+        if not fits:
+            deferred.append(entry)
+            continue
+        scheduled.append(entry)
+        requests_left = None if requests_left is None else requests_left - cost.requests
+        tokens_left = None if tokens_left is None else tokens_left - cost.tokens
+    return scheduled, deferred
+
+
+def schedule_bulk_audit(extracted, store=None, budget=None, adaptive=False, tiered=False):
+    """Plan a bulk run over {agent: (transcripts, metadata)}.
+
+    Agents without chats are left out. Deferred agents are recorded in the
+    store, and scheduled ones are cleared from its deferred list once audited
+    (see record_audited). Returns (scheduled, deferred) from plan_audits.
+    """
+    budget = budget or Budget()
+    costs = {name: estimate_cost(transcripts, name, adaptive, tiered, chat_keys(transcripts, metadata))
+             for name, (transcripts, metadata) in extracted.items() if transcripts}
+    priorities = audit_priorities(list(costs), {name: len(extracted[name][0]) for name in costs}, store)
+    scheduled, deferred = plan_audits(costs, priorities, budget)
+    if store is not None and deferred:
+        store.defer_audits([(entry["agent"], entry["cost"].tokens, "budget") for entry in deferred])
+    planned = sum((entry["cost"] for entry in scheduled), NO_COST)
+    logger.info("Scheduled %d agent(s) (~%d requests, ~%d tokens); deferred %d to the next window",
+                len(scheduled), planned.requests, planned.tokens, len(deferred))
+    return scheduled, deferred
+
+
+def record_audited(store, agent_names):
+    """Take audited agents off the deferred list"""
+    if store is not None and agent_names:
+        store.clear_deferred(agent_names)
+
+
+def ledger_recorder(store):
+    """on_usage callback for MeteredBackend that adds each call to today's usage in the store"""
+    def record(cost):
+        store.record_usage(quota_day(), cost.requests, cost.prompt_tokens, cost.output_tokens)
+    return record
@@ -0,0 +1,256 @@
+"""Score post-processing rules and offline re-scoring of stored audits.
+
+The overall score is a weighted average of the five 0-5 metrics on a 10-point
+scale. Weights come from named profiles (weight_profiles.json; "default" is
+the original rubric), so a rubric change is a profile edit rather than a new
+round of model calls. rescore() applies the live post-processing rules -
+metric capping, the lazy-scoring adjustment and the weighted overall - to a
+whole (audits x metrics) matrix at once; rescore_history() runs it over the
+audit store's indexed metric rows without loading any audit JSON.
+
+Re-weight a quarter of history from the command line:
+    python scoring.py --store sqlite:///audit_store.db --profile security_first --since 2024-01-01
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+logger = logging.getLogger("auditor.scoring")
+
+# --- CONFIGURATION ---
+DEFAULT_WEIGHT_PROFILES_PATH = os.environ.get(
+    "WEIGHT_PROFILES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "weight_profiles.json")
+)
+# Profile used for new audits
+DEFAULT_PROFILE = os.environ.get("SCORING_PROFILE", "default")
+
+METRIC_KEYS = (
+    "security_pin_protocol",
+    "technical_capability",
+    "communication_professionalism",
+    "investigative_approach",
+    "chat_ownership_resolution",
+)
+# The original rubric, also used when no profiles file exists
+DEFAULT_WEIGHTS = {
+    'security_pin_protocol': 0.20,       # 20%
+    'technical_capability': 0.25,        # 25%
+    'communication_professionalism': 0.15, # 15%
+    'investigative_approach': 0.20,      # 20%
+    'chat_ownership_resolution': 0.20    # 20%
+}
+
+# Lazy scoring: this many perfect 5.0 metrics means the model scored by default, not from evidence
+LAZY_PERFECT_SCORES = 4
+# Adjusted values for the perfect scores of a lazy audit: the first two, then the rest
+LAZY_ADJUSTED_FIRST, LAZY_ADJUSTED_REST = 4.5, 4.3
+# Live audits keep the model's overall score unless it is further than this from the weighted one
+CONSISTENCY_TOLERANCE = 1.0
+
+_profiles = {}
+
+
+# --- WEIGHT PROFILES ---
+def validate_weights(weights, name="profile"):
+    """Raise ValueError unless weights cover every metric, are non-negative and sum to 1"""
+    if set(weights) != set(METRIC_KEYS):
+        missing = sorted(set(METRIC_KEYS) - set(weights))
+        unknown = sorted(set(weights) - set(METRIC_KEYS))
+        raise ValueError(f"Weight {name} must cover exactly the five metrics (missing {missing}, unknown {unknown})")
+    if any(float(weight) < 0 for weight in weights.values()):
+        raise ValueError(f"Weight {name} has a negative weight")
+    if abs(sum(float(weight) for weight in weights.values()) - 1.0) > 1e-6:
+        raise ValueError(f"Weights in {name} must total 100%")
+    return {key: float(weights[key]) for key in METRIC_KEYS}
+
+
+def load_weight_profiles(path=DEFAULT_WEIGHT_PROFILES_PATH):
+    """{name: weights} from a JSON file; "default" is always present"""
+    profiles = {"default": dict(DEFAULT_WEIGHTS)}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for name, weights in json.load(f).items():
+                profiles[name] = validate_weights(weights, f"profile {name!r}")
+    return profiles
+
+
+def weight_profile(name=None):
+    """Weights of a named profile (default: SCORING_PROFILE)"""
+    if not _profiles:
+        _profiles.update(load_weight_profiles())
+    name = name or DEFAULT_PROFILE
+    if name not in _profiles:
+        raise ValueError(f"Unknown weight profile {name!r} (have: {', '.join(sorted(_profiles))})")
+    return _profiles[name]
+
+
+def weight_percentages(weights=None):
+    """{metric: "20%"} for prompt text"""
+    weights = weights or weight_profile()
+    return {key: f"{round(weight * 100)}%" for key, weight in weights.items()}
+
+
+# --- SCORING RULES ---
+def weighted_overall(metrics, weights=None):
+    """Overall score on the 10-point scale from the weighted 0-5 metrics"""
+    weights = weights or weight_profile()
+    weighted_sum = 0
+    for key, weight in weights.items():
+        metric_value = float(metrics.get(key, 0))
+        weighted_sum += (metric_value * 2) * weight  # multiply by 2 to convert to 10-point scale
+    return weighted_sum
+
+
+def count_perfect_scores(metrics):
+    """Metrics at (or capped to) a perfect 5.0"""
+    return sum(1 for v in metrics.values() if min(float(v), 5.0) == 5.0)
+
+
+def rescore(metrics, overall=None, weights=None, tolerance=0.0):
+    """Apply the post-processing rules to every row of an (audits x METRIC_KEYS) matrix.
+
+    Caps metrics at 5.0, applies the lazy-scoring adjustment to rows with
+    exactly LAZY_PERFECT_SCORES perfect metrics out of five, and recomputes the
+    weighted overall (missing metrics count as 0, like the live rules). With
+    tolerance > 0 an existing overall is kept when it is within tolerance of
+    the weighted one, as live audits do. Returns (metrics, overall, lazy), where
+    lazy flags the rows that looked lazily scored.
+    """
+    weights = weights or weight_profile()
+    metrics = np.minimum(np.asarray(metrics, dtype=float), 5.0)
+    perfect = metrics == 5.0
+    perfect_count = perfect.sum(axis=1)
+    lazy = perfect_count >= LAZY_PERFECT_SCORES
+
+    # Only the 4-of-5 pattern is adjusted; five perfect scores are flagged but left alone
+    adjust = perfect & ((perfect_count == LAZY_PERFECT_SCORES) & ~np.isnan(metrics).any(axis=1))[:, None]
+    replacement = np.where(np.cumsum(perfect, axis=1) <= 2, LAZY_ADJUSTED_FIRST, LAZY_ADJUSTED_REST)
+    metrics = np.where(adjust, replacement, metrics)
+
+    # Accumulate in the same order as weighted_overall and round like round(), so results match live audits exactly
+    weighted_sum = np.zeros(len(metrics))
+    for key, weight in weights.items():
+        weighted_sum += (np.nan_to_num(metrics[:, METRIC_KEYS.index(key)]) * 2) * weight
+    calculated = np.array([round(value, 1) for value in weighted_sum.tolist()])
+    if overall is None or tolerance <= 0:
+        return metrics, calculated, lazy
+    overall = np.minimum(np.asarray(overall, dtype=float), 10.0)
+    return metrics, np.where(np.abs(calculated - overall) > tolerance, calculated, overall), lazy
+
+
+def rank_within(scores, groups=None):
+    """Competition rank (1 = highest score, ties share a rank) of each score within its group"""
+    scores = np.asarray(scores, dtype=float)
+    groups = np.zeros(len(scores), dtype=int) if groups is None else np.unique(groups, return_inverse=True)[1]
+    order = np.lexsort((-scores, groups))
+    sorted_groups, sorted_scores = groups[order], scores[order]
+    position = np.arange(len(scores))
+    new_group = np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]
+    new_score = new_group | np.r_[True, sorted_scores[1:] != sorted_scores[:-1]]
+    group_start = np.maximum.accumulate(np.where(new_group, position, 0))
+    tie_start = np.maximum.accumulate(np.where(new_score, position, 0))
+    ranks = np.empty(len(scores), dtype=int)
+    ranks[order] = tie_start - group_start + 1
+    return ranks
+
+
+# --- STORED HISTORY ---
+def metric_table(store, since=None, until=None):
+    """Pivot the store's indexed metric rows into arrays: one row per audit, oldest first"""
+    rows = store.get_metric_table(METRIC_KEYS + ("overall_score",), since=since, until=until)
+    if not rows:
+        return None
+    # Metrics an audit lacks come back as None, i.e. NaN
+    values = np.array([[row[key] for key in METRIC_KEYS + ("overall_score",)] for row in rows], dtype=float)
+    return {
+        "audit_id": np.array([row["audit_id"] for row in rows]),
+        "agent_name": np.array([row["agent_name"] for row in rows]),
+        "team": np.array([row["team"] for row in rows]),
+        "created_at": np.array([row["created_at"] for row in rows]),
+        "metrics": values[:, :len(METRIC_KEYS)],
+        "overall_score": values[:, len(METRIC_KEYS)],
+    }
+
+
+def rescore_history(store, weights, since=None, until=None):
+    """Re-score every stored audit in the window and rank each agent's latest audit.
+
+    Returns {"audits": table with old and new overall, "leaderboard": [...]}
+    with the leaderboard sorted by new score, or None when there are no audits.
+    """
+    table = metric_table(store, since, until)
+    if table is None:
+        return None
+    metrics, overall, lazy = rescore(table["metrics"], weights=weights)
+    table.update(new_metrics=metrics, new_overall=overall, lazy=lazy)
+
+    # Latest audit per agent (rows are in audit id order, so the last one wins)
+    agents, last = np.unique(table["agent_name"][::-1], return_index=True)
+    latest = len(table["audit_id"]) - 1 - last
+    old, new = table["overall_score"][latest], overall[latest]
+    teams = table["team"][latest]
+    old_rank, new_rank = rank_within(np.nan_to_num(old)), rank_within(new)
+    team_rank = rank_within(new, teams)
+    leaderboard = [{
+        "agent": str(agent), "team": str(team), "audit_id": int(audit_id),
+        "old_score": None if np.isnan(old_score) else float(old_score), "new_score": float(new_score),
+        "old_rank": int(rank_before), "rank": int(rank), "team_rank": int(rank_in_team),
+    } for agent, team, audit_id, old_score, new_score, rank_before, rank, rank_in_team in zip(
+        agents, teams, table["audit_id"][latest], old, new, old_rank, new_rank, team_rank)]
+    leaderboard.sort(key=lambda entry: (entry["rank"], entry["agent"]))
+    return {"audits": table, "leaderboard": leaderboard}
+
+
+def main(argv=None):
+    from audit_store import DEFAULT_STORE_URL, open_audit_store
+    import time
+
+    parser = argparse.ArgumentParser(description="Re-score stored audits with a different weight profile")
+    parser.add_argument("--store", default=DEFAULT_STORE_URL, help="Audit store URL, e.g. sqlite:///audit_store.db")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, help="Weight profile from --profiles")
+    parser.add_argument("--profiles", default=DEFAULT_WEIGHT_PROFILES_PATH, help="Weight profiles JSON file")
+    parser.add_argument("--since", help="Only audits created on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", help="Only audits created before this date (YYYY-MM-DD)")
+    parser.add_argument("--apply", action="store_true",
+                        help="Write the new overall scores back to the store (audits, metrics and weekly trends)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    try:
+        weights = load_weight_profiles(args.profiles)[args.profile]
+    except KeyError:
+        logger.error("Unknown weight profile %r", args.profile)
+        return 2
+    store = open_audit_store(args.store)
+    start = time.perf_counter()
+    result = rescore_history(store, weights, since=args.since, until=args.until)
+    if result is None:
+        logger.error("No audits in the selected period")
+        return 1
+    audits = result["audits"]
+    logger.info("Re-scored %d audits with profile %r in %.1f ms (%d flagged as lazily scored)",
+                len(audits["audit_id"]), args.profile, (time.perf_counter() - start) * 1000, int(audits["lazy"].sum()))
+
+    print(f"{'Rank':>4}  {'Was':>4}  {'Agent':<28} {'Team':<16} {'Old':>5} {'New':>5}")
+    for entry in result["leaderboard"]:
+        old_score = "-" if entry["old_score"] is None else f"{entry['old_score']:.1f}"
+        print(f"{entry['rank']:>4}  {entry['old_rank']:>4}  {entry['agent']:<28} {entry['team']:<16} "
+              f"{old_score:>5} {entry['new_score']:>5.1f}")
+
+    if args.apply:
+        changed = store.update_scores(
+            [(int(audit_id), {**dict(zip(METRIC_KEYS, map(float, row))), "overall_score": float(overall)})
+             for audit_id, row, overall in zip(audits["audit_id"], audits["new_metrics"], audits["new_overall"])
+             if not np.isnan(row).any()],
+            profile=args.profile,
+        )
+        logger.info("Updated %d stored audits", changed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
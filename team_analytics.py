@@ -0,0 +1,160 @@
+"""Cross-agent analytics: leaderboard, metric distributions and team comparison.
+
+Everything here reads aggregates the audit store maintains as each audit is
+saved - one snapshot per agent (its latest audit's metrics plus counts of
+example severities, PIN outcomes and chats) and weekly per-team fact totals -
+so no audit JSON is loaded and a leaderboard of hundreds of agents over many
+audit cycles renders in milliseconds. Percentiles and ranks are computed
+from the snapshots with numpy on read.
+
+Print the leaderboard and distributions from the command line:
+    python team_analytics.py --store sqlite:///audit_store.db --team Support
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from audit_store import SEVERITY_LEVELS
+from scoring import METRIC_KEYS, rank_within
+
+# --- CONFIGURATION ---
+PERCENTILES = (10, 25, 50, 75, 90)
+# Overall score first, as in the reports
+ANALYTICS_METRICS = ("overall_score",) + METRIC_KEYS
+
+
+def pin_compliance(facts):
+    """Share of PIN-relevant examples handled correctly (N/A excluded); None when there were none"""
+    relevant = facts.get("pin_yes", 0) + facts.get("pin_no", 0) + facts.get("pin_redundant", 0)
+    return facts.get("pin_yes", 0) / relevant if relevant else None
+
+
+def _metric_matrix(snapshots, metrics=ANALYTICS_METRICS):
+    """(agents x metrics) array of snapshot values, NaN where an audit lacks a metric"""
+    return np.array([[snapshot["metrics"].get(metric, np.nan) for metric in metrics] for snapshot in snapshots],
+                    dtype=float).reshape(len(snapshots), len(metrics))
+
+
+def metric_distributions(snapshots, metrics=ANALYTICS_METRICS):
+    """{metric: {"agents", "mean", "min", "p10" ... "p90", "max"}} over the agents' latest audits"""
+    values = _metric_matrix(snapshots, metrics)
+    distributions = {}
+    for column, metric in enumerate(metrics):
+        present = values[:, column][~np.isnan(values[:, column])]
+        if not len(present):
+            continue
+        quantiles = np.percentile(present, PERCENTILES)
+        distributions[metric] = {
+            "agents": int(len(present)), "mean": float(present.mean()), "min": float(present.min()),
+            **{f"p{pct}": float(value) for pct, value in zip(PERCENTILES, quantiles)},
+            "max": float(present.max()),
+        }
+    return distributions
+
+
+def leaderboard(snapshots, metric="overall_score"):
+    """Agents ranked by a metric of their latest audit, with team rank, percentile and audit facts.
+
+    Agents without the metric are ranked last. Returns a list of dicts sorted by rank.
+    """
+    if not snapshots:
+        return []
+    scores = _metric_matrix(snapshots, (metric,))[:, 0]
+    ranked = np.where(np.isnan(scores), -np.inf, scores)
+    teams = np.array([snapshot["team"] for snapshot in snapshots])
+    ranks, team_ranks = rank_within(ranked), rank_within(ranked, teams)
+    # Share of agents scoring strictly below, in percent
+    below = np.searchsorted(np.sort(ranked), ranked, side="left")
+    board = []
+    for snapshot, score, rank, team_rank, lower in zip(snapshots, scores, ranks, team_ranks, below):
+        facts = snapshot["facts"]
+        board.append({
+            "agent": snapshot["agent_name"], "team": snapshot["team"],
+            "score": None if np.isnan(score) else float(score),
+            "rank": int(rank), "team_rank": int(team_rank),
+            "percentile": round(100.0 * lower / len(snapshots), 1),
+            "chats": snapshot["total_chats"],
+            "critical": facts.get("severity_critical", 0), "major": facts.get("severity_major", 0),
+            "pin_compliance": pin_compliance(facts),
+            "audited_at": snapshot["created_at"], "audit_id": snapshot["audit_id"],
+        })
+    board.sort(key=lambda entry: (entry["rank"], entry["agent"]))
+    return board
+
+
+def severity_totals(snapshots):
+    """{severity: examples} over the agents' latest audits"""
+    return {severity: sum(snapshot["facts"].get(f"severity_{severity.lower()}", 0) for snapshot in snapshots)
+            for severity in SEVERITY_LEVELS}
+
+
+def team_overview(snapshots):
+    """One row per team: agents, chats, mean overall score, PIN compliance and critical examples"""
+    teams = {}
+    for snapshot in snapshots:
+        teams.setdefault(snapshot["team"], []).append(snapshot)
+    overview = []
+    for team, members in sorted(teams.items()):
+        facts = {}
+        for member in members:
+            for fact, value in member["facts"].items():
+                facts[fact] = facts.get(fact, 0) + value
+        scores = [member["metrics"]["overall_score"] for member in members if "overall_score" in member["metrics"]]
+        overview.append({
+            "team": team, "agents": len(members), "chats": sum(member["total_chats"] for member in members),
+            "mean_score": sum(scores) / len(scores) if scores else None,
+            "pin_compliance": pin_compliance(facts),
+            "critical": facts.get("severity_critical", 0), "examples": facts.get("examples", 0),
+        })
+    return overview
+
+
+def compare_agents(snapshots, agent_names, metrics=ANALYTICS_METRICS):
+    """{agent: {metric: value}} for side-by-side comparison, plus the distribution median as "Median" """
+    chosen = [snapshot for snapshot in snapshots if snapshot["agent_name"] in agent_names]
+    comparison = {snapshot["agent_name"]: {metric: snapshot["metrics"].get(metric) for metric in metrics}
+                  for snapshot in chosen}
+    comparison["Median"] = {metric: stats["p50"] for metric, stats in metric_distributions(snapshots, metrics).items()}
+    return comparison
+
+
+def weekly_team_facts(store, team=None, weeks=12):
+    """Weekly audits, chats, critical examples and PIN compliance for one team (or all), oldest first"""
+    return [{
+        "week_start": week["week_start"], "audits": week.get("audits", 0), "chats": week.get("chats", 0),
+        "critical": week.get("severity_critical", 0), "pin_compliance": pin_compliance(week),
+    } for week in store.get_team_facts(team=team, weeks=weeks)]
+
+
+def main(argv=None):
+    from audit_store import DEFAULT_STORE_URL, open_audit_store
+
+    parser = argparse.ArgumentParser(description="Team leaderboard and metric distributions from the audit store")
+    parser.add_argument("--store", default=DEFAULT_STORE_URL, help="Audit store URL, e.g. sqlite:///audit_store.db")
+    parser.add_argument("--team", help="Only agents in this team")
+    parser.add_argument("--metric", default="overall_score", choices=ANALYTICS_METRICS, help="Rank by this metric")
+    args = parser.parse_args(argv)
+
+    snapshots = open_audit_store(args.store).get_agent_snapshots(args.team)
+    if not snapshots:
+        print("No audited agents")
+        return 1
+
+    print(f"{'Rank':>4} {'Team#':>5}  {'Agent':<28} {'Team':<16} {'Score':>5} {'Pctl':>5} {'Chats':>6} "
+          f"{'Crit':>4} {'PIN':>5}")
+    for entry in leaderboard(snapshots, args.metric):
+        score = "-" if entry["score"] is None else f"{entry['score']:.1f}"
+        pin = "-" if entry["pin_compliance"] is None else f"{entry['pin_compliance']:.0%}"
+        print(f"{entry['rank']:>4} {entry['team_rank']:>5}  {entry['agent']:<28} {entry['team']:<16} {score:>5} "
+              f"{entry['percentile']:>5.1f} {entry['chats']:>6} {entry['critical']:>4} {pin:>5}")
+
+    print(f"\n{'Metric':<32} {'Mean':>5} " + " ".join(f"{f'p{pct}':>5}" for pct in PERCENTILES))
+    for metric, stats in metric_distributions(snapshots).items():
+        print(f"{metric:<32} {stats['mean']:>5.2f} " + " ".join(f"{stats[f'p{pct}']:>5.2f}" for pct in PERCENTILES))
+    print("\nSeverity: " + ", ".join(f"{severity} {count}" for severity, count in severity_totals(snapshots).items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
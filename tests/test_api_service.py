@@ -0,0 +1,42 @@
+"""API jobs end in a final state even when the export cannot be read."""
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+import api_service
+from benchmarks.synthetic_export import generate_export
+from model_backends import FakeGeminiBackend
+
+
+def wait_for(client, job_id):
+    for _ in range(100):
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.05)
+    pytest.fail(f"job still {job['status']}")
+
+
+def test_job_completes(tmp_path):
+    with TestClient(api_service.create_app(FakeGeminiBackend(), workdir=str(tmp_path))) as client:
+        job = client.post("/jobs?agents=Agent 001&agents=Nobody", content=generate_export(1, 5)).json()
+        job = wait_for(client, job["job_id"])
+    assert (job["status"], job["error"]) == ("completed", None)
+    assert {name: state["status"] for name, state in job["agents"].items()} == {
+        "Agent 001": "success", "Nobody": "no_chats"}
+
+
+def test_unreadable_export_fails_the_job(tmp_path):
+    with TestClient(api_service.create_app(FakeGeminiBackend(), workdir=str(tmp_path))) as client:
+        job = client.post("/jobs?agents=Agent 001", content=b"not a zip").json()
+        job = wait_for(client, job["job_id"])
+    assert job["status"] == "failed" and job["error"] and job["finished_at"]
+    assert job["agents"]["Agent 001"]["status"] == "failed"
+
+
+def test_submit_without_a_model_is_unavailable(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_service, "model_from_environment", lambda: None)
+    with TestClient(api_service.create_app(workdir=str(tmp_path))) as client:
+        response = client.post("/jobs?agents=Agent 001", content=generate_export(1, 1))
+    assert response.status_code == 503
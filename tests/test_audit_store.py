@@ -0,0 +1,17 @@
+"""Agent locks outlive their lease only while a heartbeat renews them."""
+import time
+
+from audit_store import AgentLockHeartbeat, open_audit_store
+
+LEASE = 0.3
+
+
+def test_heartbeat_keeps_the_lock_past_its_lease(tmp_path):
+    store = open_audit_store(f"sqlite:///{tmp_path / 'audit_store.db'}")
+    assert store.acquire_agent_lock("Alice", "key", "first", LEASE)
+    with AgentLockHeartbeat(store, "Alice", "first", LEASE) as heartbeat:
+        time.sleep(3 * LEASE)
+        assert not store.acquire_agent_lock("Alice", "key", "second", LEASE)
+    assert not heartbeat.lost
+    time.sleep(1.5 * LEASE)
+    assert store.acquire_agent_lock("Alice", "key", "second", LEASE)
@@ -0,0 +1,53 @@
+"""New-chats-only runs skip what a saved audit covered, and search filters on real time."""
+import io
+
+import pytest
+
+from benchmarks.synthetic_export import generate_export
+from chat_index import ChatIndex
+from extraction import get_agent_transcripts
+
+AGENT = "Agent 001"
+
+
+@pytest.fixture
+def index(tmp_path):
+    return ChatIndex(str(tmp_path / "chat_index.db"))
+
+
+@pytest.fixture(scope="module")
+def export():
+    return generate_export(1, 6)
+
+
+def new_chats(export, index):
+    return get_agent_transcripts(io.BytesIO(export), AGENT, skip_chats=index.audited_chats(AGENT))
+
+
+def test_indexed_chats_are_not_audited_until_marked(export, index):
+    transcripts, metadata = new_chats(export, index)
+    index.add_chats(AGENT, transcripts, metadata)
+    # The audit failed: every chat is still new
+    assert len(new_chats(export, index)[0]) == len(transcripts) == 6
+    index.mark_audited(AGENT, transcripts[:4], metadata[:4])
+    assert len(new_chats(export, index)[0]) == 2
+
+
+def test_older_indexes_count_stored_chats_as_audited(export, index, tmp_path):
+    transcripts, metadata = new_chats(export, index)
+    index.add_chats(AGENT, transcripts, metadata)
+    conn = index._connect()
+    conn.execute("DROP TABLE audited_chats")
+    assert new_chats(export, ChatIndex(index.path))[0] == []
+
+
+def test_search_dates_compare_in_utc(index):
+    chat = ("[2024-03-01T23:30:00-02:00] Visitor: my invoice is wrong\n"
+            "[1709251200] Agent 001: checking the invoice now\n"
+            "[soon] Visitor: invoice thanks\n")
+    index.add_chats(AGENT, [chat], [{"chat_id": "c1", "started_at": "2024-02-29T22:00:00Z", "message_count": 3}])
+    hits = {hit["sent_at"] for hit in index.search("invoice")}
+    # Offset and epoch times become UTC; the unreadable one takes the chat's start
+    assert hits == {"2024-03-02T01:30:00", "2024-03-01T00:00:00", "2024-02-29T22:00:00"}
+    assert [hit["sender"] for hit in index.search("invoice", since="2024-03-02")] == ["Visitor"]
+    assert len(index.search("invoice", until="2024-03-01")) == 1
@@ -0,0 +1,59 @@
+"""Chat decoding accepts the loose message fields found in real tawk.to exports."""
+import importlib
+import json
+import sys
+
+import pytest
+
+import chat_schema
+from chat_schema import ChatDecodeError, decode_chat
+from extraction import MISSING_CHAT_IDS, format_transcript
+
+
+def test_numeric_and_null_message_fields_become_strings():
+    raw = json.dumps({"id": 7, "started": "2024-03-01T10:00:00", "messages": [
+        {"sender": {"n": "Alice"}, "msg": 42, "t": 1709287200},
+        {"sender": {"n": "Visitor"}, "msg": None, "t": None},
+        {"sender": {"n": "Alice"}, "msg": 1.5, "t": "2024-03-01T10:01:00"},
+    ]}).encode()
+    # Same text as the original f-string formatting of the raw values
+    assert format_transcript(decode_chat(raw)) == (
+        "[1709287200] Alice: 42\n[None] Visitor: None\n[2024-03-01T10:01:00] Alice: 1.5\n")
+
+
+def test_wrong_shape_is_still_rejected():
+    with pytest.raises(ChatDecodeError) as error:
+        decode_chat(json.dumps({"messages": [{"msg": {"text": "hi"}}]}).encode())
+    assert error.value.reason == "schema"
+
+
+@pytest.fixture(params=["msgspec", "stdlib"])
+def decode(request, monkeypatch):
+    if request.param == "msgspec":
+        yield decode_chat
+        return
+    # Reload without msgspec to get the stdlib decoder, then restore the module for other tests
+    monkeypatch.setitem(sys.modules, "msgspec", None)
+    stdlib = importlib.reload(chat_schema)
+    yield stdlib.decode_chat
+    monkeypatch.undo()
+    importlib.reload(chat_schema)
+
+
+@pytest.mark.parametrize("chat_id,started,expected_id,expected_started", [
+    (None, None, None, ""),
+    (12.0, 1709287200, 12.0, "1709287200"),
+    ("abc", 1.5, "abc", "1.5"),
+])
+def test_null_and_numeric_chat_fields(decode, chat_id, started, expected_id, expected_started):
+    chat = decode(json.dumps({"id": chat_id, "started": started, "messages": [
+        {"sender": {"n": None}, "msg": "hi", "t": "10:00"},
+        {"sender": {"n": 7}, "msg": "hello", "t": "10:01"},
+    ]}).encode())
+    assert (chat.id, chat.started) == (expected_id, expected_started)
+    # A null sender name is a visitor, like a missing one
+    assert [message.sender.n for message in chat.messages] == ["Visitor", "7"]
+
+
+def test_null_chat_id_counts_as_missing(decode):
+    assert decode(json.dumps({"id": None, "messages": []}).encode()).id in MISSING_CHAT_IDS
@@ -0,0 +1,23 @@
+"""The CLI's exit status matches its documented meaning."""
+import pytest
+
+from benchmarks.synthetic_export import generate_export
+from cli import EXIT_OK, EXIT_PARTIAL, main
+
+
+@pytest.fixture
+def export(tmp_path):
+    path = tmp_path / "export.zip"
+    path.write_bytes(generate_export(1, 5))
+    return str(path)
+
+
+@pytest.mark.parametrize("agents,expected", [
+    (["Agent 001"], EXIT_OK),
+    (["Agent 001", "Nobody"], EXIT_PARTIAL),
+    # Nothing to audit is not a failed run
+    (["Nobody"], EXIT_PARTIAL),
+])
+def test_exit_status(export, tmp_path, agents, expected):
+    argv = [export, "--agents", *agents, "--backend", "fake", "--formats", "json", "--output-dir", str(tmp_path)]
+    assert main(argv) == expected
@@ -0,0 +1,64 @@
+"""Chats repeated across overlapping exports are extracted once, at their latest version."""
+import io
+import json
+import zipfile
+
+import pytest
+
+from extraction import chat_key, extract_all_agents, get_agent_transcripts
+
+AGENT = "Alice Smith"
+
+
+def make_chat(chat_id, message_count):
+    messages = [{"sender": {"n": AGENT if i % 2 else "Visitor"}, "msg": f"message {i}",
+                 "t": f"2024-03-01T10:{i:02d}:00"} for i in range(message_count)]
+    return {"id": chat_id, "started": "2024-03-01T10:00:00", "messages": messages}
+
+
+def zip_bytes(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        for name, data in members:
+            z.writestr(name, data)
+    return buffer.getvalue()
+
+
+def overlapping_exports(*exports):
+    """One upload holding several monthly exports as nested ZIPs, in order"""
+    return io.BytesIO(zip_bytes(
+        (f"export_{month}.zip", zip_bytes((f"{chat['id']}.json", json.dumps(chat)) for chat in chats))
+        for month, chats in enumerate(exports, 1)
+    ))
+
+
+def audited(transcripts, metadata):
+    return {(chat_key(m["chat_id"], t), m["fingerprint"]) for t, m in zip(transcripts, metadata)}
+
+
+@pytest.mark.parametrize("grown_first", [False, True])
+def test_grown_copy_replaces_shorter_one(grown_first):
+    exports = [[make_chat("c1", 5)], [make_chat("c1", 8)]]
+    upload = overlapping_exports(*(reversed(exports) if grown_first else exports))
+    transcripts, metadata = get_agent_transcripts(upload, AGENT)
+    assert [m["message_count"] for m in metadata] == [8]
+
+
+@pytest.mark.parametrize("grown_first", [False, True])
+def test_audited_grown_copy_drops_stale_shorter_copy(grown_first):
+    exports = [[make_chat("c1", 5), make_chat("c2", 6)], [make_chat("c1", 8)]]
+    upload = overlapping_exports(*(reversed(exports) if grown_first else exports))
+    # Only the grown copy of c1 was audited before
+    grown = get_agent_transcripts(overlapping_exports([make_chat("c1", 8)]), AGENT)
+    transcripts, metadata = get_agent_transcripts(upload, AGENT, skip_chats=audited(*grown))
+    assert [m["chat_id"] for m in metadata] == ["c2"]
+
+    upload.seek(0)
+    assert extract_all_agents(upload).select(AGENT, skip_chats=audited(*grown)) == (transcripts, metadata)
+
+
+def test_audited_shorter_copy_still_yields_grown_copy():
+    upload = overlapping_exports([make_chat("c1", 5)], [make_chat("c1", 8)])
+    shorter = get_agent_transcripts(overlapping_exports([make_chat("c1", 5)]), AGENT)
+    transcripts, metadata = get_agent_transcripts(upload, AGENT, skip_chats=audited(*shorter))
+    assert [m["message_count"] for m in metadata] == [8]
@@ -0,0 +1,24 @@
+"""PDF reports render agent names that contain markup characters."""
+import pytest
+
+from model_backends import make_fake_audit
+from reports import generate_pdf_report, generate_team_pdf_report
+
+NAME = "Sales <b> & Co"
+
+
+@pytest.fixture
+def agent_data():
+    return {"name": NAME, "audit_data": make_fake_audit("Agent", num_examples=2), "total_chats": 3}
+
+
+def test_single_pdf_escapes_the_agent_name(agent_data, tmp_path):
+    path = tmp_path / "review.pdf"
+    generate_pdf_report(agent_data, NAME, str(path))
+    assert path.read_bytes().startswith(b"%PDF")
+
+
+def test_team_pdf_escapes_the_agent_name(agent_data, tmp_path):
+    path = tmp_path / "team.pdf"
+    generate_team_pdf_report([(NAME, agent_data)], str(path))
+    assert path.read_bytes().startswith(b"%PDF")
@@ -0,0 +1,95 @@
+"""Budget estimates match what each model call reserves, and refused calls defer the agent."""
+import io
+
+import pytest
+
+from audit_engine import run_adaptive_audit, run_comprehensive_audit, run_tiered_audit
+from benchmarks.synthetic_export import generate_export
+from chat_index import chat_keys
+from cli import audit_agent
+from extraction import get_agent_transcripts
+from model_backends import FakeGeminiBackend
+from scheduler import (
+    CHARS_PER_TOKEN,
+    FULL_AUDIT_OUTPUT_TOKENS,
+    AuditCost,
+    Budget,
+    BudgetExhausted,
+    MeteredBackend,
+    estimate_cost,
+    plan_audits,
+    refused_calls,
+)
+
+AGENT = "Agent 001"
+
+
+@pytest.fixture(scope="module")
+def chats():
+    transcripts, metadata = get_agent_transcripts(io.BytesIO(generate_export(1, 40)), AGENT)
+    return transcripts, metadata
+
+
+class RecordingBackend(FakeGeminiBackend):
+    def __init__(self):
+        super().__init__()
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        return super().generate_content(prompt)
+
+
+def reserved(prompts):
+    return sum((AuditCost(1, len(p) // CHARS_PER_TOKEN, FULL_AUDIT_OUTPUT_TOKENS) for p in prompts),
+               AuditCost(0, 0, 0))
+
+
+def test_estimate_is_what_the_audit_reserves(chats):
+    transcripts, metadata = chats
+    chat_ids = chat_keys(transcripts, metadata)
+    model = RecordingBackend()
+    assert run_comprehensive_audit(transcripts, AGENT, model, chat_ids=chat_ids)
+    assert estimate_cost(transcripts, AGENT, chat_ids=chat_ids) == reserved(model.prompts)
+
+
+@pytest.mark.parametrize("adaptive,tiered", [(True, False), (False, True), (True, True)])
+def test_estimate_covers_adaptive_and_tiered_audits(chats, adaptive, tiered):
+    transcripts, metadata = chats
+    chat_ids = chat_keys(transcripts, metadata)
+    model = RecordingBackend()
+    full_audit = run_adaptive_audit if adaptive else run_comprehensive_audit
+    if tiered:
+        run_tiered_audit(transcripts, AGENT, model, chat_ids=chat_ids, escalation_model=model, full_audit=full_audit)
+    else:
+        full_audit(transcripts, AGENT, model, chat_ids=chat_ids)
+    estimate, used = estimate_cost(transcripts, AGENT, adaptive, tiered, chat_ids), reserved(model.prompts)
+    assert used.requests <= estimate.requests and used.tokens <= estimate.tokens
+
+
+def test_budget_refuses_a_call_that_does_not_fit():
+    budget = Budget(requests=5, tokens=FULL_AUDIT_OUTPUT_TOKENS + 100)
+    model = MeteredBackend(FakeGeminiBackend(), budget)
+    model.generate_content("x" * 400)
+    before = refused_calls()
+    with pytest.raises(BudgetExhausted):
+        model.generate_content("x" * 400)
+    assert refused_calls() == before + 1
+    # The first call settled to its real usage, far below the reserved cap
+    assert budget.spent.requests == 1 and budget.spent.tokens < FULL_AUDIT_OUTPUT_TOKENS
+
+
+def test_token_refusal_defers_the_agent(chats):
+    budget = Budget(tokens=FULL_AUDIT_OUTPUT_TOKENS)
+    row = audit_agent("export.zip", AGENT, MeteredBackend(FakeGeminiBackend(), budget), extracted=chats)
+    assert row["status"] == "deferred"
+    row = audit_agent("export.zip", AGENT, MeteredBackend(FakeGeminiBackend(), Budget()), extracted=chats)
+    assert row["status"] == "success"
+
+
+def test_plan_fills_the_budget_in_priority_order():
+    costs = {"big": AuditCost(1, 900, 0), "small": AuditCost(1, 100, 0), "mid": AuditCost(1, 500, 0)}
+    priorities = {"big": (0.9, []), "mid": (0.5, []), "small": (0.1, [])}
+    scheduled, deferred = plan_audits(costs, priorities, Budget(tokens=1000))
+    assert [entry["agent"] for entry in scheduled] == ["big", "small"]
+    assert [entry["agent"] for entry in deferred] == ["mid"]
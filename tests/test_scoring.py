@@ -0,0 +1,51 @@
+"""Offline re-scoring reproduces the live rules, and ranks follow competition ranking."""
+import random
+
+import numpy as np
+import pytest
+
+from audit_engine import postprocess_audit_scores
+from scoring import CONSISTENCY_TOLERANCE, METRIC_KEYS, load_weight_profiles, rank_within, rescore
+
+PROFILES = load_weight_profiles()
+
+
+def random_audits(count, seed=0):
+    rng = random.Random(seed)
+    choices = [5.0, 5.0, 5.0, 4.5, 3.0, 2.5, 6.0, 0.0]
+    audits = []
+    for _ in range(count):
+        metrics = {key: rng.choice(choices) if rng.random() < 0.7 else round(rng.uniform(0, 5), 1)
+                   for key in METRIC_KEYS}
+        audits.append({"metrics": metrics, "overall_score": round(rng.uniform(0, 11), 1)})
+    # The lazy patterns: four and five perfect scores
+    audits.append({"metrics": dict(zip(METRIC_KEYS, [5.0, 5.0, 3.5, 5.0, 5.0])), "overall_score": 9.6})
+    audits.append({"metrics": dict.fromkeys(METRIC_KEYS, 5.0), "overall_score": 10.0})
+    return audits
+
+
+@pytest.mark.parametrize("profile", sorted(PROFILES))
+def test_rescore_matches_the_live_rules(profile):
+    weights = PROFILES[profile]
+    audits = random_audits(300)
+    matrix = [[audit["metrics"][key] for key in METRIC_KEYS] for audit in audits]
+    overall_in = [audit["overall_score"] for audit in audits]
+    metrics, overall, _ = rescore(matrix, overall_in, weights, tolerance=CONSISTENCY_TOLERANCE)
+    for i, audit in enumerate(audits):
+        live = postprocess_audit_scores({"metrics": dict(audit["metrics"]),
+                                         "overall_score": audit["overall_score"]}, weights=weights)
+        assert [live["metrics"][key] for key in METRIC_KEYS] == metrics[i].tolist()
+        assert live["overall_score"] == overall[i]
+
+
+def test_rank_within_shares_ranks_between_ties():
+    assert rank_within([7.0, 9.0, 7.0, 5.0]).tolist() == [2, 1, 2, 4]
+
+
+def test_rank_within_ranks_each_group_separately():
+    scores = np.array([6.0, 8.0, 8.0, 9.0, 4.0, 9.0])
+    teams = np.array(["b", "a", "b", "a", "b", "a"])
+    assert rank_within(scores, teams).tolist() == [2, 3, 1, 1, 3, 1]
+    # Independent of input order
+    order = np.array([5, 2, 0, 4, 1, 3])
+    assert rank_within(scores[order], teams[order]).tolist() == rank_within(scores, teams)[order].tolist()
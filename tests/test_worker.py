@@ -0,0 +1,59 @@
+"""Workers stop at the daily token budget, and expired leases are taken over."""
+import time
+
+import pytest
+
+from audit_store import open_audit_store
+from benchmarks.synthetic_export import generate_export
+from model_backends import FakeGeminiBackend
+from scheduler import FULL_AUDIT_OUTPUT_TOKENS, MeteredBackend, ledger_recorder, quota_day
+from worker import AuditWorker, create_models
+
+OPTIONS = {"since": None, "until": None, "adaptive": False, "tiered": False, "new_only": False}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return open_audit_store(f"sqlite:///{tmp_path / 'audit_store.db'}")
+
+
+@pytest.fixture
+def export(tmp_path):
+    path = tmp_path / "export.zip"
+    path.write_bytes(generate_export(2, 10))
+    return str(path)
+
+
+def test_expired_lease_is_taken_over(store):
+    store.enqueue_work("batch", [("Agent 001", "export.zip", OPTIONS, 1.0)])
+    first = store.claim_work("worker-a", lease_seconds=0.05)
+    assert store.claim_work("worker-b") is None
+    time.sleep(0.1)
+    second = store.claim_work("worker-b")
+    assert (second["id"], second["stolen_from"], second["attempts"]) == (first["id"], "worker-a", 2)
+    # Only the worker holding the lease can finish the item
+    assert not store.renew_work_lease(first["id"], "worker-a")
+    assert not store.complete_work(first["id"], "worker-a", "done")
+    assert store.complete_work(second["id"], "worker-b", "done")
+    assert [item["status"] for item in store.list_work("batch")] == ["done"]
+
+
+def test_worker_stops_when_daily_tokens_are_spent(store, export):
+    store.enqueue_work("batch", [(name, export, OPTIONS, 1.0) for name in ("Agent 001", "Agent 002")])
+    store.record_usage(quota_day(), 1, 1000, 0)
+    model, _ = create_models("fake", store=store)
+    worker = AuditWorker(store, model, daily_tokens=1000)
+    assert worker.run(exit_when_idle=True) == 0
+    assert {item["status"] for item in store.list_work("batch")} == {"pending"}
+
+
+def test_refused_audit_is_left_queued(store, export):
+    store.enqueue_work("batch", [(name, export, OPTIONS, 1.0) for name in ("Agent 001", "Agent 002")])
+    model = MeteredBackend(FakeGeminiBackend(), on_usage=ledger_recorder(store))
+    # Some tokens left, but fewer than one call reserves
+    worker = AuditWorker(store, model, daily_tokens=FULL_AUDIT_OUTPUT_TOKENS)
+    assert worker.run(exit_when_idle=True) == 1
+    items = store.list_work("batch")
+    assert [item["status"] for item in items] == ["pending", "pending"]
+    assert any(item["error"] and item["error"].startswith("deferred") for item in items)
+    assert model.budget.remaining()[1] == FULL_AUDIT_OUTPUT_TOKENS
@@ -0,0 +1,327 @@
+"""Audit workers that share a queue of per-agent work items in the audit store.
+
+A bulk audit is enqueued as one work item per agent (export path, options and
+priority) in the shared store. Any number of worker processes, on any number
+of hosts that see the same store and export (e.g. SQLite and the ZIP on a
+shared volume), claim items one at a time under a time-limited lease. While
+an audit runs, a heartbeat thread extends both the item lease and the store's
+agent lock. A worker that dies stops heartbeating, so once its lease expires
+another worker takes the item over (up to MAX_WORK_ATTEMPTS claims).
+
+Results are written idempotently: the audit itself goes through
+run_deduplicated, keyed by agent and chats, so a taken-over item reuses an
+audit its first worker already saved. Only the worker still holding the lease
+can mark an item done.
+
+Usage:
+    python worker.py enqueue /shared/All_Agents.zip --store sqlite:////shared/audit_store.db --batch q3-all-hands
+    python worker.py run --store sqlite:////shared/audit_store.db --processes 4
+    python worker.py status --store sqlite:////shared/audit_store.db --batch q3-all-hands
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import date, datetime
+
+from audit_store import DEFAULT_STORE_URL, DEFAULT_WORK_LEASE_SECONDS, MAX_WORK_ATTEMPTS, open_audit_store
+from chat_index import ChatIndex
+from cli import audit_agent
+from extraction import get_agent_transcripts, get_all_agents_from_zip
+from model_backends import create_backend
+from scheduler import (
+    DAILY_REQUEST_BUDGET,
+    DAILY_TOKEN_BUDGET,
+    Budget,
+    MeteredBackend,
+    audit_priorities,
+    ledger_recorder,
+)
+
+logger = logging.getLogger("auditor.worker")
+
+# --- CONFIGURATION ---
+# Idle workers check the queue this often
+DEFAULT_POLL_INTERVAL = 5.0
+# Heartbeats per lease period, so a couple of slow store writes do not lose the lease
+HEARTBEATS_PER_LEASE = 3
+
+
+def new_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class _Heartbeat:
+    """Background thread that keeps a work item's lease (and the agent lock) alive"""
+
+    def __init__(self, store, item, worker_id, lock_owner, lease_seconds):
+        self.store = store
+        self.item = item
+        self.worker_id = worker_id
+        self.lock_owner = lock_owner
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"heartbeat-{item['id']}", daemon=True)
+
+    def _beat(self):
+        while not self._stop.wait(self.lease_seconds / HEARTBEATS_PER_LEASE):
+            try:
+                if not self.store.renew_work_lease(self.item["id"], self.worker_id, self.lease_seconds):
+                    self.lost = True
+                    logger.warning("Lost the lease on %s (item %d) to another worker", self.item["agent_name"],
+                                   self.item["id"])
+                    return
+                self.store.renew_agent_lock(self.item["agent_name"], self.lock_owner, self.lease_seconds)
+            except Exception:
+                # A missed beat is retried; the lease only lapses after several
+                logger.exception("Heartbeat failed for item %d", self.item["id"])
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+class AuditWorker:
+    """Claims work items from the store and audits them one at a time"""
+
+    def __init__(self, store, model, escalation_model=None, chat_index=None, worker_id=None,
+                 lease_seconds=DEFAULT_WORK_LEASE_SECONDS, daily_requests=0, daily_tokens=0):
+        self.store = store
+        self.model = model
+        self.escalation_model = escalation_model or model
+        self.chat_index = chat_index
+        self.worker_id = worker_id or new_worker_id()
+        self.lease_seconds = lease_seconds
+        self.daily_requests = daily_requests
+        self.daily_tokens = daily_tokens
+        self.budget_refused = False
+
+    def _quota_left(self):
+        """Re-read today's window from the ledger (other workers spend it too) into the metered models"""
+        if self.budget_refused:
+            return False
+        if not (self.daily_requests or self.daily_tokens):
+            return True
+        budget = Budget.for_window(self.store, self.daily_requests, self.daily_tokens)
+        for model in (self.model, self.escalation_model):
+            if isinstance(model, MeteredBackend):
+                model.budget = budget
+        requests, tokens = budget.remaining()
+        return (requests is None or requests > 0) and (tokens is None or tokens > 0)
+
+    def _queue_drained(self, batch_id=None):
+        return not any(item["status"] in ("pending", "leased") for item in self.store.list_work(batch_id))
+
+    def run(self, exit_when_idle=False, poll_interval=DEFAULT_POLL_INTERVAL, max_items=None, batch_id=None):
+        """Process items until the queue is drained (exit_when_idle), max_items are done or the daily quota is spent.
+
+        Returns the number of items processed.
+        """
+        processed = 0
+        while max_items is None or processed < max_items:
+            if not self._quota_left():
+                logger.warning("Daily model quota used up; %s stops claiming work", self.worker_id)
+                break
+            item = self.store.claim_work(self.worker_id, self.lease_seconds)
+            if item is None:
+                # Stay while other workers hold leases: if one dies, its item is taken over here
+                if exit_when_idle and self._queue_drained(batch_id):
+                    break
+                time.sleep(poll_interval)
+                continue
+            self.process(item)
+            processed += 1
+        return processed
+
+    def process(self, item):
+        """Audit one claimed item and record the outcome; returns the final item status"""
+        agent_name, options = item["agent_name"], item["options"]
+        if item.get("stolen_from"):
+            logger.info("Taking over %s (item %d) from %s, attempt %d", agent_name, item["id"], item["stolen_from"],
+                        item["attempts"])
+        lock_owner = f"{self.worker_id}#{item['id']}"
+        start = time.perf_counter()
+        with _Heartbeat(self.store, item, self.worker_id, lock_owner, self.lease_seconds) as heartbeat:
+            try:
+                skip_chats = None
+                if options.get("new_only") and self.chat_index is not None:
+                    skip_chats = self.chat_index.audited_chats(agent_name)
+                extracted = get_agent_transcripts(item["export_path"], agent_name, on_warning=logger.warning,
+                                                  since=options.get("since"), until=options.get("until"),
+                                                  skip_chats=skip_chats)
+            except Exception as e:
+                logger.exception("Could not read %s for %s", item["export_path"], agent_name)
+                row = {"status": f"error: {e}"}
+            else:
+                row = audit_agent(item["export_path"], agent_name, self.model, self.store, self.chat_index,
+                                  extracted, options.get("adaptive", False), options.get("tiered", False),
+                                  self.escalation_model, lock_owner=lock_owner, lease_seconds=self.lease_seconds)
+
+        if row["status"] == "success":
+            status, error = "done", None
+        elif row["status"] == "no_chats":
+            status, error = "done", "no chats"
+        elif row["status"] == "deferred":
+            # The window cannot cover this audit: leave it queued for the next one and stop claiming
+            self.budget_refused = True
+            status, error = "pending", "deferred: model budget used up"
+        else:
+            # Failed audits go back to the queue until their attempts run out
+            status = "pending" if item["attempts"] < MAX_WORK_ATTEMPTS else "failed"
+            error = row["status"]
+        if not self.store.complete_work(item["id"], self.worker_id, status, row.get("audit_id"), error):
+            # Another worker took the item over; its (deduplicated) result is the one recorded
+            logger.warning("%s (item %d) finished after its lease was taken over%s", agent_name, item["id"],
+                           "" if heartbeat.lost else " (no heartbeat got through)")
+            return "lost"
+        logger.info("%s: %s%s in %.1fs (item %d, attempt %d)", agent_name, status, f" ({error})" if error else "",
+                    time.perf_counter() - start, item["id"], item["attempts"])
+        return status
+
+
+# --- ENTRY POINTS ---
+def create_models(backend, escalation_model_name=None, store=None, budget=None):
+    """(model, escalation_model) for a worker, metered into the store's usage ledger and limited by budget"""
+    if backend == "gemini":
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            raise RuntimeError("GEMINI_API_KEY is not set (use --backend fake for a dry run)")
+        model = escalation_model = create_backend("gemini", api_key=api_key)
+        if escalation_model_name:
+            escalation_model = create_backend("gemini", api_key=api_key, model_name=escalation_model_name)
+    else:
+        model = escalation_model = create_backend("fake")
+    if store is None:
+        return model, escalation_model
+    on_usage = ledger_recorder(store)
+    metered = MeteredBackend(model, budget, on_usage)
+    return metered, metered if escalation_model is model else MeteredBackend(escalation_model, budget, on_usage)
+
+
+def run_worker_process(args):
+    """Entry point of one worker process (also used for --processes)"""
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    store = open_audit_store(args.store)
+    budget = Budget.for_window(store, args.daily_requests, args.daily_tokens)
+    model, escalation_model = create_models(args.backend, args.escalation_model, store, budget)
+    worker = AuditWorker(store, model, escalation_model, ChatIndex(args.chat_index) if args.chat_index else None,
+                         lease_seconds=args.lease_seconds, daily_requests=args.daily_requests,
+                         daily_tokens=args.daily_tokens)
+    logger.info("Worker %s started", worker.worker_id)
+    return worker.run(args.exit_when_idle, args.poll_interval, args.max_items, args.batch)
+
+
+def enqueue(args):
+    export_path = os.path.abspath(args.export)
+    if not os.path.isfile(export_path):
+        logger.error("Export not found: %s", export_path)
+        return 2
+    agents = args.agents or get_all_agents_from_zip(export_path, on_warning=logger.warning)
+    if not agents:
+        logger.error("No agents found in %s", export_path)
+        return 2
+
+    store = open_audit_store(args.store)
+    for name in agents:
+        store.upsert_agent(name)
+    options = {"since": args.since and args.since.isoformat(), "until": args.until and args.until.isoformat(),
+               "adaptive": args.adaptive, "tiered": args.tiered, "new_only": args.new_only}
+    # Overdue, low-scoring and previously deferred agents are claimed first
+    priorities = audit_priorities(agents, {}, store)
+    batch_id = args.batch or datetime.now().strftime("batch-%Y%m%d-%H%M%S")
+    added = store.enqueue_work(batch_id, [(name, export_path, options, priorities[name][0]) for name in agents])
+    logger.info("Queued %d agent(s) in batch %s (%d already queued)", added, batch_id, len(agents) - added)
+    return 0
+
+
+def status(args):
+    items = open_audit_store(args.store).list_work(args.batch)
+    counts = Counter(item["status"] for item in items)
+    print(", ".join(f"{state} {counts[state]}" for state in ("pending", "leased", "done", "failed")))
+    now = time.time()
+    for item in items:
+        if args.verbose or item["status"] in ("leased", "failed"):
+            lease = f"lease {item['lease_expires'] - now:+.0f}s" if item["status"] == "leased" else ""
+            print(f"{item['id']:>6}  {item['batch_id']:<24} {item['agent_name']:<28} {item['status']:<8} "
+                  f"attempts {item['attempts']}  {item['worker'] or '-':<32} {lease} {item['error'] or ''}")
+    return 0
+
+
+def run(args):
+    if args.processes <= 1:
+        run_worker_process(args)
+        return 0
+    processes = [multiprocessing.Process(target=run_worker_process, args=(args,), name=f"worker-{i}")
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return 0 if all(process.exitcode == 0 for process in processes) else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Distribute agent audits over worker processes via the audit store")
+    parser.add_argument("--store", default=DEFAULT_STORE_URL,
+                        help="Shared audit store URL, e.g. sqlite:////shared/audit_store.db")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    queue = commands.add_parser("enqueue", help="Queue one work item per agent in an export")
+    queue.add_argument("export", help="tawk.to export ZIP on storage every worker can read")
+    queue.add_argument("--agents", nargs="+", help="Only these agents (default: every detected agent)")
+    queue.add_argument("--batch", help="Batch name; re-queuing an agent already in the batch is a no-op")
+    queue.add_argument("--since", type=date.fromisoformat, help="Only chats started on or after (YYYY-MM-DD)")
+    queue.add_argument("--until", type=date.fromisoformat, help="Only chats started before (YYYY-MM-DD)")
+    queue.add_argument("--adaptive", action="store_true", help="Audit in rounds until the scores converge")
+    queue.add_argument("--tiered", action="store_true", help="Triage first; full audit only when needed")
+    queue.add_argument("--new-only", action="store_true", help="Skip chats already in the workers' --chat-index")
+    queue.set_defaults(handler=enqueue)
+
+    work = commands.add_parser("run", help="Claim and audit queued agents")
+    work.add_argument("--processes", type=int, default=1, help="Worker processes to start on this host")
+    work.add_argument("--backend", default=os.environ.get("MODEL_BACKEND", "gemini"), choices=["gemini", "fake"])
+    work.add_argument("--escalation-model", default=os.environ.get("ESCALATION_GEMINI_MODEL"),
+                      help="Gemini model for agents escalated past triage")
+    work.add_argument("--chat-index", default=os.environ.get("CHAT_INDEX_PATH"), help="Chat evidence index path")
+    work.add_argument("--lease-seconds", type=float, default=DEFAULT_WORK_LEASE_SECONDS,
+                      help="Lease per item; a worker silent for this long loses its item to another worker")
+    work.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL)
+    work.add_argument("--exit-when-idle", action="store_true",
+                      help="Stop once no item is pending or leased, instead of waiting for new batches")
+    work.add_argument("--max-items", type=int, help="Stop after this many items")
+    work.add_argument("--batch", help="With --exit-when-idle, only wait for this batch to drain")
+    work.add_argument("--daily-requests", type=int, default=DAILY_REQUEST_BUDGET,
+                      help="Stop claiming once the store's ledger shows this many requests today (0 = unlimited)")
+    work.add_argument("--daily-tokens", type=int, default=DAILY_TOKEN_BUDGET,
+                      help="Stop claiming once the store's ledger shows this many tokens today (0 = unlimited)")
+    work.set_defaults(handler=run)
+
+    report = commands.add_parser("status", help="Show queue progress")
+    report.add_argument("--batch", help="Only this batch")
+    report.set_defaults(handler=status)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())